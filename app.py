@@ -4,9 +4,9 @@ import hashlib
 import hmac
 import logging
 import os
-from threading import Thread
 
-from flask import Flask, jsonify, request
+from services import registry  # first import: its clock is the startup reference
+from flask import Flask, Response, jsonify, request
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
@@ -15,6 +15,12 @@ from services.firebase import FirebaseService
 from services.ai import ConversationalAI
 from services.serpapi import SerpAPIService
 from services.travel import TravelAssistant
+from services.executor import KeyedExecutor
+from services.dedup import DedupStore, FirestoreDedupBackend, MemoryDedupBackend
+from services.history import FirestoreHistoryBackend, MemoryHistoryBackend
+from services.jobqueue import SqliteJobQueue
+from services.slack_stream import SlackStreamer
+from services import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,13 +33,30 @@ if not slack_token:
 client = WebClient(token=slack_token)
 
 BOT_USER_ID = os.environ.get("BOT_USER_ID")
-if not BOT_USER_ID:
+
+
+def _fetch_bot_user_id() -> str:
+    user_id = client.auth_test().get("user_id")
+    if not user_id:
+        raise RuntimeError("auth_test returned no user_id")
+    return user_id
+
+
+# Without BOT_USER_ID, auth_test runs during warm-up or on the first event
+# instead of blocking the import. A failed call is retried on the next event.
+_bot_user = None if BOT_USER_ID else registry.register("slack_auth", _fetch_bot_user_id)
+
+
+def bot_user_id() -> str | None:
+    if BOT_USER_ID:
+        return BOT_USER_ID
     try:
-        auth_info = client.auth_test()
-        BOT_USER_ID = auth_info.get("user_id")
+        return _bot_user.get()
     except SlackApiError as e:
         logger.error("Failed to fetch bot user ID: %s", e.response["error"])
-        BOT_USER_ID = None
+    except Exception as e:
+        logger.error("Failed to fetch bot user ID: %s", e)
+    return None
 
 signing_secret = os.environ.get("SLACK_SIGNING_SECRET")
 
@@ -41,71 +64,246 @@ sheet_service = SheetService()
 firebase_service = FirebaseService()
 ai_service = ConversationalAI()
 serp_service = SerpAPIService()
-assistant = TravelAssistant(sheet_service, firebase_service, ai_service, serp_service)
+
+
+def _history_backend():
+    if os.environ.get("HISTORY_BACKEND", "firestore") == "firestore":
+        return FirestoreHistoryBackend(firebase_service)
+    return MemoryHistoryBackend()
+
+
+assistant = TravelAssistant(sheet_service, firebase_service, ai_service, serp_service, _history_backend())
+
+executor = KeyedExecutor(
+    max_workers=int(os.environ.get("WORKER_THREADS", "8")),
+    max_pending=int(os.environ.get("WORKER_QUEUE_DEPTH", "64")),
+)
+
+# Edit the reply in place while Gemini streams it instead of posting at the end.
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "0") == "1"
+STREAM_INTERVAL = float(os.environ.get("SLACK_STREAM_INTERVAL", "1.0"))
+
+BUSY_MESSAGE = (
+    "Estoy atendiendo muchas solicitudes en este momento; "
+    "reintentaré tu mensaje en unos segundos."
+)
 
 flask_app = Flask(__name__)
 
-processed_ids: set[str] = set()
-sent_ts: set[str] = set()
 
+def _dedup_backend():
+    if os.environ.get("DEDUP_BACKEND", "memory") == "firestore":
+        return FirestoreDedupBackend(firebase_service.client)
+    return MemoryDedupBackend()
 
-def _verify_request(req: request) -> bool:
-    """Validate Slack signature."""
+
+# Events and client messages already handled, shared across workers when
+# DEDUP_BACKEND=firestore.
+processed_events = DedupStore(_dedup_backend(), ttl=float(os.environ.get("DEDUP_TTL", "3600")))
+# Timestamps of our own replies; only needed locally and briefly.
+sent_ts = DedupStore(MemoryDedupBackend(), ttl=600)
+
+# Jobs are redelivered after this many seconds without completing. A client
+# message is claimed for as long while its turn runs, so the claim of a
+# worker that died mid-turn lapses in time for the redelivery.
+VISIBILITY_TIMEOUT = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", "120"))
+
+
+def _job_queue():
+    """Durable queue consumed by ``worker.py``; ``None`` processes events in-process."""
+    if os.environ.get("JOB_QUEUE", "") != "sqlite":
+        return None
+    return SqliteJobQueue(
+        os.environ.get("JOB_QUEUE_PATH", "/tmp/slack_jobs.sqlite3"),
+        visibility_timeout=VISIBILITY_TIMEOUT,
+        max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "5")),
+        backoff=float(os.environ.get("JOB_BACKOFF", "2")),
+    )
+
+
+job_queue = _job_queue()
+
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+metrics.register_gauge("executor", "Worker pool queue depth and wait times.", executor.stats)
+if job_queue is not None:
+    metrics.register_gauge("jobs", "Durable job queue entries by status.", job_queue.stats, "status")
+metrics.register_gauge("turns", "Turns answered by rules or by the LLM.", lambda: assistant.fast_path.counts, "path")
+metrics.register_gauge(
+    "llm_circuit_state",
+    "Circuit breaker per LLM backend (0 closed, 1 half-open, 2 open).",
+    lambda: {name: _CIRCUIT_STATES[state] for name, state in ai_service.llm.stats().items()},
+    "backend",
+)
+if serp_service.cache is not None:
+    metrics.register_gauge("serpapi_cache", "SerpApi response cache statistics.", serp_service.cache.stats)
+if ai_service.response_cache is not None:
+    metrics.register_gauge("response_cache", "Shared LLM answer cache statistics.", ai_service.response_cache.stats)
+
+
+WELCOME_MESSAGE = "Hola \U0001F44B Soy tu asistente de viajes. Escr\u00edbeme cualquier pregunta."
+
+
+def verify_signature(timestamp: str, body: str, signature: str) -> bool:
+    """Validate a Slack request signature."""
     if not signing_secret:
         return True
-    timestamp = req.headers.get("X-Slack-Request-Timestamp", "")
-    body = req.get_data(as_text=True)
     sig_basestring = f"v0:{timestamp}:{body}"
     my_sig = "v0=" + hmac.new(signing_secret.encode(), sig_basestring.encode(), hashlib.sha256).hexdigest()
-    slack_sig = req.headers.get("X-Slack-Signature", "")
-    return hmac.compare_digest(my_sig, slack_sig)
+    return hmac.compare_digest(my_sig, signature)
 
 
-def handle_event(data: dict) -> None:
-    event = data.get("event", {})
+@metrics.timed("verify_request")
+def _verify_request(req: request) -> bool:
+    """Validate Slack signature."""
+    return verify_signature(
+        req.headers.get("X-Slack-Request-Timestamp", ""),
+        req.get_data(as_text=True),
+        req.headers.get("X-Slack-Signature", ""),
+    )
+
+
+def job_id(data: dict) -> str:
+    """Idempotency key of an event callback: its ``event_id``."""
+    return data.get("event_id") or data.get("event", {}).get("ts", "")
+
+
+def _is_direct_message(event: dict) -> bool:
+    return event.get("channel", "").startswith("D") or event.get("channel_type") in {"im", "app_home"}
+
+
+def reply_threads(event: dict) -> tuple[str | None, str | None]:
+    """Return ``(thread_ts, conversation_ts)``: where to post the reply and which conversation it continues.
+
+    Top-level direct messages are answered in the DM itself and share the
+    user's own conversation (``None``). Anything else is answered in a
+    thread, and the thread's root ``ts`` keys the conversation, so a reply
+    inside the bot's thread keeps its history.
+    """
+    if event.get("thread_ts"):
+        return event["thread_ts"], event["thread_ts"]
+    if event.get("type") == "message" and _is_direct_message(event):
+        return None, None
+    return event.get("ts"), event.get("ts")
+
+
+def classify_event(event: dict, owner: str | None = None) -> str | None:
+    """Return ``"welcome"``, ``"reply"`` or ``None`` when the event is ignored.
+
+    Replies claim the event's ``client_msg_id`` for ``owner`` (see
+    :func:`job_id`) during ``VISIBILITY_TIMEOUT``, so the same message sent
+    as ``message`` and ``app_mention`` is answered once while a redelivery
+    of the same job can claim it again.
+    """
     event_type = event.get("type")
-    event_ts = event.get("ts")
     user = event.get("user")
-    bot_id = event.get("bot_id")
     subtype = event.get("subtype")
-    thread_ts = event.get("thread_ts") or event_ts
 
-    if (event_ts in sent_ts) or (user == BOT_USER_ID) or bot_id or subtype == "bot_message":
-        return
+    if (event.get("ts") in sent_ts) or (user == bot_user_id()) or event.get("bot_id") or subtype == "bot_message":
+        return None
 
     if event_type == "assistant_thread_started":
-        try:
-            welcome = "Hola \U0001F44B Soy tu asistente de viajes. Escr\u00edbeme cualquier pregunta."
-            client.chat_postMessage(channel=event["channel"], text=welcome, mrkdwn=True, thread_ts=thread_ts)
-        except SlackApiError as e:
-            logger.error("Error posting welcome message: %s", e.response["error"])
-        return
+        return "welcome"
 
     if event_type == "message" and subtype is None:
-        if event.get("channel", "").startswith("D") or event.get("channel_type") in {"im", "app_home"}:
-            try:
-                textout = assistant.handle_message(user, event.get("text", ""))
-                resp = client.chat_postMessage(channel=event["channel"], text=textout, mrkdwn=True, thread_ts=thread_ts)
-                sent_ts.add(resp.get("ts"))
-            except SlackApiError as e:
-                logger.error("Error posting message: %s", e.response["error"])
+        if _is_direct_message(event):
+            if processed_events.claim(event.get("client_msg_id"), owner, VISIBILITY_TIMEOUT):
+                return "reply"
+        return None
+
+    if event_type == "app_mention" and processed_events.claim(
+        event.get("client_msg_id"), owner, VISIBILITY_TIMEOUT
+    ):
+        return "reply"
+    return None
+
+
+def _save_reply(owner: str, text: str) -> None:
+    if job_queue is not None:
+        job_queue.save_reply(owner, text)
+
+
+def _post(event: dict, text: str, thread_ts: str | None) -> None:
+    with metrics.timer("slack_post"):
+        resp = client.chat_postMessage(channel=event["channel"], text=text, mrkdwn=True, thread_ts=thread_ts)
+    sent_ts.add(resp.get("ts"))
+
+
+def process_event(data: dict) -> None:
+    """Answer one Slack event; Slack API errors propagate so the job can be retried.
+
+    The reply is stored on the job before it is posted, so a retry after a
+    failed post only posts it again instead of running the turn twice.
+    """
+    event = data.get("event", {})
+    thread_ts, conversation_ts = reply_threads(event)
+    owner = job_id(data)
+    kind = classify_event(event, owner)
+
+    if kind == "welcome":
+        with metrics.timer("slack_post"):
+            client.chat_postMessage(channel=event["channel"], text=WELCOME_MESSAGE, mrkdwn=True, thread_ts=thread_ts)
         return
 
-    if event_type == "app_mention" and event.get("client_msg_id") not in processed_ids:
-        if user == BOT_USER_ID:
-            return
+    if kind == "reply":
+        # On failure the claim stays with this job until it lapses, so only
+        # its retry can answer the message.
+        stored = data.get("_reply")
+        if stored is not None:
+            _post(event, stored, thread_ts)
+        elif STREAM_RESPONSES:
+            streamer = SlackStreamer(client, event["channel"], thread_ts, STREAM_INTERVAL)
+            sent_ts.add(streamer.start())
+            textout = assistant.handle_message(
+                event.get("user"), event.get("text", ""), on_partial=streamer.update, thread_ts=conversation_ts
+            )
+            _save_reply(owner, textout)
+            sent_ts.add(streamer.finish(textout))
+        else:
+            textout = assistant.handle_message(event.get("user"), event.get("text", ""), thread_ts=conversation_ts)
+            _save_reply(owner, textout)
+            _post(event, textout, thread_ts)
+        processed_events.keep(event.get("client_msg_id"), owner)
+
+
+def handle_event(data: dict) -> None:
+    try:
+        process_event(data)
+    except SlackApiError as e:
+        logger.error("Error posting message: %s", e.response["error"])
+
+
+def handle_event_async(data: dict) -> bool:
+    """Queue ``data`` for processing; return ``False`` when saturated."""
+    event = data.get("event", {})
+    key = event.get("user") or event.get("channel") or ""
+    if job_queue is not None:
         try:
-            textout = assistant.handle_message(user, event.get("text", ""))
-            resp = client.chat_postMessage(channel=event["channel"], text=textout, mrkdwn=True, thread_ts=thread_ts)
-            sent_ts.add(resp.get("ts"))
-            processed_ids.add(event.get("client_msg_id"))
-        except SlackApiError as e:
-            logger.error("Error posting message: %s", e.response["error"])
-        return
+            job_queue.enqueue(job_id(data), data, group=key)
+        except Exception:
+            logger.exception("Could not enqueue event %s", data.get("event_id"))
+            return False
+        return True
+    return executor.submit(key, handle_event, data)
 
 
-def handle_event_async(data: dict) -> None:
-    Thread(target=handle_event, args=(data,), daemon=True).start()
+def _notify_busy(data: dict) -> None:
+    """Tell the user their message will be retried when the pool is full."""
+    event = data.get("event", {})
+    user = event.get("user")
+    if not user or user == bot_user_id() or event.get("bot_id") or event.get("subtype"):
+        return
+    is_dm = event.get("channel", "").startswith("D") or event.get("channel_type") in {"im", "app_home"}
+    if not (event.get("type") == "app_mention" or (event.get("type") == "message" and is_dm)):
+        return
+    try:
+        client.chat_postMessage(
+            channel=event["channel"],
+            text=BUSY_MESSAGE,
+            thread_ts=event.get("thread_ts") or event.get("ts"),
+        )
+    except SlackApiError as e:
+        logger.error("Error posting busy message: %s", e.response["error"])
 
 
 @flask_app.route("/", methods=["POST"])
@@ -115,10 +313,57 @@ def slack_events() -> tuple[str, int] | tuple[dict, int]:
     data = request.get_json(silent=True) or {}
     if data.get("type") == "url_verification":
         return jsonify({"challenge": data.get("challenge")}), 200
-    if data.get("event"):
-        handle_event_async(data)
+    if not data.get("event"):
+        return "", 200
+    event_id = data.get("event_id")
+    if not processed_events.claim(event_id):
+        # Slack retries (X-Slack-Retry-Num) of events already accepted stop here.
+        logger.info(
+            "Ignoring duplicate event %s (retry %s)",
+            event_id,
+            request.headers.get("X-Slack-Retry-Num", "0"),
+        )
+        return "", 200
+    if not handle_event_async(data):
+        processed_events.release(event_id)
+        # Saturated: let Slack redeliver the event instead of spawning more work.
+        logger.warning("Worker pool saturated: %s", executor.stats())
+        if not request.headers.get("X-Slack-Retry-Num"):
+            _notify_busy(data)
+        return "", 503
     return "", 200
 
 
+@flask_app.route("/metrics", methods=["GET"])
+def metrics_endpoint() -> Response:
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+_first_response_sent = False
+
+
+@flask_app.after_request
+def _record_first_response(response: Response) -> Response:
+    global _first_response_sent
+    if not _first_response_sent:
+        _first_response_sent = True
+        registry.record("first_response", registry.since_start())
+    return response
+
+
+WARMUP = os.environ.get("WARMUP", "1") == "1"
+
+
+def warmup() -> None:
+    """Build the Slack, Firestore, Sheets and Gemini clients in the background."""
+    if WARMUP:
+        registry.warmup()
+
+
+registry.record("import_app", registry.since_start())
+metrics.register_gauge("startup_seconds", "Seconds spent on each startup step.", registry.timings, "step")
+
+
 if __name__ == "__main__":
+    warmup()
     flask_app.run(host="0.0.0.0", port=8080)
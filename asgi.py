@@ -0,0 +1,162 @@
+"""ASGI entrypoint running the Slack pipeline on asyncio.
+
+Serve with ``uvicorn asgi:app --host 0.0.0.0 --port 8080``. Each conversation
+is a task instead of a thread, so a single worker can keep hundreds of
+Gemini calls in flight.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import weakref
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+import app as slack_app
+from services import metrics
+from services.slack_stream import AsyncSlackStreamer
+
+logger = logging.getLogger(__name__)
+
+client = AsyncWebClient(token=slack_app.slack_token)
+
+MAX_CONVERSATIONS = int(os.environ.get("ASYNC_MAX_CONVERSATIONS", "200"))
+MAX_PENDING = int(os.environ.get("ASYNC_MAX_PENDING", "1000"))
+
+_slots = asyncio.Semaphore(MAX_CONVERSATIONS)
+_user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_tasks: set[asyncio.Task] = set()
+
+
+async def handle_event(data: dict) -> None:
+    event = data.get("event", {})
+    thread_ts, conversation_ts = slack_app.reply_threads(event)
+    owner = slack_app.job_id(data)
+    kind = await asyncio.to_thread(slack_app.classify_event, event, owner)
+
+    try:
+        if kind == "welcome":
+            with metrics.timer("slack_post"):
+                await client.chat_postMessage(
+                    channel=event["channel"], text=slack_app.WELCOME_MESSAGE, mrkdwn=True, thread_ts=thread_ts
+                )
+        elif kind == "reply":
+            user = event.get("user")
+            # Keep a strong reference while in use; the weak map drops idle locks.
+            lock = _user_locks.setdefault(user, asyncio.Lock())
+            async with lock, _slots:
+                if slack_app.STREAM_RESPONSES:
+                    streamer = AsyncSlackStreamer(client, event["channel"], thread_ts, slack_app.STREAM_INTERVAL)
+                    slack_app.sent_ts.add(await streamer.start())
+                    textout = await slack_app.assistant.handle_message_async(
+                        user, event.get("text", ""), on_partial=streamer.update, thread_ts=conversation_ts
+                    )
+                    slack_app.sent_ts.add(await streamer.finish(textout))
+                    await asyncio.to_thread(slack_app.processed_events.keep, event.get("client_msg_id"), owner)
+                    return
+                textout = await slack_app.assistant.handle_message_async(
+                    user, event.get("text", ""), thread_ts=conversation_ts
+                )
+            with metrics.timer("slack_post"):
+                resp = await client.chat_postMessage(
+                    channel=event["channel"], text=textout, mrkdwn=True, thread_ts=thread_ts
+                )
+            slack_app.sent_ts.add(resp.get("ts"))
+            await asyncio.to_thread(slack_app.processed_events.keep, event.get("client_msg_id"), owner)
+    except SlackApiError as e:
+        logger.error("Error posting message: %s", e.response["error"])
+    except Exception:
+        logger.exception("Unhandled error processing Slack event")
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _respond(send, status: int, body: bytes = b"", content_type: str = "text/plain") -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type.encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            slack_app.warmup()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _tasks:
+                await asyncio.wait(_tasks, timeout=30)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/metrics" and scope["method"] == "GET":
+        await _respond(send, 200, metrics.render().encode(), "text/plain; version=0.0.4")
+        return
+    if scope["path"] != "/" or scope["method"] != "POST":
+        await _respond(send, 404)
+        return
+
+    body = (await _read_body(receive)).decode("utf-8", errors="replace")
+    headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+    with metrics.timer("verify_request"):
+        verified = slack_app.verify_signature(
+            headers.get("x-slack-request-timestamp", ""), body, headers.get("x-slack-signature", "")
+        )
+    if not verified:
+        await _respond(send, 403)
+        return
+
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        data = {}
+    if data.get("type") == "url_verification":
+        payload = json.dumps({"challenge": data.get("challenge")}).encode()
+        await _respond(send, 200, payload, "application/json")
+        return
+    if not data.get("event"):
+        await _respond(send, 200)
+        return
+
+    event_id = data.get("event_id")
+    if not await asyncio.to_thread(slack_app.processed_events.claim, event_id):
+        logger.info("Ignoring duplicate event %s (retry %s)", event_id, headers.get("x-slack-retry-num", "0"))
+        await _respond(send, 200)
+        return
+    if slack_app.job_queue is not None:
+        accepted = await asyncio.to_thread(slack_app.handle_event_async, data)
+        if not accepted:
+            slack_app.processed_events.release(event_id)
+        await _respond(send, 200 if accepted else 503)
+        return
+    if len(_tasks) >= MAX_PENDING:
+        slack_app.processed_events.release(event_id)
+        logger.warning("Async pipeline saturated with %d pending events", len(_tasks))
+        await _respond(send, 503)
+        return
+
+    task = asyncio.create_task(handle_event(data))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    await _respond(send, 200)
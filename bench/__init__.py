@@ -0,0 +1,7 @@
+"""Offline benchmarks for the Slack message path.
+
+``python -m bench.load`` drives ``app.flask_app`` with signed synthetic
+events against local stand-ins; ``python -m bench.micro`` times the hot
+parsing and prompt-building helpers and compares them with
+``bench/baseline.json``.
+"""
@@ -0,0 +1,259 @@
+"""Load test of the full Slack message path against local stand-ins.
+
+Signed synthetic ``message`` events are POSTed to ``app.flask_app`` from
+``--concurrency`` threads (optionally paced with ``--rate``). Each event is
+acknowledged, queued on the real ``KeyedExecutor`` and answered through the
+real ``TravelAssistant``; only Slack, Gemini, Firestore, Sheets and SerpApi
+are replaced by the stand-ins in :mod:`bench.stubs`. Usage::
+
+    python -m bench.load --events 500 --users 50 --llm-latency 0.4
+    python -m bench.load --json > bench_output.txt
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .stubs import FakeFirebase, FakeLLMBackend, FakeSerpApi, FakeSheets, FakeSlackClient, Profile
+
+SIGNING_SECRET = "bench-signing-secret"
+
+# One conversation; every user walks through it in order.
+MESSAGES = [
+    "Hola",
+    "Quiero viajar de Guadalajara a Madrid",
+    "Salgo el 2025-03-14 y regreso el 2025-03-18",
+    "Es para la conferencia anual de ventas",
+    "¿Qué hoteles me recomiendas cerca del venue?",
+    "Prefiero ventana y presupuesto $900",
+    "¿Puedo llevar maleta?",
+    "Gracias",
+]
+
+
+def _service_account() -> str:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode()
+    return json.dumps(
+        {
+            "type": "service_account",
+            "project_id": "bench",
+            "private_key_id": "bench",
+            "private_key": pem,
+            "client_email": "bench@bench.iam.gserviceaccount.com",
+            "client_id": "bench",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }
+    )
+
+
+def load_app(args: argparse.Namespace):
+    """Import ``app`` with offline settings and swap in the stand-ins."""
+    os.environ.update(
+        {
+            "SLACK_BOT_TOKEN": "xoxb-bench",
+            "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+            "BOT_USER_ID": "UBENCH",
+            "WORKER_THREADS": str(args.workers),
+            "WORKER_QUEUE_DEPTH": str(args.queue_depth),
+            "CITY_CACHE_PATH": "",
+            "HISTORY_BACKEND": "memory",
+        }
+    )
+    os.environ.setdefault("service-account", _service_account())
+    for name in ("GEMINI_API_KEY", "GOOGLE_API_KEY", "SERPAPI_KEY", "GOOGLE_SHEET_ID"):
+        os.environ.pop(name, None)
+
+    import app
+    from services.llm import ResilientLLM
+
+    app.client = FakeSlackClient(Profile(args.slack_latency, args.error_rate))
+    app.assistant.firebase = FakeFirebase(Profile(args.store_latency))
+    app.assistant.sheets = FakeSheets(Profile(args.sheets_latency))
+    app.assistant.serpapi = FakeSerpApi(Profile(args.serpapi_latency))
+    app.ai_service.llm = ResilientLLM([FakeLLMBackend(Profile(args.llm_latency, args.error_rate))], backoff=0.05)
+    return app
+
+
+def _events(count: int, users: int) -> list[dict]:
+    events = []
+    for i in range(count):
+        user = f"U{i % users:05d}"
+        ts = f"{1700000000 + i}.{i % 1000000:06d}"
+        events.append(
+            {
+                "type": "event_callback",
+                "event_id": f"Ev{i:08d}",
+                "event": {
+                    "type": "message",
+                    "channel": f"D{i % users:05d}",
+                    "channel_type": "im",
+                    "user": user,
+                    "text": MESSAGES[(i // users) % len(MESSAGES)],
+                    "ts": ts,
+                    "client_msg_id": f"msg-{i}",
+                },
+            }
+        )
+    return events
+
+
+def _signed(body: str) -> dict:
+    timestamp = str(int(time.time()))
+    base = f"v0:{timestamp}:{body}".encode()
+    signature = "v0=" + hmac.new(SIGNING_SECRET.encode(), base, hashlib.sha256).hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+    }
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class _Sampler(threading.Thread):
+    """Track peak thread count and RSS while the run is in progress."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.threads = threading.active_count()
+        self.rss_mb = _rss_mb()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            self.threads = max(self.threads, threading.active_count())
+            self.rss_mb = max(self.rss_mb, _rss_mb())
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+def run(args: argparse.Namespace) -> dict:
+    app = load_app(args)
+    slack = app.client
+    events = _events(args.events, args.users)
+    sent: dict[str, float] = {}
+    acks: list[float] = []
+    statuses: dict[int, int] = {}
+    lock = threading.Lock()
+    sampler = _Sampler()
+    sampler.start()
+    start = time.perf_counter()
+
+    def send(i: int, data: dict) -> None:
+        if args.rate:
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        body = json.dumps(data)
+        began = time.perf_counter()
+        resp = app.flask_app.test_client().post("/", data=body, headers=_signed(body))
+        elapsed = time.perf_counter() - began
+        with lock:
+            acks.append(elapsed)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            if resp.status_code == 200:
+                sent[data["event"]["ts"]] = began
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, data in enumerate(events):
+            pool.submit(send, i, data)
+
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline and len(slack.replies.keys() & sent.keys()) < len(sent):
+        time.sleep(0.01)
+    wall = time.perf_counter() - start
+    sampler.stop()
+
+    latencies = [slack.replies[ts] - began for ts, began in sent.items() if ts in slack.replies]
+    return {
+        "events": len(events),
+        "accepted": statuses.get(200, 0),
+        "rejected": statuses.get(503, 0),
+        "replied": len(latencies),
+        "wall_seconds": round(wall, 3),
+        "events_per_second": round(len(latencies) / wall, 1) if wall else 0.0,
+        "ack_ms": {p: round(percentile(acks, p) * 1000, 2) for p in (50, 95, 99)},
+        "reply_ms": {p: round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)},
+        "peak_threads": sampler.threads,
+        "peak_rss_mb": round(sampler.rss_mb, 1),
+        "turns": dict(app.assistant.fast_path.counts),
+        "executor": app.executor.stats(),
+    }
+
+
+def _report(result: dict) -> str:
+    lines = [
+        f"events {result['events']}  accepted {result['accepted']}  "
+        f"rejected {result['rejected']}  replied {result['replied']}",
+        f"throughput {result['events_per_second']} events/s over {result['wall_seconds']}s",
+    ]
+    for name in ("ack_ms", "reply_ms"):
+        pcts = result[name]
+        lines.append(f"{name:<9} p50 {pcts[50]:>8}  p95 {pcts[95]:>8}  p99 {pcts[99]:>8}")
+    lines.append(f"peak threads {result['peak_threads']}  peak RSS {result['peak_rss_mb']} MB")
+    lines.append(f"turns {result['turns']}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=400)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=16, help="threads POSTing events")
+    parser.add_argument("--rate", type=float, default=0.0, help="events/s to send; 0 sends as fast as possible")
+    parser.add_argument("--workers", type=int, default=8, help="WORKER_THREADS for the app")
+    parser.add_argument("--queue-depth", type=int, default=256, help="WORKER_QUEUE_DEPTH for the app")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--slack-latency", type=float, default=0.05)
+    parser.add_argument("--store-latency", type=float, default=0.02)
+    parser.add_argument("--sheets-latency", type=float, default=0.05)
+    parser.add_argument("--serpapi-latency", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="failure probability for Slack and the LLM")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for replies")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, indent=2) if args.json else _report(result))
+    return 0 if result["replied"] == result["accepted"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Micro-benchmarks for the per-turn parsing and prompt helpers.
+
+Each case runs offline (no API key, in-memory city cache). Results are
+microseconds per call, the best of ``--repeat`` runs. ``parse`` memoizes
+its results, so the cache is cleared before every call to time the parse
+itself rather than cache hits. Usage::
+
+    python -m bench.micro                    # compare with bench/baseline.json
+    python -m bench.micro --update-baseline  # store this machine's numbers
+
+A case fails the comparison when it is more than ``--tolerance`` times
+slower than its baseline. Baselines are machine specific; refresh them on
+the machine that runs the comparison.
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+MESSAGES = [
+    "Quiero viajar de MEX a NYC el 2025-03-14 y regresar el 2025-03-18",
+    "Necesito un vuelo de Guadalajara a Madrid el 14 de marzo en business",
+    "vuelo cdmx a san fransisco la próxima semana, prefiero ventana",
+    "¿Qué hoteles me recomiendas cerca del venue?",
+    "Hola, voy a la conferencia de ventas en Buenos Aires del 3 al 7 de junio con Aeromexico",
+]
+
+
+def _cases() -> dict:
+    os.environ.setdefault("CITY_CACHE_PATH", "")
+    from services.params import _extract_airports, build_flight_params
+    from services.parser import parse
+    from services.state import TravelState
+    from services.travel import TravelAssistant
+
+    assistant = TravelAssistant(None, None, None, None)
+    state = TravelState(origin="GDL", destination="MAD", start_date="2025-03-14", seat_pref="ventana")
+    history = []
+    for i in range(10):
+        history.append({"user": MESSAGES[i % len(MESSAGES)]})
+        history.append({"bot": "Perfecto, anoto los datos de tu viaje. ¿Algo más que deba considerar?"})
+
+    # Warm the gazetteer and phrase trie so cases measure steady state.
+    for message in MESSAGES:
+        build_flight_params(message, "")
+
+    def uncached(fn):
+        def run():
+            for m in MESSAGES:
+                parse.cache_clear()
+                fn(m)
+
+        return run
+
+    return {
+        "parse": uncached(parse),
+        "build_flight_params": uncached(lambda m: build_flight_params(m, "")),
+        "_extract_airports": uncached(lambda m: _extract_airports(m, "")),
+        "build_prompt": lambda: [assistant.build_prompt({}, state, history, m) for m in MESSAGES],
+    }
+
+
+def measure(number: int, repeat: int) -> dict[str, float]:
+    """Return microseconds per call for every case."""
+    results = {}
+    for name, fn in _cases().items():
+        best = min(timeit.repeat(fn, number=number, repeat=repeat))
+        results[name] = round(best / (number * len(MESSAGES)) * 1e6, 2)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Return the names of cases slower than ``tolerance`` times their baseline."""
+    return [name for name, us in results.items() if name in baseline and us > baseline[name] * tolerance]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = measure(args.number, args.repeat)
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as fh:
+            baseline = json.load(fh)
+    regressions = compare(results, baseline, args.tolerance)
+    for name, us in results.items():
+        base = baseline.get(name)
+        ratio = f"{us / base:5.2f}x" if base else "    -"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<22} {us:>10.2f} us/call  baseline {base or '-':>8}  {ratio}{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Local stand-ins for Slack, Gemini, Firestore, Sheets and SerpApi.
+
+Each stand-in sleeps for a configurable latency (mean with +/-50% uniform
+jitter) and fails with a configurable probability, so the real pipeline
+(executor, dedup, fast path, LLM retries and breakers) runs unchanged.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from slack_sdk.errors import SlackApiError
+
+
+class Unavailable(Exception):
+    """Injected failure; treated as transient like an HTTP 503."""
+
+    code = 503
+
+
+@dataclass
+class Profile:
+    latency: float = 0.0
+    error_rate: float = 0.0
+
+    def delay(self) -> float:
+        return self.latency * random.uniform(0.5, 1.5) if self.latency else 0.0
+
+    def wait(self) -> None:
+        time.sleep(self.delay())
+        if self.error_rate and random.random() < self.error_rate:
+            raise Unavailable("injected failure")
+
+    async def wait_async(self) -> None:
+        await asyncio.sleep(self.delay())
+        if self.error_rate and random.random() < self.error_rate:
+            raise Unavailable("injected failure")
+
+
+class FakeSlackClient:
+    """Records when each thread received a reply."""
+
+    def __init__(self, profile: Profile) -> None:
+        self.profile = profile
+        self.replies: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._ts = 0
+
+    def _next_ts(self) -> str:
+        with self._lock:
+            self._ts += 1
+            return f"9{self._ts:09d}.000100"
+
+    def chat_postMessage(self, channel: str, text: str, thread_ts: str | None = None, **kwargs) -> dict:
+        try:
+            self.profile.wait()
+        except Unavailable:
+            raise SlackApiError("injected failure", {"ok": False, "error": "service_unavailable"})
+        if thread_ts:
+            with self._lock:
+                self.replies[thread_ts] = time.perf_counter()
+        return {"ok": True, "ts": self._next_ts()}
+
+    def chat_update(self, channel: str, ts: str, text: str, **kwargs) -> dict:
+        self.profile.wait()
+        return {"ok": True, "ts": ts}
+
+
+class FakeLLMBackend:
+    """``ResilientLLM`` backend answering with a fixed text."""
+
+    def __init__(self, profile: Profile, name: str = "fake-llm") -> None:
+        self.profile = profile
+        self.name = name
+
+    def generate(self, text, system_instruction, timeout) -> str:
+        self.profile.wait()
+        return "Claro, te ayudo con tu viaje. ¿Qué fechas tienes en mente?"
+
+    async def generate_async(self, text, system_instruction, timeout) -> str:
+        await self.profile.wait_async()
+        return "Claro, te ayudo con tu viaje. ¿Qué fechas tienes en mente?"
+
+    def stream(self, text, system_instruction, timeout):
+        yield self.generate(text, system_instruction, timeout)
+
+    async def stream_async(self, text, system_instruction, timeout):
+        yield await self.generate_async(text, system_instruction, timeout)
+
+
+class FakeFirebase:
+    """In-memory user documents with Firestore-like latency."""
+
+    def __init__(self, profile: Profile) -> None:
+        self.profile = profile
+        self.docs: dict[str, dict] = {}
+
+    def get_user_data(self, slack_id: str) -> dict | None:
+        self.profile.wait()
+        doc = self.docs.get(slack_id)
+        return dict(doc) if doc else None
+
+    def save_user_data(self, slack_id: str, data: dict) -> None:
+        self.profile.wait()
+        self.docs.setdefault(slack_id, {}).update(data)
+
+    async def get_user_data_async(self, slack_id: str) -> dict | None:
+        await self.profile.wait_async()
+        doc = self.docs.get(slack_id)
+        return dict(doc) if doc else None
+
+    async def save_user_data_async(self, slack_id: str, data: dict) -> None:
+        await self.profile.wait_async()
+        self.docs.setdefault(slack_id, {}).update(data)
+
+
+class FakeSheets:
+    def __init__(self, profile: Profile) -> None:
+        self.profile = profile
+
+    def get_user(self, slack_id: str) -> dict | None:
+        self.profile.wait()
+        return {"Nombre": f"Usuario {slack_id}", "Seniority": "Senior", "Departamento": "Ventas"}
+
+
+class FakeSerpApi:
+    def __init__(self, profile: Profile) -> None:
+        self.profile = profile
+
+    @staticmethod
+    def _flights(origin: str, destination: str) -> list:
+        return [{"price": 320, "flights": [{"departure_airport": {"id": origin}, "arrival_airport": {"id": destination}}]}]
+
+    @staticmethod
+    def _hotels(city: str) -> list:
+        return [{"name": f"Hotel {city}", "rate_per_night": {"extracted_lowest": 120}}]
+
+    def search_flights(self, origin: str, destination: str, date: str) -> list:
+        self.profile.wait()
+        return self._flights(origin, destination)
+
+    def search_hotels(self, city: str, check_in: str, check_out: str) -> list:
+        self.profile.wait()
+        return self._hotels(city)
+
+    async def search_flights_async(self, origin: str, destination: str, date: str) -> list:
+        await self.profile.wait_async()
+        return self._flights(origin, destination)
+
+    async def search_hotels_async(self, city: str, check_in: str, check_out: str) -> list:
+        await self.profile.wait_async()
+        return self._hotels(city)
+
+    def search_flight_params(self, params: dict) -> list:
+        self.profile.wait()
+        return self._flights(params.get("departure_id", ""), params.get("arrival_id", ""))
+
+    async def search_flight_params_async(self, params: dict) -> list:
+        await self.profile.wait_async()
+        return self._flights(params.get("departure_id", ""), params.get("arrival_id", ""))
@@ -1,3 +1,11 @@
 # Gunicorn configuration file
 # Keep timeout reasonable for external API calls
 timeout = 60
+
+
+def post_worker_init(worker):
+    # The listening socket is already bound: build the API clients in the
+    # background so the first request does not pay for them.
+    import app
+
+    app.warmup()
@@ -1,36 +1,179 @@
+import importlib.util
 import logging
 import os
+from typing import AsyncIterator, Iterator
+
+from . import metrics, registry
+from .llm import GeminiBackend, OpenAICompatibleBackend, ResilientLLM, StreamTruncated
+from .semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
-try:
+
+def _gemini_client():
     from google import genai
 
-    api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-    client = genai.Client(api_key=api_key) if api_key else None
-    GEMINI_AVAILABLE = client is not None
-except ImportError as e:
-    logger.warning("Gemini not available: %s", e)
-    client = None
-    GEMINI_AVAILABLE = False
+    return genai.Client(api_key=api_key)
+
+
+# google.genai takes about a second to import, so the client is only built
+# on the first call (or during warm-up). Tests override both names.
+api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+GEMINI_AVAILABLE = bool(api_key) and importlib.util.find_spec("google.genai") is not None
+client = registry.register("gemini", _gemini_client) if GEMINI_AVAILABLE else None
+if api_key and not GEMINI_AVAILABLE:
+    logger.warning("Gemini not available: google-genai is not installed")
+
+FALLBACK_MESSAGE = "Lo siento, actualmente no puedo procesar tu solicitud."
+
+# Models tried in order before the open-source endpoint and the canned reply.
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_FALLBACK_MODELS = [
+    m.strip() for m in os.environ.get("GEMINI_FALLBACK_MODELS", "gemini-2.5-flash-lite").split(",") if m.strip()
+]
+
+# OpenAI-compatible endpoint serving an open-source model (vLLM, Ollama, TGI...).
+OSS_LLM_URL = os.environ.get("OSS_LLM_URL")
+OSS_LLM_MODEL = os.environ.get("OSS_LLM_MODEL", "llama-3.1-8b-instruct")
+OSS_LLM_API_KEY = os.environ.get("OSS_LLM_API_KEY")
+
+# Per-attempt timeout and overall deadline in seconds; the deadline stays
+# below gunicorn's 60s worker timeout.
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "20"))
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", "40"))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "1"))
+LLM_BACKOFF = float(os.environ.get("LLM_BACKOFF", "0.5"))
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "3"))
+LLM_BREAKER_RESET = float(os.environ.get("LLM_BREAKER_RESET", "30"))
+
+# Explicit context caching of the system instruction. Gemini only caches
+# prompts above a minimum size, so creation failures fall back to sending
+# the instruction inline (still eligible for implicit prefix caching).
+CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_TTL = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+# Answers to general questions reused across users (see services.semantic_cache).
+SEMANTIC_CACHE = os.environ.get("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+
 
 class ConversationalAI:
     def __init__(self):
         self.gemini_client = client if GEMINI_AVAILABLE else None
-        self.model_name = "gemini-2.5-flash"
-        if self.gemini_client:
-            logger.info("Using Gemini 2.5 Flash model")
+        self.model_name = GEMINI_MODEL
+        self.llm = ResilientLLM(
+            self._backends(),
+            timeout=LLM_TIMEOUT,
+            deadline=LLM_DEADLINE,
+            retries=LLM_RETRIES,
+            backoff=LLM_BACKOFF,
+            breaker_threshold=LLM_BREAKER_THRESHOLD,
+            breaker_reset=LLM_BREAKER_RESET,
+        )
+        self.response_cache = (
+            SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD)
+            if SEMANTIC_CACHE
+            else None
+        )
+        if self.llm.backends:
+            logger.info("LLM chain: %s", " -> ".join(b.name for b in self.llm.backends))
 
-    def process_message(self, user: str, text: str) -> str:
+    def _backends(self) -> list:
+        backends: list = []
         if self.gemini_client:
-            try:
-                response = self.gemini_client.models.generate_content(
-                    model=self.model_name,
-                    contents=text,
-                )
-                return response.text
-            except Exception as e:
-                logger.error("Gemini error: %s", e)
-                self.gemini_client = None
-        logger.error("No conversational AI available")
-        return "Lo siento, actualmente no puedo procesar tu solicitud."
+            for model in dict.fromkeys([self.model_name, *GEMINI_FALLBACK_MODELS]):
+                backends.append(GeminiBackend(self.gemini_client, model, CONTEXT_CACHE, CONTEXT_CACHE_TTL))
+        if OSS_LLM_URL:
+            backends.append(OpenAICompatibleBackend(OSS_LLM_URL, OSS_LLM_MODEL, OSS_LLM_API_KEY))
+        return backends
+
+    def _cached_answer(self, cache_key: str | None) -> str | None:
+        if not cache_key or self.response_cache is None:
+            return None
+        return self.response_cache.get(cache_key)
+
+    def _remember_answer(self, cache_key: str | None, answer: str) -> None:
+        if cache_key and answer and self.response_cache is not None:
+            self.response_cache.put(cache_key, answer)
+
+    @metrics.timed("llm")
+    def process_message(
+        self, user: str, text: str, system_instruction: str | None = None, cache_key: str | None = None
+    ) -> str:
+        """Answer ``text``.
+
+        ``cache_key`` marks a stateless question whose answer may be shared
+        with other users through the response cache.
+        """
+        cached = self._cached_answer(cache_key)
+        if cached is not None:
+            return cached
+        response = self.llm.generate(text, system_instruction)
+        if response is None:
+            logger.error("No conversational AI available")
+            return FALLBACK_MESSAGE
+        self._remember_answer(cache_key, response)
+        return response
+
+    @metrics.timed("llm")
+    async def process_message_async(
+        self, user: str, text: str, system_instruction: str | None = None, cache_key: str | None = None
+    ) -> str:
+        """Awaitable variant of :meth:`process_message` using the async clients."""
+        cached = self._cached_answer(cache_key)
+        if cached is not None:
+            return cached
+        response = await self.llm.generate_async(text, system_instruction)
+        if response is None:
+            logger.error("No conversational AI available")
+            return FALLBACK_MESSAGE
+        self._remember_answer(cache_key, response)
+        return response
+
+    @metrics.timed("llm")
+    def stream_message(
+        self, user: str, text: str, system_instruction: str | None = None, cache_key: str | None = None
+    ) -> Iterator[str]:
+        """Yield the response in chunks as the model generates it."""
+        cached = self._cached_answer(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        try:
+            for chunk in self.llm.stream(text, system_instruction):
+                chunks.append(chunk)
+                yield chunk
+        except StreamTruncated:
+            # The user keeps the partial reply, but it is never shared through the cache.
+            return
+        if not chunks:
+            logger.error("No conversational AI available")
+            yield FALLBACK_MESSAGE
+            return
+        self._remember_answer(cache_key, "".join(chunks))
+
+    @metrics.timed("llm")
+    async def stream_message_async(
+        self, user: str, text: str, system_instruction: str | None = None, cache_key: str | None = None
+    ) -> AsyncIterator[str]:
+        """Awaitable variant of :meth:`stream_message`."""
+        cached = self._cached_answer(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        try:
+            async for chunk in self.llm.stream_async(text, system_instruction):
+                chunks.append(chunk)
+                yield chunk
+        except StreamTruncated:
+            # The user keeps the partial reply, but it is never shared through the cache.
+            return
+        if not chunks:
+            logger.error("No conversational AI available")
+            yield FALLBACK_MESSAGE
+            return
+        self._remember_answer(cache_key, "".join(chunks))
@@ -0,0 +1,202 @@
+"""Response caching for outbound API calls."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Returned by backends on a miss, so ``None`` can be cached as a value.
+MISSING = object()
+
+
+class MemoryCacheBackend:
+    """Size-bounded LRU with per-entry expiry, local to the process."""
+
+    def __init__(self, max_size: int = 512) -> None:
+        self.max_size = max_size
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return MISSING
+            expires, value = item
+            if expires <= time.time():
+                del self._items[key]
+                return MISSING
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._items[key] = (time.time() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SqliteCacheBackend:
+    """On-disk cache shared by every worker on the host.
+
+    Values are stored as JSON; the least recently written entries are
+    pruned once the table grows past ``max_size``.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_size: int = 10000) -> None:
+        self.path = path
+        self.table = table
+        self.max_size = max_size
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        try:
+            row = self._connect().execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache read failed: %s", e)
+            return MISSING
+        if row is None or row[1] <= time.time():
+            return MISSING
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time() + ttl),
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._prune(conn)
+        except sqlite3.Error as e:
+            logger.warning("Cache write failed: %s", e)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+            "ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def __len__(self) -> int:
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class ResponseCache:
+    """Cache API responses keyed on their canonicalized parameters.
+
+    ``api_key`` never takes part in the key. Concurrent callers asking for
+    the same key share a single in-flight request, and ``None`` results
+    (failed requests) are not cached. Cached values are shared between
+    callers and must be treated as read-only.
+    """
+
+    def __init__(self, backend=None, ttls: dict[str, float] | None = None, default_ttl: float = 600.0) -> None:
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: dict[str, Future] = {}
+        self._inflight_async: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint: str, params: dict) -> str:
+        canonical = {k: str(v) for k, v in params.items() if k != "api_key" and v is not None}
+        raw = json.dumps([endpoint, canonical], sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def ttl_for(self, params: dict) -> float:
+        return self.ttls.get(params.get("engine", ""), self.default_ttl)
+
+    def get_or_fetch(self, endpoint: str, params: dict, fetch: Callable[[], Any]) -> Any:
+        key = self.key(endpoint, params)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            value = fetch()
+            if value is not None:
+                self.backend.set(key, value, self.ttl_for(params))
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_or_fetch_async(self, endpoint: str, params: dict, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        key = self.key(endpoint, params)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        future = self._inflight_async.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        self.misses += 1
+        future = self._inflight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await fetch()
+            if value is not None:
+                self.backend.set(key, value, self.ttl_for(params))
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight_async.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
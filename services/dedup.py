@@ -0,0 +1,176 @@
+"""Time-bounded deduplication of Slack events and sent messages.
+
+A claim may name an ``owner`` (the Slack ``event_id`` handling it): the
+same owner can claim the key again, so a redelivered job is not mistaken
+for a duplicate, while other events are rejected until the claim expires.
+Work in progress is claimed for a short lease and held for the full TTL
+only once it is done, so a claim left by a worker that died expires soon.
+"""
+
+import datetime
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Reads and conditional writes of one claim before giving up under contention.
+CLAIM_ATTEMPTS = 3
+
+
+class MemoryDedupBackend:
+    """Process-local store of keys with a heap of their expiry times.
+
+    Entries are dropped once expired, whatever TTL they were added with, or
+    when ``max_size`` is exceeded, so memory stays flat on long-running
+    workers.
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._items: OrderedDict[str, tuple[float, str | None]] = OrderedDict()
+        # (expires, key) per add; entries whose key was re-added or evicted are skipped.
+        self._expiry: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, key = heapq.heappop(self._expiry)
+            item = self._items.get(key)
+            if item is not None and item[0] == expires:
+                del self._items[key]
+        if len(self._expiry) > 2 * max(len(self._items), self.max_size):
+            self._expiry = [(expires, key) for key, (expires, _) in self._items.items()]
+            heapq.heapify(self._expiry)
+
+    def _live(self, key: str, now: float) -> tuple[float, str | None] | None:
+        item = self._items.get(key)
+        return item if item is not None and item[0] > now else None
+
+    def add(self, key: str, ttl: float, owner: str | None = None) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            item = self._live(key, now)
+            if item is not None and (owner is None or item[1] != owner):
+                return False
+            self._items[key] = (now + ttl, owner)
+            self._items.move_to_end(key)
+            heapq.heappush(self._expiry, (now + ttl, key))
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return True
+
+    def contains(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            return self._live(key, now) is not None
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class FirestoreDedupBackend:
+    """Store shared by all workers, claiming keys with Firestore ``create``.
+
+    An expired claim is taken over with an ``update`` conditioned on the
+    ``update_time`` it was read at, so two workers never both win it.
+    Documents carry an ``expires_at`` timestamp; configure a Firestore TTL
+    policy on that field so old claims are deleted automatically.
+    """
+
+    def __init__(self, client, collection: str = "slack_events") -> None:
+        self.client = client
+        self.collection = collection
+
+    def _document(self, key: str):
+        return self.client.collection(self.collection).document(key.replace("/", "_"))
+
+    def add(self, key: str, ttl: float, owner: str | None = None) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        claim = {"expires_at": now + datetime.timedelta(seconds=ttl), "owner": owner}
+        from google.api_core import exceptions
+
+        ref = self._document(key)
+        try:
+            for _ in range(CLAIM_ATTEMPTS):
+                try:
+                    ref.create(claim)
+                    return True
+                except exceptions.AlreadyExists:
+                    pass
+                snapshot = ref.get()
+                if not snapshot.exists:
+                    continue
+                current = snapshot.to_dict() or {}
+                live = current.get("expires_at") and current["expires_at"] > now
+                if live and (owner is None or current.get("owner") != owner):
+                    return False
+                try:
+                    ref.update(claim, option=self.client.write_option(last_update_time=snapshot.update_time))
+                    return True
+                except (exceptions.FailedPrecondition, exceptions.NotFound):
+                    # Claimed or deleted meanwhile; read it again.
+                    continue
+            return False
+        except Exception as e:
+            # Never drop an event because the dedup store is unavailable.
+            logger.error("Dedup store unavailable: %s", e)
+            return True
+
+    def contains(self, key: str) -> bool:
+        try:
+            snapshot = self._document(key).get()
+        except Exception as e:
+            logger.error("Dedup store unavailable: %s", e)
+            return False
+        if not snapshot.exists:
+            return False
+        expires_at = (snapshot.to_dict() or {}).get("expires_at")
+        return bool(expires_at and expires_at > datetime.datetime.now(datetime.timezone.utc))
+
+    def discard(self, key: str) -> None:
+        try:
+            self._document(key).delete()
+        except Exception as e:
+            logger.error("Dedup store unavailable: %s", e)
+
+
+class DedupStore:
+    """Remember keys for ``ttl`` seconds on a pluggable backend."""
+
+    def __init__(self, backend=None, ttl: float = 3600.0) -> None:
+        self.backend = backend if backend is not None else MemoryDedupBackend()
+        self.ttl = ttl
+
+    def claim(self, key: str | None, owner: str | None = None, ttl: float | None = None) -> bool:
+        """Return ``True`` the first time ``key`` is seen within the TTL, or again to its ``owner``.
+
+        ``ttl`` shortens the claim, e.g. to a job lease, until :meth:`keep`.
+        """
+        if not key:
+            return True
+        return self.backend.add(key, self.ttl if ttl is None else ttl, owner)
+
+    def keep(self, key: str | None, owner: str | None = None) -> None:
+        """Hold a claim of ``owner`` for the full TTL once its work is done."""
+        if key:
+            self.backend.add(key, self.ttl, owner)
+
+    def add(self, key: str | None) -> None:
+        if key:
+            self.backend.add(key, self.ttl)
+
+    def release(self, key: str | None) -> None:
+        if key:
+            self.backend.discard(key)
+
+    def __contains__(self, key: str | None) -> bool:
+        return bool(key) and self.backend.contains(key)
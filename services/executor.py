@@ -0,0 +1,88 @@
+"""Bounded worker pool used to process Slack events in the background."""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedExecutor:
+    """Thread pool with a queue depth limit and per-key serialization.
+
+    Tasks sharing a key (the Slack user) run one after another on a single
+    worker so two messages from the same user never touch the same Firestore
+    document concurrently. ``submit`` returns ``False`` instead of queueing
+    once ``max_pending`` tasks are waiting or running.
+    """
+
+    def __init__(self, max_workers: int = 8, max_pending: int = 64) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="event-worker")
+        self._queues: dict[str, deque] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, key: str, fn: Callable[..., Any], *args: Any) -> bool:
+        item = (time.monotonic(), fn, args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            self.submitted += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(item)
+                return True
+            self._queues[key] = deque([item])
+        self._pool.submit(self._drain, key)
+        return True
+
+    def _drain(self, key: str) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                enqueued, fn, args = queue.popleft()
+                waited = time.monotonic() - enqueued
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("Unhandled error processing task for %s", key)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            avg = self.wait_total / self.wait_count if self.wait_count else 0.0
+            return {
+                "pending": self._pending,
+                "active_keys": len(self._queues),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "queue_wait_avg": avg,
+                "queue_wait_max": self.wait_max,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
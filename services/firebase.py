@@ -1,28 +1,331 @@
+import copy
 import os
-import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Any
-from google.cloud import firestore
+
+from . import metrics, registry
 
 logger = logging.getLogger(__name__)
 
+# Conditional retries of a conflicting write before its fields are merged
+# unconditionally.
+CONFLICT_RETRIES = 3
+
+_MISSING = object()
+
+
+def _conflicts() -> tuple:
+    """Errors of a conditional write whose document changed meanwhile."""
+    from google.api_core import exceptions
+
+    return (exceptions.FailedPrecondition, exceptions.AlreadyExists, exceptions.NotFound)
+
+
+def _nested(data: dict[str, Any]) -> dict:
+    """Expand path keys such as ``("state", "origin")`` into nested maps."""
+    out: dict = {}
+    for key, value in data.items():
+        if not isinstance(key, tuple):
+            out[key] = copy.deepcopy(value)
+            continue
+        node = out
+        for part in key[:-1]:
+            node = node.setdefault(part, {})
+        node[key[-1]] = copy.deepcopy(value)
+    return out
+
+
+def _apply(target: dict, data: dict[str, Any]) -> dict:
+    """Apply top-level and path keys of ``data`` to ``target`` in place."""
+    for key, value in data.items():
+        if not isinstance(key, tuple):
+            target[key] = copy.deepcopy(value)
+            continue
+        node = target
+        for part in key[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        node[key[-1]] = copy.deepcopy(value)
+    return target
+
+
+def _lookup(data: dict, path: tuple) -> Any:
+    node: Any = data
+    for part in path:
+        if not isinstance(node, dict) or part not in node:
+            return _MISSING
+        node = node[part]
+    return node
+
+
+def _changed(base: dict, data: dict[str, Any], prefix: tuple = ()) -> dict[tuple, Any]:
+    """Leaf paths of ``data`` whose value differs from ``base``.
+
+    Maps are compared field by field, so a write of the whole ``state`` only
+    yields the state fields that were actually modified.
+    """
+    out: dict[tuple, Any] = {}
+    for key, value in data.items():
+        path = prefix + (key if isinstance(key, tuple) else (key,))
+        old = _lookup(base, path)
+        if isinstance(value, dict) and isinstance(old, dict):
+            out.update(_changed(base, value, path))
+        elif old != value:
+            out[path] = value
+    return out
+
+
+@dataclass
+class Session:
+    """Cached copy of a user document and the version it was read at."""
+
+    data: dict
+    version: Any = None
+    exists: bool = True
+    expires_at: float = 0.0
+
+
+class SessionCache:
+    """In-process LRU of user documents keyed by Slack ID with TTL expiry."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, slack_id: str) -> Session | None:
+        with self._lock:
+            session = self._items.get(slack_id)
+            if session is None:
+                return None
+            if session.expires_at <= time.monotonic():
+                del self._items[slack_id]
+                return None
+            self._items.move_to_end(slack_id)
+            return session
+
+    def put(self, slack_id: str, data: dict, version: Any = None, exists: bool = True) -> None:
+        if self.max_size <= 0:
+            return
+        session = Session(data, version, exists, time.monotonic() + self.ttl)
+        with self._lock:
+            self._items[slack_id] = session
+            self._items.move_to_end(slack_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, slack_id: str) -> None:
+        with self._lock:
+            self._items.pop(slack_id, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def _firestore_client():
+    from google.cloud import firestore
+
+    return firestore.Client.from_service_account_info(registry.service_account_info())
+
+
 class FirebaseService:
     def __init__(self):
-        creds_json = os.environ.get("service-account")
-        if not creds_json:
-            raise RuntimeError("service-account environment variable not set")
-        creds_info = json.loads(creds_json)
-        self.client = firestore.Client.from_service_account_info(creds_info)
+        registry.service_account_info()
+        self.client = registry.register("firestore", _firestore_client)
+        self._async_client = None
+        self.cache = SessionCache(
+            max_size=int(os.environ.get("SESSION_CACHE_SIZE", "1024")),
+            ttl=float(os.environ.get("SESSION_CACHE_TTL", "600")),
+        )
+
+    @property
+    def async_client(self):
+        """Firestore ``AsyncClient``, created on first use inside the event loop."""
+        if self._async_client is None:
+            from google.cloud import firestore
+
+            self._async_client = firestore.AsyncClient.from_service_account_info(registry.service_account_info())
+        return self._async_client
+
+    def _document(self, slack_id: str, client=None):
+        return (client or self.client).collection("users").document(slack_id)
+
+    def _remember(self, slack_id: str, doc) -> dict | None:
+        if doc.exists:
+            data = doc.to_dict()
+            self.cache.put(slack_id, copy.deepcopy(data), doc.update_time)
+            return data
+        self.cache.put(slack_id, {}, exists=False)
+        return None
 
     def get_user_data(self, slack_id: str) -> dict | None:
         if not self.client:
             return None
-        doc = self.client.collection("users").document(slack_id).get()
-        if doc.exists:
-            return doc.to_dict()
-        return None
+        session = self.cache.get(slack_id)
+        if session is not None:
+            metrics.cache_lookups.inc(cache="session", result="hit")
+            return copy.deepcopy(session.data) if session.exists else None
+        metrics.cache_lookups.inc(cache="session", result="miss")
+        metrics.external_call("firestore")
+        return self._remember(slack_id, self._document(slack_id).get())
+
+    async def get_user_data_async(self, slack_id: str) -> dict | None:
+        if not self.client:
+            return None
+        session = self.cache.get(slack_id)
+        if session is not None:
+            metrics.cache_lookups.inc(cache="session", result="hit")
+            return copy.deepcopy(session.data) if session.exists else None
+        metrics.cache_lookups.inc(cache="session", result="miss")
+        metrics.external_call("firestore")
+        doc = await self._document(slack_id, self.async_client).get()
+        return self._remember(slack_id, doc)
+
+    def _field_updates(self, data: dict[str, Any]) -> dict[str, Any]:
+        from google.cloud.firestore_v1.field_path import FieldPath
+
+        return {(FieldPath(*k) if isinstance(k, tuple) else FieldPath(k)).to_api_repr(): v for k, v in data.items()}
+
+    def _merged(self, session: Session, data: dict[str, Any]) -> dict:
+        return _apply(session.data if session.exists else {}, data)
+
+    def _write(self, client, ref, exists: bool, version: Any, data: dict[str, Any]):
+        """Write ``data`` only if the document is still at ``version``, or still absent."""
+        if exists:
+            return ref.update(self._field_updates(data), option=client.write_option(last_update_time=version))
+        return ref.create(_nested(data))
+
+    def _conflict_changes(self, slack_id: str, session: Session, data: dict[str, Any]) -> dict[tuple, Any]:
+        logger.info("User %s changed on another instance; reapplying this turn's changes", slack_id)
+        self.cache.invalidate(slack_id)
+        return _changed(session.data if session.exists else {}, data)
+
+    def _refreshed(self, slack_id: str, doc, changes: dict[tuple, Any], result) -> None:
+        stored = copy.deepcopy(doc.to_dict()) if doc.exists else {}
+        self.cache.put(slack_id, _apply(stored, changes), result.update_time)
 
     def save_user_data(self, slack_id: str, data: dict[str, Any]):
+        """Write ``data`` through to Firestore and the session cache.
+
+        Writes for cached users carry a precondition on the version they were
+        read at. If another instance changed the document in the meantime,
+        it is read again and only the fields this write modifies, compared
+        with the cached copy, are applied on top of it under a precondition
+        on the new version. Keys may be tuples naming a nested field, e.g.
+        ``("state", "origin")``.
+        """
         if not self.client:
             return
-        self.client.collection("users").document(slack_id).set(data, merge=True)
+        metrics.external_call("firestore")
+        ref = self._document(slack_id)
+        session = self.cache.get(slack_id)
+        if session is None:
+            ref.set(_nested(data), merge=True)
+            return
+        try:
+            result = self._write(self.client, ref, session.exists, session.version, data)
+        except _conflicts():
+            self._retry_conflict(slack_id, ref, self._conflict_changes(slack_id, session, data))
+            return
+        self.cache.put(slack_id, self._merged(session, data), result.update_time)
+
+    def _retry_conflict(self, slack_id: str, ref, changes: dict[tuple, Any]) -> None:
+        if not changes:
+            return
+        for _ in range(CONFLICT_RETRIES):
+            metrics.external_call("firestore")
+            doc = ref.get()
+            try:
+                result = self._write(self.client, ref, doc.exists, doc.update_time, changes)
+            except _conflicts():
+                continue
+            self._refreshed(slack_id, doc, changes, result)
+            return
+        logger.warning("User %s kept changing; merging this turn's changes unconditionally", slack_id)
+        ref.set(_nested(changes), merge=True)
+
+    async def save_user_data_async(self, slack_id: str, data: dict[str, Any]):
+        """Awaitable variant of :meth:`save_user_data`."""
+        if not self.client:
+            return
+        metrics.external_call("firestore")
+        client = self.async_client
+        ref = self._document(slack_id, client)
+        session = self.cache.get(slack_id)
+        if session is None:
+            await ref.set(_nested(data), merge=True)
+            return
+        try:
+            result = await self._write(client, ref, session.exists, session.version, data)
+        except _conflicts():
+            await self._retry_conflict_async(slack_id, client, ref, self._conflict_changes(slack_id, session, data))
+            return
+        self.cache.put(slack_id, self._merged(session, data), result.update_time)
+
+    async def _retry_conflict_async(self, slack_id: str, client, ref, changes: dict[tuple, Any]) -> None:
+        if not changes:
+            return
+        for _ in range(CONFLICT_RETRIES):
+            metrics.external_call("firestore")
+            doc = await ref.get()
+            try:
+                result = await self._write(client, ref, doc.exists, doc.update_time, changes)
+            except _conflicts():
+                continue
+            self._refreshed(slack_id, doc, changes, result)
+            return
+        logger.warning("User %s kept changing; merging this turn's changes unconditionally", slack_id)
+        await ref.set(_nested(changes), merge=True)
+
+
+class UserDataBatch:
+    """Unit of work collecting field updates to one user document.
+
+    Fields set during a turn are compared with the snapshot read at the
+    start of the turn and only the ones that actually changed are written,
+    in a single merged ``save_user_data`` call.
+    """
+
+    def __init__(self, firebase: FirebaseService, slack_id: str, snapshot: dict | None = None):
+        self.firebase = firebase
+        self.slack_id = slack_id
+        self._snapshot = copy.deepcopy(snapshot or {})
+        self._dirty: dict[str, Any] = {}
+
+    def set(self, field: str | tuple, value: Any) -> None:
+        self._dirty[field] = value
+
+    def update(self, data: dict[str, Any]) -> None:
+        self._dirty.update(data)
+
+    def _stored(self, field: str | tuple) -> Any:
+        return _lookup(self._snapshot, field if isinstance(field, tuple) else (field,))
+
+    def changes(self) -> dict[str, Any]:
+        return {k: v for k, v in self._dirty.items() if self._stored(k) != v}
+
+    def commit(self) -> bool:
+        """Write pending changes; return ``False`` when there was nothing to write."""
+        changes = self.changes()
+        self._dirty.clear()
+        if not changes:
+            return False
+        self.firebase.save_user_data(self.slack_id, changes)
+        _apply(self._snapshot, changes)
+        return True
+
+    async def commit_async(self) -> bool:
+        """Awaitable variant of :meth:`commit`."""
+        changes = self.changes()
+        self._dirty.clear()
+        if not changes:
+            return False
+        await self.firebase.save_user_data_async(self.slack_id, changes)
+        _apply(self._snapshot, changes)
+        return True
@@ -0,0 +1,276 @@
+"""Offline airport gazetteer with typo-tolerant lookups.
+
+The bundled ``data/airports.tsv.gz`` maps accent-insensitive place names
+(cities, metro areas and airport names) to IATA codes. It is generated
+from the `airportsdata <https://pypi.org/project/airportsdata/>`_ CSV files
+(MIT licensed) with::
+
+    python -m services.gazetteer airports.csv iata_macs.csv services/data/airports.tsv.gz
+
+Each line is ``KEY<TAB>CODE<TAB>FUZZY`` where ``FUZZY`` is ``1`` for names of
+international airports and metro areas, the only ones considered for
+approximate matches.
+"""
+
+from __future__ import annotations
+
+import csv
+import gzip
+import os
+import re
+import sys
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Optional
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "airports.tsv.gz")
+
+# Spanish/English names travelers use that the source data spells differently
+# or where the metro code should win over a single airport.
+ALIASES = {
+    "CDMX": "MEX",
+    "CIUDAD DE MEXICO": "MEX",
+    "MEXICO CITY": "MEX",
+    "GUADALAJARA": "GDL",
+    "MONTERREY": "MTY",
+    "CANCUN": "CUN",
+    "TIJUANA": "TIJ",
+    "PUERTO VALLARTA": "PVR",
+    "LOS CABOS": "SJD",
+    "MERIDA": "MID",
+    "OAXACA": "OAX",
+    "PUEBLA": "PBC",
+    "QUERETARO": "QRO",
+    "SAN LUIS POTOSI": "SLP",
+    "CIUDAD JUAREZ": "CJS",
+    "NUEVA YORK": "NYC",
+    "NEW YORK": "NYC",
+    "WASHINGTON": "WAS",
+    "CHICAGO": "CHI",
+    "HOUSTON": "HOU",
+    "DALLAS": "DFW",
+    "ORLANDO": "MCO",
+    "FILADELFIA": "PHL",
+    "NUEVA ORLEANS": "MSY",
+    "TORONTO": "YTO",
+    "MONTREAL": "YMQ",
+    "LONDRES": "LON",
+    "PARIS": "PAR",
+    "ROMA": "ROM",
+    "MILAN": "MIL",
+    "MUNICH": "MUC",
+    "FRANCFORT": "FRA",
+    "GINEBRA": "GVA",
+    "BRUSELAS": "BRU",
+    "ESTOCOLMO": "STO",
+    "COPENHAGUE": "CPH",
+    "LISBOA": "LIS",
+    "ATENAS": "ATH",
+    "ESTAMBUL": "IST",
+    "MOSCU": "MOW",
+    "VIENA": "VIE",
+    "PRAGA": "PRG",
+    "VARSOVIA": "WAW",
+    "BERLIN": "BER",
+    "EDIMBURGO": "EDI",
+    "MADRID": "MAD",
+    "BARCELONA": "BCN",
+    "SEVILLA": "SVQ",
+    "VALENCIA": "VLC",
+    "EL CAIRO": "CAI",
+    "CIUDAD DEL CABO": "CPT",
+    "NUEVA DELHI": "DEL",
+    "BOMBAY": "BOM",
+    "PEKIN": "BJS",
+    "TOKIO": "TYO",
+    "TOKYO": "TYO",
+    "SEUL": "SEL",
+    "SINGAPUR": "SIN",
+    "BOGOTA": "BOG",
+    "LIMA": "LIM",
+    "SANTIAGO DE CHILE": "SCL",
+    "BUENOS AIRES": "BUE",
+    "SAO PAULO": "SAO",
+    "SAN PABLO": "SAO",
+    "RIO DE JANEIRO": "RIO",
+    "LA HABANA": "HAV",
+    "CIUDAD DE PANAMA": "PTY",
+    "PANAMA": "PTY",
+    "SAN JOSE DE COSTA RICA": "SJO",
+    "CIUDAD DE GUATEMALA": "GUA",
+    "SAN SALVADOR": "SAL",
+    "QUITO": "UIO",
+    "CARACAS": "CCS",
+    "MONTEVIDEO": "MVD",
+    "ASUNCION": "ASU",
+}
+
+_AIRPORT_WORDS = re.compile(
+    r"\b(INTERNATIONAL|INTERNACIONAL|INTL|AIRPORT|AEROPUERTO|REGIONAL|MUNICIPAL|FIELD|AIRFIELD)\b"
+)
+
+
+def normalize(text: str) -> str:
+    """Return ``text`` upper-cased and without diacritics."""
+    text = text.upper()
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def _key(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", normalize(text)).split())
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class Gazetteer:
+    """Exact and approximate place name to IATA code lookups."""
+
+    def __init__(self, names: Dict[str, str], fuzzy_names: set[str]) -> None:
+        self.names = names
+        self.codes = set(names.values())
+        self._fuzzy_names = fuzzy_names
+        self._index: dict[str, list[str]] | None = None
+        self._city_names: dict[str, str] | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str = DATA_PATH) -> "Gazetteer":
+        names: Dict[str, str] = {}
+        fuzzy: set[str] = set()
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                key, code, flag = line.rstrip("\n").split("\t")
+                names[key] = code
+                if flag == "1":
+                    fuzzy.add(key)
+        names.update(ALIASES)
+        fuzzy.update(ALIASES)
+        return cls(names, fuzzy)
+
+    def _trigram_index(self) -> dict[str, list[str]]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index: dict[str, list[str]] = defaultdict(list)
+                    for name in self._fuzzy_names:
+                        for gram in _trigrams(name):
+                            index[gram].append(name)
+                    self._index = dict(index)
+        return self._index
+
+    def lookup(self, name: str) -> Optional[str]:
+        return self.names.get(_key(name))
+
+    def fuzzy_lookup(self, name: str) -> Optional[str]:
+        """Return the code of the closest known name within a small edit distance."""
+        key = _key(name)
+        if key in self.names:
+            return self.names[key]
+        if len(key) < 5:
+            return None
+        limit = 1 if len(key) < 8 else 2
+        index = self._trigram_index()
+        grams = _trigrams(key)
+        overlap: dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in index.get(gram, ()):
+                overlap[candidate] += 1
+        best: tuple[int, str] | None = None
+        for candidate, shared in sorted(overlap.items(), key=lambda x: -x[1])[:20]:
+            if shared * 2 < len(grams) or candidate[0] != key[0]:
+                continue
+            dist = _distance(key, candidate, limit)
+            if dist <= limit and (best is None or dist < best[0]):
+                best = (dist, candidate)
+        return self.names[best[1]] if best else None
+
+    def city_name(self, code: str) -> Optional[str]:
+        """Shortest place name mapped to ``code`` ("MAD" -> "MADRID")."""
+        if self._city_names is None:
+            with self._lock:
+                if self._city_names is None:
+                    best: dict[str, str] = {}
+                    for name, value in self.names.items():
+                        if name != value and (value not in best or len(name) < len(best[value])):
+                            best[value] = name
+                    self._city_names = best
+        return self._city_names.get(code)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.codes
+
+
+_gazetteer: Gazetteer | None = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Load the bundled gazetteer on first use."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.load()
+    return _gazetteer
+
+
+def build(airports_csv: str, macs_csv: str, out_path: str) -> int:
+    """Write the compact gazetteer file from the airportsdata CSV files."""
+    # Lower rank wins when several airports share a name.
+    entries: dict[str, tuple[int, str, bool]] = {}
+
+    def add(name: str, code: str, rank: int, fuzzy: bool) -> None:
+        key = _key(name)
+        if len(key) < 3:
+            return
+        current = entries.get(key)
+        if current is None or rank < current[0]:
+            entries[key] = (rank, code, fuzzy)
+
+    with open(macs_csv, encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            add(row["City Name"], row["City Code"], 0, True)
+    with open(airports_csv, encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            code = row["iata"]
+            if not code:
+                continue
+            international = bool(re.search(r"Int(ernationa)?l\b|Intl", row["name"]))
+            rank = 1 if international else 2
+            add(row["city"], code, rank, international)
+            stripped = _AIRPORT_WORDS.sub(" ", _key(row["name"]))
+            if len(stripped.split()) >= 2:
+                add(stripped, code, rank, False)
+            add(code, code, rank, False)
+
+    with gzip.open(out_path, "wt", encoding="utf-8", compresslevel=9) as fh:
+        for key in sorted(entries):
+            _, code, fuzzy = entries[key]
+            fh.write(f"{key}\t{code}\t{int(fuzzy)}\n")
+    return len(entries)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit("usage: python -m services.gazetteer airports.csv iata_macs.csv out.tsv.gz")
+    print(build(*sys.argv[1:]), "names written")
@@ -0,0 +1,379 @@
+"""Conversation history per Slack thread.
+
+Every ``(user, thread_ts)`` pair has its own conversation: a log of
+compact turns ``{"n": seq, "u": user text, "b": bot reply}`` plus a short
+summary of the turns that no longer fit. A turn is stored with a single
+append (``ArrayUnion`` on Firestore), so the write size stays constant
+instead of growing with the history. Once more than ``keep + compact_every``
+turns are logged, the oldest are folded into the summary and removed in the
+same write. Conversations idle for ``ttl`` seconds start over; their
+documents carry ``expires_at`` for a Firestore TTL policy.
+
+Turn numbers are only allocated against the version of the document they
+were read at: every append carries a precondition on it, and when another
+instance appended first the conversation is read again and the turn is
+renumbered on top of it.
+"""
+
+import copy
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+from . import metrics
+from .firebase import CONFLICT_RETRIES, SessionCache, _conflicts
+
+logger = logging.getLogger(__name__)
+
+# Summary size in characters and length of each summarized message.
+SUMMARY_MAX_CHARS = 800
+SUMMARY_ITEM_CHARS = 120
+
+# Version passed to ``write`` to append without a precondition.
+ANY_VERSION = object()
+
+
+class HistoryConflict(Exception):
+    """The conversation changed since the version a write was conditioned on."""
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def summarize(summary: str, turns: List[dict]) -> str:
+    """Fold ``turns`` into ``summary`` keeping what the user asked for.
+
+    The travel facts themselves live in ``TravelState``; the summary only
+    keeps the gist of older requests, newest last, within
+    ``SUMMARY_MAX_CHARS``.
+    """
+    items = [s for s in summary.split(" | ") if s] if summary else []
+    for turn in turns:
+        text = " ".join(turn.get("u", "").split())
+        if text:
+            items.append(text if len(text) <= SUMMARY_ITEM_CHARS else text[: SUMMARY_ITEM_CHARS - 1] + "…")
+    while items and len(" | ".join(items)) > SUMMARY_MAX_CHARS:
+        items.pop(0)
+    return " | ".join(items)
+
+
+@dataclass
+class Conversation:
+    """Turns of one thread as loaded for this message."""
+
+    key: str
+    turns: List[dict] = field(default_factory=list)
+    summary: str = ""
+    # Expired or never stored: the next write replaces the document.
+    fresh: bool = True
+    # False when the stored turns could not be read for this message.
+    loaded: bool = True
+    # Version of the stored document the turns match; ``None`` when absent.
+    version: Any = None
+
+    @property
+    def next_n(self) -> int:
+        if self.turns:
+            return self.turns[-1]["n"] + 1
+        # Unknown stored turns: number from the clock so this one sorts after them.
+        return 0 if self.loaded else time.time_ns() // 1_000_000
+
+    def messages(self) -> List[dict]:
+        """Turns as ``{"user": ...}`` / ``{"bot": ...}`` messages, oldest first."""
+        out: List[dict] = []
+        for turn in self.turns:
+            out.append({"user": turn.get("u", "")})
+            if "b" in turn:
+                out.append({"bot": turn["b"]})
+        return out
+
+
+class MemoryHistoryBackend:
+    """In-process conversations for a single worker or for tests."""
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._docs: OrderedDict[str, dict] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[Optional[dict], Any]:
+        """Return the document of ``key`` and its version, ``(None, None)`` when absent."""
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                return None, None
+            return copy.deepcopy(doc), self._versions[key]
+
+    async def get_async(self, key: str) -> tuple[Optional[dict], Any]:
+        return self.get(key)
+
+    def write(
+        self,
+        key: str,
+        turn: dict,
+        removed: List[dict],
+        summary: Optional[str],
+        expires_at,
+        reset: bool,
+        version: Any = ANY_VERSION,
+    ) -> int:
+        """Append ``turn`` if the document is still at ``version``; return its new version."""
+        with self._lock:
+            doc = self._docs.get(key)
+            current = self._versions.get(key) if doc is not None else None
+            if version is not ANY_VERSION and version != current:
+                raise HistoryConflict(key)
+            if reset or doc is None:
+                doc = {"turns": [], "summary": ""}
+            doc["turns"] = [t for t in doc["turns"] if t not in removed] + [turn]
+            if summary is not None:
+                doc["summary"] = summary
+            doc["expires_at"] = expires_at
+            self._docs[key] = doc
+            self._docs.move_to_end(key)
+            self._versions[key] = (current or 0) + 1
+            while len(self._docs) > self.max_size:
+                self._versions.pop(self._docs.popitem(last=False)[0], None)
+            return self._versions[key]
+
+    async def write_async(self, *args) -> int:
+        return self.write(*args)
+
+
+class FirestoreHistoryBackend:
+    """Conversations as documents of ``collection`` shared by all instances.
+
+    Configure a Firestore TTL policy on ``expires_at`` so idle conversations
+    are deleted automatically.
+    """
+
+    def __init__(self, firebase, collection: str = "conversations") -> None:
+        self.firebase = firebase
+        self.collection = collection
+
+    def _document(self, key: str, client=None):
+        return (client or self.firebase.client).collection(self.collection).document(key.replace("/", "_"))
+
+    @staticmethod
+    def _data(snapshot) -> tuple[Optional[dict], Any]:
+        if not snapshot.exists:
+            return None, None
+        return snapshot.to_dict(), snapshot.update_time
+
+    def get(self, key: str) -> tuple[Optional[dict], Any]:
+        """Return the document of ``key`` and its ``update_time``, ``(None, None)`` when absent."""
+        metrics.external_call("firestore")
+        return self._data(self._document(key).get())
+
+    async def get_async(self, key: str) -> tuple[Optional[dict], Any]:
+        metrics.external_call("firestore")
+        return self._data(await self._document(key, self.firebase.async_client).get())
+
+    @staticmethod
+    def _updates(turn: dict, summary: Optional[str], expires_at, reset: bool) -> dict:
+        from google.cloud import firestore
+
+        data = {"turns": [turn] if reset else firestore.ArrayUnion([turn]), "expires_at": expires_at}
+        if reset:
+            data["summary"] = summary or ""
+        elif summary is not None:
+            data["summary"] = summary
+        return data
+
+    def _batch(self, client, key: str, turn: dict, removed: List[dict], summary, expires_at, reset: bool, version):
+        """Batch appending ``turn``, conditioned on ``version`` like :meth:`MemoryHistoryBackend.write`."""
+        from google.cloud import firestore
+
+        ref = self._document(key, client)
+        batch = client.batch()
+        data = self._updates(turn, summary, expires_at, reset)
+        if version is ANY_VERSION:
+            batch.set(ref, data, merge=not reset)
+        elif version is None:
+            batch.create(ref, data)
+        else:
+            batch.update(ref, data, option=client.write_option(last_update_time=version))
+        if removed and not reset:
+            batch.update(ref, {"turns": firestore.ArrayRemove(removed)})
+        return batch
+
+    def write(
+        self,
+        key: str,
+        turn: dict,
+        removed: List[dict],
+        summary: Optional[str],
+        expires_at,
+        reset: bool,
+        version: Any = ANY_VERSION,
+    ):
+        """Append ``turn`` if the document is still at ``version``; return its new ``update_time``."""
+        metrics.external_call("firestore")
+        batch = self._batch(self.firebase.client, key, turn, removed, summary, expires_at, reset, version)
+        try:
+            return batch.commit()[-1].update_time
+        except _conflicts() as e:
+            raise HistoryConflict(key) from e
+
+    async def write_async(
+        self,
+        key: str,
+        turn: dict,
+        removed: List[dict],
+        summary: Optional[str],
+        expires_at,
+        reset: bool,
+        version: Any = ANY_VERSION,
+    ):
+        metrics.external_call("firestore")
+        batch = self._batch(self.firebase.async_client, key, turn, removed, summary, expires_at, reset, version)
+        try:
+            return (await batch.commit())[-1].update_time
+        except _conflicts() as e:
+            raise HistoryConflict(key) from e
+
+
+class ConversationStore:
+    """Load and append conversation turns through ``backend``.
+
+    Loaded conversations are kept in a write-through LRU so a reply in an
+    active thread costs one append and no read. Each append is conditioned
+    on the version the cached turns were read at, so turns appended by
+    another instance are read again instead of sharing a turn number.
+    """
+
+    def __init__(
+        self,
+        backend,
+        ttl: float = 7 * 24 * 3600,
+        keep: int = 10,
+        compact_every: int = 5,
+        cache_size: int = 1024,
+        cache_ttl: float = 600.0,
+        summarizer: Callable[[str, List[dict]], str] = summarize,
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.keep = keep
+        self.compact_every = compact_every
+        self.summarizer = summarizer
+        self.cache = SessionCache(max_size=cache_size, ttl=cache_ttl)
+
+    @staticmethod
+    def key(slack_id: str, thread_ts: str | None) -> str:
+        return f"{slack_id}:{thread_ts}" if thread_ts else slack_id
+
+    def _cached(self, key: str) -> Optional[Conversation]:
+        session = self.cache.get(key)
+        if session is None:
+            metrics.cache_lookups.inc(cache="conversation", result="miss")
+            return None
+        metrics.cache_lookups.inc(cache="conversation", result="hit")
+        if session.version <= _now():
+            self.cache.invalidate(key)
+            return Conversation(key, version=session.data.version)
+        return session.data
+
+    @staticmethod
+    def _parse(key: str, doc: Optional[dict], version: Any) -> Conversation:
+        if not doc or not doc.get("expires_at") or doc["expires_at"] <= _now():
+            # The next write replaces the expired document, if it is still at ``version``.
+            return Conversation(key, version=version)
+        turns = sorted(doc.get("turns", []), key=lambda t: t.get("n", 0))
+        return Conversation(key, turns, doc.get("summary", ""), fresh=False, version=version)
+
+    def _from_doc(self, key: str, stored: tuple) -> Conversation:
+        doc, version = stored
+        conversation = self._parse(key, doc, version)
+        if not conversation.fresh:
+            self.cache.put(key, conversation, doc["expires_at"])
+        return conversation
+
+    def load(self, slack_id: str, thread_ts: str | None = None) -> Conversation:
+        key = self.key(slack_id, thread_ts)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        return self._from_doc(key, self.backend.get(key))
+
+    async def load_async(self, slack_id: str, thread_ts: str | None = None) -> Conversation:
+        key = self.key(slack_id, thread_ts)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        return self._from_doc(key, await self.backend.get_async(key))
+
+    def _reload(self, conversation: Conversation, stored: tuple) -> None:
+        """Replace the turns of ``conversation`` with the stored ones after a conflict."""
+        logger.info("Conversation %s changed on another instance; renumbering this turn", conversation.key)
+        current = self._parse(conversation.key, *stored)
+        conversation.turns, conversation.summary = current.turns, current.summary
+        conversation.fresh, conversation.version = current.fresh, current.version
+
+    def _version(self, conversation: Conversation, attempt: int) -> Any:
+        """Precondition of the write: none for unread turns or once ``CONFLICT_RETRIES`` are used up."""
+        if not conversation.loaded or attempt >= CONFLICT_RETRIES:
+            if conversation.loaded:
+                logger.warning("Conversation %s kept changing; appending unconditionally", conversation.key)
+            return ANY_VERSION
+        return conversation.version
+
+    def _append(self, conversation: Conversation, user_text: str, reply: str) -> tuple:
+        """Apply the turn to ``conversation`` and return the backend write arguments."""
+        turn = {"n": conversation.next_n, "u": user_text, "b": reply}
+        reset = conversation.fresh
+        if reset:
+            conversation.turns, conversation.summary = [], ""
+        conversation.turns.append(turn)
+        removed: List[dict] = []
+        summary = None
+        if len(conversation.turns) > self.keep + self.compact_every:
+            removed = conversation.turns[: -self.keep]
+            conversation.turns = conversation.turns[-self.keep :]
+            summary = conversation.summary = self.summarizer(conversation.summary, removed)
+        if reset:
+            # A fresh document already excludes the removed turns.
+            removed = []
+        conversation.fresh = False
+        expires_at = _now() + datetime.timedelta(seconds=self.ttl)
+        return conversation.key, turn, removed, summary, expires_at, reset
+
+    def _written(self, conversation: Conversation, expires_at, version: Any) -> None:
+        conversation.version = version
+        if conversation.loaded:
+            self.cache.put(conversation.key, conversation, expires_at)
+        else:
+            # Holds only this turn; the next message reads the whole log again.
+            self.cache.invalidate(conversation.key)
+
+    def append(self, conversation: Conversation, user_text: str, reply: str) -> None:
+        self.cache.invalidate(conversation.key)
+        for attempt in range(CONFLICT_RETRIES + 1):
+            version = self._version(conversation, attempt)
+            args = self._append(conversation, user_text, reply)
+            try:
+                written = self.backend.write(*args, version)
+            except HistoryConflict:
+                self._reload(conversation, self.backend.get(conversation.key))
+                continue
+            self._written(conversation, args[4], written)
+            return
+
+    async def append_async(self, conversation: Conversation, user_text: str, reply: str) -> None:
+        self.cache.invalidate(conversation.key)
+        for attempt in range(CONFLICT_RETRIES + 1):
+            version = self._version(conversation, attempt)
+            args = self._append(conversation, user_text, reply)
+            try:
+                written = await self.backend.write_async(*args, version)
+            except HistoryConflict:
+                self._reload(conversation, await self.backend.get_async(conversation.key))
+                continue
+            self._written(conversation, args[4], written)
+            return
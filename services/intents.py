@@ -0,0 +1,167 @@
+"""Deterministic replies for turns that do not need the LLM."""
+
+import re
+import threading
+from collections import Counter
+from typing import List, Optional
+
+from .gazetteer import normalize
+from .state import TravelState
+
+GREETINGS = {
+    "HOLA", "HOLA BUENOS DIAS", "BUENOS DIAS", "BUENAS TARDES", "BUENAS NOCHES", "BUEN DIA",
+    "QUE TAL", "HOLA QUE TAL", "HEY", "HI", "HELLO",
+}
+THANKS = {"GRACIAS", "MUCHAS GRACIAS", "MIL GRACIAS", "GRACIAS MIL", "THANKS", "THANK YOU"}
+CONFIRMATIONS = {
+    "SI", "OK", "OKAY", "VA", "DALE", "CLARO", "LISTO", "PERFECTO", "CORRECTO", "DE ACUERDO",
+    "SI GRACIAS", "SI CLARO", "SI PERFECTO",
+}
+
+REQUIRED_FIELDS = ["origin", "destination", "start_date", "end_date", "venue"]
+
+FIELD_QUESTIONS = {
+    "origin": "¿Desde qué ciudad sales?",
+    "destination": "¿A qué ciudad viajas?",
+    "start_date": "¿Qué día sales? (por ejemplo 2025-03-14)",
+    "end_date": "¿Qué día regresas?",
+    "venue": "¿Cuál es el motivo del viaje o el venue del evento?",
+}
+
+# Fields answered in free text, filled directly from the reply to their question.
+FREE_TEXT_FIELDS = {"venue"}
+
+FIELD_LABELS = {
+    "origin": "origen",
+    "destination": "destino",
+    "start_date": "salida",
+    "end_date": "regreso",
+    "venue": "motivo",
+    "seat_pref": "asiento",
+    "flight_pref": "vuelo",
+    "budget": "presupuesto",
+    "share_room": "compartir habitación",
+    "passport": "pasaporte",
+    "visa": "visa",
+}
+
+# Longer messages probably carry more than slot values and go to the LLM.
+MAX_SLOT_REPLY_WORDS = 12
+
+
+def canonical(text: str) -> str:
+    """Upper-case ``text`` without accents, punctuation or repeated spaces."""
+    return " ".join(re.sub(r"[^\w\s]", " ", normalize(text)).split())
+
+
+_QUESTION_WORDS = {"QUE", "CUANTO", "CUANTA", "CUANTOS", "CUANTAS", "CUAL", "CUALES", "COMO", "DONDE",
+                   "CUANDO", "PUEDO", "PUEDE", "SE", "HAY", "DEBO", "NECESITO", "ES", "EXISTE"}
+
+# Travel policy topics whose answer is the same for every traveler.
+POLICY_TOPICS = {
+    "MALETA", "MALETAS", "EQUIPAJE", "CARRY", "DOCUMENTADA", "DOCUMENTAR", "VIATICO", "VIATICOS",
+    "REEMBOLSO", "REEMBOLSOS", "REEMBOLSAN", "FACTURA", "FACTURAS", "FACTURAR", "COMPROBANTE",
+    "COMPROBANTES", "POLITICA", "POLITICAS", "ANTICIPACION", "PROPINA", "PROPINAS",
+}
+
+# Words that point at something in the conversation ("¿cuál me recomiendas?",
+# "¿a qué hora sale?"), so the answer depends on its context.
+_DEICTIC_WORDS = {
+    "CUAL", "CUALES", "ESE", "ESA", "ESOS", "ESAS", "ESO", "ESTE", "ESTA", "ESTOS", "ESTAS", "ESTO",
+    "AQUEL", "AQUELLA", "MAS", "MENOS", "MEJOR", "PEOR", "RECOMIENDAS", "RECOMIENDA", "OPCION",
+    "OPCIONES", "SALE", "LLEGA", "MI", "MIS", "MIO", "MIA", "FECHA", "FECHAS", "VUELO", "HOTEL",
+    "RESERVA", "RESERVACION",
+}
+
+
+def is_general_question(text: str) -> bool:
+    """Whether ``text`` is a standalone policy question whose answer holds for anyone.
+
+    It must name a topic of ``POLICY_TOPICS``. Follow-ups ("¿y el hotel?"),
+    references to the conversation ("¿cuál es más barato?"), numbers, dates
+    and proper nouns such as cities tie a question to one traveler.
+    """
+    words = canonical(text).split()
+    if len(words) < 2 or re.search(r"\d", text):
+        return False
+    if "?" not in text and words[0] not in _QUESTION_WORDS:
+        return False
+    if words[0] in {"Y", "E", "O", "PERO", "ENTONCES"}:
+        return False
+    if not POLICY_TOPICS.intersection(words) or _DEICTIC_WORDS.intersection(words):
+        return False
+    tokens = re.findall(r"\w+", text)
+    return not any(t[0].isupper() for t in tokens[1:])
+
+
+def _format(value) -> str:
+    if isinstance(value, bool):
+        return "sí" if value else "no"
+    return str(value)
+
+
+class FastPath:
+    """Answer greetings, thanks, confirmations and slot follow-ups from templates.
+
+    ``counts`` records how many turns took each path ("rules" or "llm") so
+    the share of turns served without an LLM call can be measured.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.counts: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, path: str) -> None:
+        with self._lock:
+            self.counts[path] += 1
+
+    @staticmethod
+    def missing(state: TravelState) -> List[str]:
+        return [f for f in REQUIRED_FIELDS if not getattr(state, f)]
+
+    def reply(self, state: TravelState, known: dict, history: List[dict], text: str) -> Optional[str]:
+        """Return a templated reply, or ``None`` when the LLM should answer.
+
+        ``known`` is the state before this message was parsed and ``history``
+        the conversation before it.
+        """
+        if not self.enabled:
+            return None
+        message = canonical(text)
+        if not message:
+            return None
+        missing = self.missing(state)
+
+        if message in GREETINGS:
+            # Mid-conversation the greeting may open a new request the LLM should read.
+            if history:
+                return None
+            if not known:
+                return "¡Hola! 👋 Soy tu asistente de viajes. Cuéntame de tu viaje: " + FIELD_QUESTIONS[missing[0]].lower()
+            if missing:
+                return "¡Hola de nuevo! Sigamos con tu viaje. " + FIELD_QUESTIONS[missing[0]]
+            return None
+
+        if message in THANKS:
+            return "¡Con gusto! Si necesitas algo más de tu viaje, aquí estoy."
+
+        last_bot = history[-1].get("bot") if history else None
+        asked = next((f for f, q in FIELD_QUESTIONS.items() if last_bot and last_bot.endswith(q)), None)
+        if asked in FREE_TEXT_FIELDS and asked in missing and message not in CONFIRMATIONS and "?" not in text:
+            setattr(state, asked, text.strip())
+            missing = self.missing(state)
+
+        added = {k: v for k, v in state.to_dict().items() if known.get(k) != v}
+
+        if message in CONFIRMATIONS:
+            # A "sí" only means "go on" after one of our own questions; after
+            # anything else (e.g. "¿Quieres que reserve?") the LLM must answer it.
+            if asked is None or added or not missing:
+                return None
+            return FIELD_QUESTIONS[missing[0]]
+
+        if added and missing and "?" not in text and len(message.split()) <= MAX_SLOT_REPLY_WORDS:
+            summary = ", ".join(f"{FIELD_LABELS.get(k, k)} {_format(v)}" for k, v in added.items())
+            return f"Anotado: {summary}. {FIELD_QUESTIONS[missing[0]]}"
+        return None
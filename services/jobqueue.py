@@ -0,0 +1,160 @@
+"""Durable queue of Slack events between the web tier and the consumers.
+
+The web process only verifies, enqueues and acknowledges an event; a
+separate consumer pool (``worker.py``) leases jobs and runs the assistant.
+Delivery is at least once: a lease that is not completed within
+``visibility_timeout`` (worker killed mid-call) makes the job available
+again, and failed jobs are retried with exponential backoff. Expired leases
+and failures both count toward ``max_attempts``, after which the job is
+kept as ``dead`` for inspection. A consumer can store the reply it
+generated with ``save_reply``; later deliveries carry it in the payload
+under ``"_reply"`` so a retry only has to post it.
+Jobs are keyed by an idempotency key (the Slack ``event_id``), so
+redeliveries are enqueued once, and jobs of the same ``group`` (user) are
+never leased concurrently, preserving per-user ordering.
+
+``SqliteJobQueue`` serves a single host. Hosted queues (Cloud Tasks,
+Pub/Sub) can replace it by implementing ``enqueue``, ``lease``,
+``complete``, ``fail`` and ``stats``.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    payload: dict
+    attempts: int
+
+
+class SqliteJobQueue:
+    def __init__(
+        self,
+        path: str,
+        visibility_timeout: float = 120.0,
+        max_attempts: int = 5,
+        backoff: float = 2.0,
+        max_backoff: float = 300.0,
+    ) -> None:
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, grp TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "available_at REAL NOT NULL, leased_until REAL NOT NULL DEFAULT 0, "
+                "error TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+            try:
+                conn.execute("ALTER TABLE jobs ADD COLUMN reply TEXT")
+            except sqlite3.OperationalError:
+                pass  # Column already present.
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, job_id: str, payload: dict, group: str = "") -> bool:
+        """Store a job; return ``False`` when ``job_id`` was already enqueued."""
+        now = time.time()
+        cur = self._connect().execute(
+            "INSERT OR IGNORE INTO jobs (id, grp, payload, status, available_at, created_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, group or job_id, json.dumps(payload), now, now),
+        )
+        return cur.rowcount == 1
+
+    def lease(self) -> Optional[Job]:
+        """Claim the oldest ready job whose group has nothing in flight."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases belong to workers that died; deliver them again
+            # unless they already used every attempt (the job may be what
+            # kills the worker).
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', leased_until = 0, error = 'lease expired' "
+                "WHERE status = 'running' AND leased_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND leased_until < ?", (now,)
+            )
+            row = conn.execute(
+                "SELECT id, payload, attempts, reply FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                "AND grp NOT IN (SELECT grp FROM jobs WHERE status = 'running') "
+                "ORDER BY available_at, rowid LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, leased_until = ? WHERE id = ?",
+                (now + self.visibility_timeout, row[0]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        payload = json.loads(row[1])
+        if row[3] is not None:
+            payload["_reply"] = row[3]
+        return Job(row[0], payload, row[2] + 1)
+
+    def save_reply(self, job_id: str, reply: str) -> None:
+        """Remember the reply generated for ``job_id`` so a retry does not run the turn again."""
+        self._connect().execute("UPDATE jobs SET reply = ? WHERE id = ?", (reply, job_id))
+
+    def complete(self, job: Job) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', leased_until = 0, error = NULL WHERE id = ?", (job.id,)
+        )
+
+    def fail(self, job: Job, error: str) -> None:
+        """Schedule a retry with backoff, or mark the job dead after ``max_attempts``."""
+        if job.attempts >= self.max_attempts:
+            logger.error("Job %s failed %d times, giving up: %s", job.id, job.attempts, error)
+            self._connect().execute(
+                "UPDATE jobs SET status = 'dead', leased_until = 0, error = ? WHERE id = ?", (error, job.id)
+            )
+            return
+        delay = min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff)
+        logger.warning("Job %s failed (attempt %d), retrying in %.0fs: %s", job.id, job.attempts, delay, error)
+        self._connect().execute(
+            "UPDATE jobs SET status = 'queued', leased_until = 0, available_at = ?, error = ? WHERE id = ?",
+            (time.time() + delay, error, job.id),
+        )
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs created more than ``older_than`` seconds ago."""
+        cur = self._connect().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND created_at < ?", (time.time() - older_than,)
+        )
+        return cur.rowcount
+
+    def stats(self) -> dict[str, int]:
+        counts = {"queued": 0, "running": 0, "done": 0, "dead": 0}
+        for status, count in self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
@@ -0,0 +1,361 @@
+"""Fault-tolerant access to the language models behind ``ConversationalAI``.
+
+``ResilientLLM`` walks an ordered chain of backends (Gemini Flash, then
+lighter Gemini models, then an optional OpenAI-compatible endpoint serving
+an open-source model). Every attempt gets a timeout cut from one overall
+deadline, transient errors are retried with jittered backoff, and each
+backend has a circuit breaker that stops calling it after repeated
+failures and lets a single probe through once ``reset_timeout`` has passed.
+When the whole chain fails the caller falls back to a canned reply.
+"""
+
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, List, Optional
+
+import httpx
+import requests
+
+from . import metrics, transport
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(exc: Exception) -> bool:
+    """Whether retrying the same backend might succeed."""
+    code = getattr(exc, "code", None)
+    if not isinstance(code, int):
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    if code in TRANSIENT_CODES:
+        return True
+    return isinstance(
+        exc, (TimeoutError, asyncio.TimeoutError, httpx.TransportError, requests.ConnectionError, requests.Timeout)
+    )
+
+
+class StreamTruncated(Exception):
+    """Raised by :meth:`ResilientLLM.stream` after the chunks of a reply that was cut short."""
+
+
+class CircuitBreaker:
+    """Closed until ``threshold`` consecutive failures, then open for ``reset_timeout`` seconds.
+
+    After that one half-open probe is allowed; its success closes the
+    breaker and its failure opens it again.
+    """
+
+    def __init__(self, threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class GeminiBackend:
+    """One Gemini model, optionally with the system instruction in a context cache."""
+
+    def __init__(self, client, model: str, context_cache: bool = False, context_cache_ttl: int = 3600) -> None:
+        self.client = client
+        self.name = model
+        self.context_cache = context_cache
+        self.context_cache_ttl = context_cache_ttl
+        self._context_caches: dict[str, tuple[str | None, float]] = {}
+
+    @property
+    def _types(self):
+        from google.genai import types
+
+        return types
+
+    def _cached_content(self, system_instruction: str, timeout: float) -> str | None:
+        key = hashlib.sha256(system_instruction.encode()).hexdigest()
+        name, expires = self._context_caches.get(key, (None, 0.0))
+        if expires > time.monotonic():
+            return name
+        try:
+            cache = self.client.caches.create(
+                model=self.name,
+                config=self._types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{self.context_cache_ttl}s",
+                    http_options=self._types.HttpOptions(timeout=int(timeout * 1000)),
+                ),
+            )
+            name = cache.name
+        except Exception as e:
+            logger.warning("Context cache unavailable, sending instruction inline: %s", e)
+            name = None
+        # Renew a little before Gemini expires the cache.
+        self._context_caches[key] = (name, time.monotonic() + self.context_cache_ttl * 0.9)
+        return name
+
+    def _config(self, system_instruction: str | None, timeout: float):
+        http_options = self._types.HttpOptions(timeout=int(timeout * 1000))
+        if not system_instruction:
+            return self._types.GenerateContentConfig(http_options=http_options)
+        cached = self._cached_content(system_instruction, timeout) if self.context_cache else None
+        if cached:
+            return self._types.GenerateContentConfig(cached_content=cached, http_options=http_options)
+        return self._types.GenerateContentConfig(system_instruction=system_instruction, http_options=http_options)
+
+    def generate(self, text: str, system_instruction: str | None, timeout: float) -> str:
+        response = self.client.models.generate_content(
+            model=self.name, contents=text, config=self._config(system_instruction, timeout)
+        )
+        return response.text
+
+    async def generate_async(self, text: str, system_instruction: str | None, timeout: float) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.name, contents=text, config=self._config(system_instruction, timeout)
+        )
+        return response.text
+
+    def stream(self, text: str, system_instruction: str | None, timeout: float) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(
+            model=self.name, contents=text, config=self._config(system_instruction, timeout)
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    async def stream_async(self, text: str, system_instruction: str | None, timeout: float) -> AsyncIterator[str]:
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.name, contents=text, config=self._config(system_instruction, timeout)
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+class OpenAICompatibleBackend:
+    """Chat completions endpoint such as vLLM, Ollama or TGI serving an open model.
+
+    Replies are returned whole; streaming callers get a single chunk.
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: str | None = None) -> None:
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.name = f"oss:{model}"
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._async_client: httpx.AsyncClient | None = None
+
+    def _payload(self, text: str, system_instruction: str | None) -> dict:
+        messages = [{"role": "system", "content": system_instruction}] if system_instruction else []
+        messages.append({"role": "user", "content": text})
+        return {"model": self.model, "messages": messages}
+
+    @staticmethod
+    def _text(data: dict) -> str:
+        return data["choices"][0]["message"]["content"]
+
+    def generate(self, text: str, system_instruction: str | None, timeout: float) -> str:
+        connect, _ = transport.timeout_for("llm")
+        resp = transport.get_session().post(
+            self.url, json=self._payload(text, system_instruction), headers=self.headers, timeout=(connect, timeout)
+        )
+        resp.raise_for_status()
+        return self._text(resp.json())
+
+    async def generate_async(self, text: str, system_instruction: str | None, timeout: float) -> str:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=transport.POOL_SIZE))
+        resp = await self._async_client.post(
+            self.url, json=self._payload(text, system_instruction), headers=self.headers, timeout=timeout
+        )
+        resp.raise_for_status()
+        return self._text(resp.json())
+
+    def stream(self, text: str, system_instruction: str | None, timeout: float) -> Iterator[str]:
+        yield self.generate(text, system_instruction, timeout)
+
+    async def stream_async(self, text: str, system_instruction: str | None, timeout: float) -> AsyncIterator[str]:
+        yield await self.generate_async(text, system_instruction, timeout)
+
+
+@dataclass
+class _Attempt:
+    backend: object
+    breaker: CircuitBreaker
+    number: int
+    timeout: float
+    deadline: float
+    retry: bool = False
+    delay: float = 0.0
+
+
+class ResilientLLM:
+    """Try ``backends`` in order with deadlines, retries and circuit breakers.
+
+    The ``generate`` methods return ``None`` and the ``stream`` methods
+    yield nothing when every backend failed or the deadline ran out.
+    """
+
+    def __init__(
+        self,
+        backends: List[object],
+        timeout: float = 20.0,
+        deadline: float = 40.0,
+        retries: int = 1,
+        backoff: float = 0.5,
+        breaker_threshold: int = 3,
+        breaker_reset: float = 30.0,
+    ) -> None:
+        self.backends = backends
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breakers = {b.name: CircuitBreaker(breaker_threshold, breaker_reset) for b in backends}
+
+    def _attempts(self) -> Iterator[_Attempt]:
+        deadline = time.monotonic() + self.deadline
+        for backend in self.backends:
+            breaker = self.breakers[backend.name]
+            for number in range(self.retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("LLM deadline of %.1fs exhausted", self.deadline)
+                    return
+                if not breaker.allow():
+                    logger.info("Skipping %s, circuit open", backend.name)
+                    break
+                attempt = _Attempt(backend, breaker, number, min(self.timeout, remaining), deadline)
+                yield attempt
+                if not attempt.retry:
+                    break
+
+    def _failed(self, attempt: _Attempt, exc: Exception) -> None:
+        attempt.breaker.record_failure()
+        metrics.external_call(attempt.backend.name, ok=False)
+        logger.warning("LLM %s attempt %d failed: %s", attempt.backend.name, attempt.number + 1, exc)
+        attempt.retry = is_transient(exc) and attempt.number < self.retries
+        backoff = self.backoff * 2**attempt.number * random.uniform(0.5, 1.5)
+        attempt.delay = max(0.0, min(backoff, attempt.deadline - time.monotonic()))
+
+    @staticmethod
+    def _succeeded(attempt: _Attempt) -> None:
+        attempt.breaker.record_success()
+        metrics.external_call(attempt.backend.name)
+
+    def generate(self, text: str, system_instruction: str | None = None) -> Optional[str]:
+        for attempt in self._attempts():
+            try:
+                result = attempt.backend.generate(text, system_instruction, attempt.timeout)
+            except Exception as e:
+                self._failed(attempt, e)
+                if attempt.retry:
+                    time.sleep(attempt.delay)
+                continue
+            self._succeeded(attempt)
+            return result
+        return None
+
+    async def generate_async(self, text: str, system_instruction: str | None = None) -> Optional[str]:
+        for attempt in self._attempts():
+            try:
+                result = await asyncio.wait_for(
+                    attempt.backend.generate_async(text, system_instruction, attempt.timeout), attempt.timeout
+                )
+            except Exception as e:
+                self._failed(attempt, e)
+                if attempt.retry:
+                    await asyncio.sleep(attempt.delay)
+                continue
+            self._succeeded(attempt)
+            return result
+        return None
+
+    def stream(self, text: str, system_instruction: str | None = None) -> Iterator[str]:
+        """Yield chunks from the first backend that works.
+
+        Once a chunk has been yielded a failure or the deadline ends the
+        stream instead of switching backends, so the partial reply is never
+        repeated; :class:`StreamTruncated` is raised after its last chunk.
+        """
+        for attempt in self._attempts():
+            yielded = truncated = False
+            try:
+                for chunk in attempt.backend.stream(text, system_instruction, attempt.timeout):
+                    yielded = True
+                    yield chunk
+                    if time.monotonic() > attempt.deadline:
+                        logger.warning("LLM deadline reached mid-stream, truncating reply")
+                        truncated = True
+                        break
+            except Exception as e:
+                self._failed(attempt, e)
+                if yielded:
+                    raise StreamTruncated(str(e)) from e
+                if attempt.retry:
+                    time.sleep(attempt.delay)
+                continue
+            self._succeeded(attempt)
+            if truncated:
+                raise StreamTruncated("deadline reached")
+            return
+
+    async def stream_async(self, text: str, system_instruction: str | None = None) -> AsyncIterator[str]:
+        """Awaitable variant of :meth:`stream`."""
+        for attempt in self._attempts():
+            yielded = truncated = False
+            try:
+                async for chunk in attempt.backend.stream_async(text, system_instruction, attempt.timeout):
+                    yielded = True
+                    yield chunk
+                    if time.monotonic() > attempt.deadline:
+                        logger.warning("LLM deadline reached mid-stream, truncating reply")
+                        truncated = True
+                        break
+            except Exception as e:
+                self._failed(attempt, e)
+                if yielded:
+                    raise StreamTruncated(str(e)) from e
+                if attempt.retry:
+                    await asyncio.sleep(attempt.delay)
+                continue
+            self._succeeded(attempt)
+            if truncated:
+                raise StreamTruncated("deadline reached")
+            return
+
+    def stats(self) -> dict[str, str]:
+        return {name: breaker.state for name, breaker in self.breakers.items()}
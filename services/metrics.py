@@ -0,0 +1,211 @@
+"""In-process metrics with Prometheus text exposition and optional tracing.
+
+Stages of a turn are wrapped with :func:`timed`, which records a latency
+histogram per stage and, when ``OTEL_TRACING=1`` and the OpenTelemetry API
+is installed, a span. Exporting spans is left to the OpenTelemetry SDK
+configured by the deployment (e.g. ``opentelemetry-instrument``); without
+it the spans are no-ops.
+
+Values that other components already track (pool queue depth, cache
+statistics) are read at scrape time through :func:`register_gauge`.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "travelbot"
+
+# Seconds; spans fast local work (cache hits, parsing) up to LLM calls.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+OTEL_TRACING = os.environ.get("OTEL_TRACING", "0") == "1"
+_tracer = None
+if OTEL_TRACING:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("travelbot")
+    except ImportError as e:
+        logger.warning("OpenTelemetry not available: %s", e)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0.0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._values.get(_labels(labels))
+        return series[len(self.buckets)] if series else 0
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, series):
+                le = f'le="{bound:g}"'
+                yield f"{self.name}_bucket{_format_labels(labels, le)} {count}"
+            total = series[len(self.buckets)]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(labels, le)} {total}"
+            yield f"{self.name}_sum{_format_labels(labels)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_format_labels(labels)} {total}"
+
+
+stage_seconds = Histogram(f"{PREFIX}_stage_seconds", "Latency of each stage of a turn.")
+stage_errors = Counter(f"{PREFIX}_stage_errors_total", "Stages that raised an exception.")
+external_calls = Counter(f"{PREFIX}_external_calls_total", "Calls to external services.")
+external_errors = Counter(f"{PREFIX}_external_errors_total", "Failed calls to external services.")
+cache_lookups = Counter(f"{PREFIX}_cache_lookups_total", "Cache lookups by cache and result.")
+
+
+def external_call(service: str, ok: bool = True) -> None:
+    """Count one call to ``service`` and whether it failed."""
+    external_calls.inc(service=service)
+    if not ok:
+        external_errors.inc(service=service)
+
+
+_gauges: Dict[str, tuple[str, str, Callable[[], dict]]] = {}
+
+
+def register_gauge(name: str, help: str, collect: Callable[[], dict], label: str = "stat") -> None:
+    """Expose ``collect()`` (label value -> number) as gauge ``travelbot_<name>``."""
+    _gauges[f"{PREFIX}_{name}"] = (help, label, collect)
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """Time the enclosed block as ``stage`` and trace it when enabled."""
+    with _tracer.start_as_current_span(stage) if _tracer else nullcontext():
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                stage_errors.inc(stage=stage)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed(stage: str) -> Callable:
+    """Decorate a function, coroutine or (async) generator with :func:`timer`.
+
+    Generators are timed until they are exhausted, so streamed replies
+    count their full duration.
+    """
+
+    def decorate(fn: Callable) -> Callable:
+        if inspect.isasyncgenfunction(fn):
+
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                with timer(stage):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+
+            return agen_wrapper
+        if inspect.isgeneratorfunction(fn):
+
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                with timer(stage):
+                    yield from fn(*args, **kwargs)
+
+            return gen_wrapper
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(stage):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def render() -> str:
+    """Return all metrics in the Prometheus text format (version 0.0.4)."""
+    lines: list[str] = []
+    for metric in (stage_seconds, stage_errors, external_calls, external_errors, cache_lookups):
+        lines.extend(metric.render())
+    for name, (help, label, collect) in sorted(_gauges.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            logger.warning("Metrics collector %s failed: %s", name, e)
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in sorted(values.items()):
+            lines.append(f'{name}{{{label}="{key}"}} {float(value):g}')
+    return "\n".join(lines) + "\n"
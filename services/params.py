@@ -2,13 +2,21 @@
 
 from __future__ import annotations
 
+import json
+import logging
 import os
 import re
-import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 
-import requests
+from . import metrics, transport
+from .cache import MISSING, MemoryCacheBackend, SqliteCacheBackend
+from .gazetteer import ALIASES, get_gazetteer, normalize
+from .parser import AIRLINES, TRAVEL_CLASS, ParsedMessage, parse
+
+logger = logging.getLogger(__name__)
 
 
 CITY_TO_IATA = {
@@ -34,7 +42,8 @@ CITY_TO_IATA = {
     "NYC": "NYC",
 }
 
-# Minimal list of active international airports used for validation.
+# Codes accepted even without the gazetteer; everything in the bundled
+# gazetteer is valid too (see ``_is_airport``).
 ACTIVE_INTL_AIRPORTS = {
     "MEX",
     "SFO",
@@ -46,35 +55,53 @@ ACTIVE_INTL_AIRPORTS = {
     "TYO",
 }
 
-AIRLINES = {
-    "AEROMEXICO": "AM",
-    "DELTA": "DL",
-    "UNITED": "UA",
-}
+_normalize = normalize
 
-TRAVEL_CLASS = {
-    "ECONOMICA": "1",
-    "ECONOMÍA": "1",
-    "NEGOCIOS": "2",
-    "BUSINESS": "2",
-    "EJECUTIVA": "2",
-    "PRIMERA": "3",
-    "FIRST": "3",
-}
 
+# Lifetimes in seconds of cached city resolutions: found codes, places
+# SerpApi has no airport for, and lookups that failed on the network.
+CITY_CACHE_TTL = float(os.environ.get("CITY_CACHE_TTL", str(30 * 24 * 3600)))
+CITY_CACHE_NEGATIVE_TTL = float(os.environ.get("CITY_CACHE_NEGATIVE_TTL", str(24 * 3600)))
+CITY_CACHE_ERROR_TTL = float(os.environ.get("CITY_CACHE_ERROR_TTL", "300"))
 
-def _normalize(text: str) -> str:
-    """Return ``text`` upper-cased and without diacritics."""
-    text = text.upper()
-    text = unicodedata.normalize("NFD", text)
-    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+_city_cache = None
+_city_cache_lock = threading.Lock()
 
 
-def _lookup_city(name: str, api_key: str) -> Optional[str]:
-    """Resolve city name to an IATA code using SerpApi's Google Maps API."""
-    key = _normalize(name)
-    if key in CITY_TO_IATA:
-        return CITY_TO_IATA[key]
+def _load_city_seed(cache, path: str) -> None:
+    """Preload ``{"name": "IATA" | null}`` entries not already cached."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            seed = json.load(fh)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read city cache seed %s: %s", path, e)
+        return
+    for name, code in seed.items():
+        key = _normalize(name)
+        if cache.get(key) is MISSING:
+            cache.set(key, code, CITY_CACHE_TTL if code else CITY_CACHE_NEGATIVE_TTL)
+
+
+def _get_city_cache():
+    """Return the persistent city cache, shared by workers through sqlite.
+
+    Set ``CITY_CACHE_PATH`` to an empty string to keep it in memory only.
+    """
+    global _city_cache
+    if _city_cache is None:
+        with _city_cache_lock:
+            if _city_cache is None:
+                path = os.environ.get("CITY_CACHE_PATH", "/tmp/city_cache.sqlite3")
+                cache = SqliteCacheBackend(path, table="cities") if path else MemoryCacheBackend(max_size=10000)
+                seed = os.environ.get("CITY_CACHE_SEED")
+                if seed:
+                    _load_city_seed(cache, seed)
+                _city_cache = cache
+    return _city_cache
+
+
+def _fetch_city(name: str, api_key: str) -> Tuple[Optional[str], float]:
+    """Query SerpApi's Google Maps API; return the code and how long to keep it."""
     try:
         url = "https://serpapi.com/search.json"
         params = {
@@ -82,46 +109,225 @@ def _lookup_city(name: str, api_key: str) -> Optional[str]:
             "q": f"airport {name}",
             "api_key": api_key,
         }
-        resp = requests.get(url, params=params, timeout=5)
+        resp = transport.get(url, "maps", params=params)
         resp.raise_for_status()
-        for res in resp.json().get("local_results", []):
+        results = resp.json().get("local_results", [])
+        metrics.external_call("maps")
+        for res in results:
             name_field = res.get("title") or res.get("name", "")
             m = re.search(r"\b([A-Z]{3})\b", name_field)
             if m:
-                return m.group(1)
-    except Exception:
-        pass
+                return m.group(1), CITY_CACHE_TTL
+    except Exception as e:
+        metrics.external_call("maps", ok=False)
+        logger.debug("City lookup for %s failed: %s", name, e)
+        return None, CITY_CACHE_ERROR_TTL
+    return None, CITY_CACHE_NEGATIVE_TTL
+
+
+@metrics.timed("lookup_city")
+def _lookup_city(name: str, api_key: str) -> Optional[str]:
+    """Resolve city name to an IATA code, remembering hits and misses."""
+    key = _normalize(name)
+    if key in CITY_TO_IATA:
+        return CITY_TO_IATA[key]
+    cache = _get_city_cache()
+    code = cache.get(key)
+    if code is not MISSING:
+        metrics.cache_lookups.inc(cache="city", result="hit")
+        return code
+    metrics.cache_lookups.inc(cache="city", result="miss")
+    code, ttl = _fetch_city(name, api_key)
+    cache.set(key, code, ttl)
+    return code
+
+
+class _PhraseTrie:
+    """Word-level trie mapping normalized place names to IATA codes."""
+
+    _END = ""
+
+    def __init__(self, phrases: Dict[str, str]) -> None:
+        self.root: dict = {}
+        for phrase, code in phrases.items():
+            node = self.root
+            for word in phrase.split():
+                node = node.setdefault(word, {})
+            node[self._END] = code
+
+    def longest_match(self, words: list[str], start: int) -> Optional[Tuple[int, str]]:
+        """Return ``(length, code)`` of the longest phrase starting at ``start``."""
+        node = self.root
+        best = None
+        for i in range(start, len(words)):
+            node = node.get(words[i])
+            if node is None:
+                break
+            if self._END in node:
+                best = (i - start + 1, node[self._END])
+        return best
+
+
+# Words introducing an origin or destination ("de Monterrey a Cancún").
+_PLACE_MARKERS = {"DE", "DESDE", "A", "HACIA", "PARA", "FROM", "TO"}
+
+# Words that never start or continue a place name in a travel request.
+_STOPWORDS = _PLACE_MARKERS | {
+    "DEL", "AL", "EL", "LA", "LAS", "LOS", "EN", "Y", "O", "UN", "UNA", "POR", "CON", "SIN",
+    "QUE", "MI", "ME", "SOLO", "IDA", "VUELTA", "REGRESO", "VUELO", "VUELOS", "VIAJE",
+    "VIAJAR", "QUIERO", "NECESITO", "HOTEL", "SEMANA", "MES", "DIA", "DIAS", "HOY",
+    "MANANA", "PROXIMO", "PROXIMA", "LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES",
+    "SABADO", "DOMINGO", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO",
+    "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE", "HOLA", "GRACIAS",
+    "VENTANA", "PASILLO", "ASIENTO", "PRESUPUESTO", "PASAPORTE", "VISA", "HABITACION",
+    "NEGOCIOS", "ECONOMICA", "PRIMERA", "BUSINESS", "FIRST", "THE", "AND", "ON", "IN", "FOR",
+} | set(AIRLINES) | set(TRAVEL_CLASS)
+
+_city_trie: _PhraseTrie | None = None
+
+
+def _get_city_trie() -> _PhraseTrie:
+    """Trie of names safe to match anywhere in a message.
+
+    Single gazetteer words ("Victoria", "Mayo") are too ambiguous outside a
+    place context and are only tried after a place marker.
+    """
+    global _city_trie
+    if _city_trie is None:
+        names = {
+            name: code
+            for name, code in get_gazetteer().names.items()
+            if " " in name and not all(w in _STOPWORDS for w in name.split())
+        }
+        names.update(ALIASES)
+        names.update(CITY_TO_IATA)
+        _city_trie = _PhraseTrie(names)
+    return _city_trie
+
+
+def _is_airport(code: str) -> bool:
+    return code in ACTIVE_INTL_AIRPORTS or code in get_gazetteer()
+
+
+_IATA_RE = re.compile(r"[A-Z]{3}")
+
+# Upper bound on network lookups per message, run concurrently.
+MAX_REMOTE_LOOKUPS = 4
+
+
+def _place_candidates(words: list[str], covered: set[int]) -> list[Tuple[int, str]]:
+    """Return phrases following a place marker that were not matched locally."""
+    candidates: list[Tuple[int, str]] = []
+    for i, word in enumerate(words[:-1]):
+        if word not in _PLACE_MARKERS:
+            continue
+        phrase: list[str] = []
+        j = i + 1
+        while j < len(words) and len(phrase) < 3:
+            w = words[j]
+            if j in covered or w in _STOPWORDS or not w.isalpha():
+                break
+            phrase.append(w)
+            j += 1
+        if phrase:
+            candidates.append((i + 1, " ".join(phrase)))
+    return candidates
+
+
+def _resolve_offline(phrase: str) -> Optional[str]:
+    """Match ``phrase`` or its leading words against the gazetteer.
+
+    Each length is tried exactly and then fuzzily before dropping a word, so
+    "San Fransisco" resolves to SFO rather than to the code of "San".
+    """
+    gazetteer = get_gazetteer()
+    words = phrase.split()
+    for size in range(len(words), 0, -1):
+        if size < len(words) and len(words[size - 1]) <= 3:
+            continue
+        prefix = " ".join(words[:size])
+        code = gazetteer.lookup(prefix) or gazetteer.fuzzy_lookup(prefix)
+        if code:
+            return code
     return None
 
 
-def _resolve_airport(token: str, api_key: str) -> Optional[str]:
-    token = _normalize(token)
-    if re.fullmatch(r"[A-Z]{3}", token):
-        return token
-    return _lookup_city(token, api_key)
+def _lookup_cities(names: list[str], api_key: str) -> Dict[str, Optional[str]]:
+    """Resolve ``names`` over the network in one bounded, concurrent batch."""
+    unique = list(dict.fromkeys(names))[:MAX_REMOTE_LOOKUPS]
+    if not unique or not api_key:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(unique)) as pool:
+        codes = pool.map(lambda name: _lookup_city(name, api_key), unique)
+        return dict(zip(unique, codes))
 
 
-def _extract_airports(text: str, api_key: str) -> Tuple[Optional[str], Optional[str]]:
-    clean = _normalize(re.sub(r"[^\w\s]", " ", text))
-    words = clean.split()
+def _match_airports(parsed: ParsedMessage) -> Tuple[list[Tuple[int, str]], list[Tuple[int, str]]]:
+    """Airports found offline with their word positions, and place phrases left unresolved."""
+    raw_words, words = parsed.raw_words, list(parsed.words)
+    trie = _get_city_trie()
     found: list[Tuple[int, str]] = []
-    for size in range(3, 0, -1):
-        for i in range(len(words) - size + 1):
-            phrase = " ".join(words[i : i + size])
-            code = _resolve_airport(phrase, api_key)
-            if code and code in ACTIVE_INTL_AIRPORTS:
-                found.append((i, code))
-    found.sort(key=lambda x: x[0])
+    covered: set[int] = set()
+    i = 0
+    while i < len(words):
+        match = trie.longest_match(words, i)
+        if match:
+            size, code = match
+            found.append((i, code))
+            covered.update(range(i, i + size))
+            i += size
+            continue
+        # Bare codes must be typed in capitals ("MEX"), otherwise words like
+        # "del", "los" or "par" would be read as airports.
+        word = words[i]
+        if _IATA_RE.fullmatch(word) and raw_words[i].isupper() and _is_airport(word):
+            found.append((i, word))
+            covered.add(i)
+        i += 1
+
+    unresolved: list[Tuple[int, str]] = []
+    if len({code for _, code in found}) < 2:
+        for pos, phrase in _place_candidates(words, covered):
+            code = _resolve_offline(phrase)
+            if code:
+                found.append((pos, code))
+            else:
+                unresolved.append((pos, phrase))
+    return found, unresolved
+
+
+def _ordered_codes(found: list[Tuple[int, str]]) -> Tuple[str, ...]:
     codes: list[str] = []
-    for _, code in found:
-        if code not in codes:
+    for _, code in sorted(found, key=lambda x: x[0]):
+        if _is_airport(code) and code not in codes:
             codes.append(code)
+    return tuple(codes)
+
+
+def local_airports(parsed: ParsedMessage) -> Tuple[str, ...]:
+    """Validated airports of ``parsed`` in message order, without network lookups.
+
+    Read it through ``ParsedMessage.airports``, which caches the result.
+    """
+    return _ordered_codes(_match_airports(parsed)[0])
+
+
+def _extract_airports(
+    message: Union[str, ParsedMessage], api_key: str
+) -> Tuple[Optional[str], Optional[str]]:
+    parsed = parse(message) if isinstance(message, str) else message
+    codes = parsed.airports
+    if len(codes) < 2 and api_key:
+        found, unresolved = _match_airports(parsed)
+        if unresolved and len({code for _, code in found}) < 2:
+            resolved = _lookup_cities([phrase for _, phrase in unresolved], api_key)
+            for pos, phrase in unresolved:
+                code = resolved.get(phrase)
+                if code:
+                    found.append((pos, code))
+            codes = _ordered_codes(found)
     dep = codes[0] if codes else None
     arr = codes[1] if len(codes) > 1 else None
-    if dep and dep not in ACTIVE_INTL_AIRPORTS:
-        dep = None
-    if arr and arr not in ACTIVE_INTL_AIRPORTS:
-        arr = None
     return dep, arr
 
 
@@ -131,19 +337,17 @@ def _next_weekday(d: date) -> date:
     return d
 
 
-def _extract_dates(text: str) -> Tuple[str, Optional[str]]:
+def _extract_dates(message: Union[str, ParsedMessage]) -> Tuple[str, Optional[str]]:
     """Return outbound and optional return dates."""
+    parsed = parse(message) if isinstance(message, str) else message
     today = date.today()
-    full_dates = re.findall(r"\d{4}-\d{2}-\d{2}", text)
-    if full_dates:
-        out = date.fromisoformat(full_dates[0])
-        ret = date.fromisoformat(full_dates[1]) if len(full_dates) > 1 else None
+    if parsed.iso_dates:
+        out = date.fromisoformat(parsed.iso_dates[0])
+        ret = date.fromisoformat(parsed.iso_dates[1]) if len(parsed.iso_dates) > 1 else None
         return out.isoformat(), ret.isoformat() if ret else None
 
-    m = re.search(r"(\d{1,2})\D+al\D+(\d{1,2})", text)
-    if m:
-        start_day = int(m.group(1))
-        end_day = int(m.group(2))
+    if parsed.day_range:
+        start_day, end_day = parsed.day_range
         month = today.month
         year = today.year
         if start_day <= today.day:
@@ -155,9 +359,8 @@ def _extract_dates(text: str) -> Tuple[str, Optional[str]]:
         ret = date(year, month, end_day)
         return out.isoformat(), ret.isoformat()
 
-    d_match = re.search(r"\b(\d{1,2})\b", text)
-    if d_match:
-        day = int(d_match.group(1))
+    if parsed.day is not None:
+        day = parsed.day
         month = today.month if day > today.day else today.month + 1
         if month == 13:
             month = 1
@@ -169,14 +372,14 @@ def _extract_dates(text: str) -> Tuple[str, Optional[str]]:
         out = _next_weekday(today + timedelta(days=3))
 
     ret = None
-    if "solo ida" not in text.lower():
+    if not parsed.one_way:
         ret = _next_weekday(out + timedelta(days=3))
 
     return out.isoformat(), ret.isoformat() if ret else None
 
 
 def build_flight_params(
-    text: str,
+    message: Union[str, ParsedMessage],
     api_key: str,
     *,
     hl: str = "es",
@@ -184,9 +387,13 @@ def build_flight_params(
     currency: str = "USD",
     travel_class: str = "1",
 ) -> Dict[str, str]:
-    """Convert a natural language request into SerpApi parameters for flights."""
-    dep, arr = _extract_airports(text, api_key)
-    out_date, ret_date = _extract_dates(text)
+    """Convert a natural language request into SerpApi parameters for flights.
+
+    ``message`` may be the raw text or the result of :func:`parser.parse`.
+    """
+    parsed = parse(message) if isinstance(message, str) else message
+    dep, arr = _extract_airports(parsed, api_key)
+    out_date, ret_date = _extract_dates(parsed)
 
     params = {
         "api_key": api_key,
@@ -206,14 +413,8 @@ def build_flight_params(
     if ret_date:
         params["return_date"] = ret_date
 
-    upper = _normalize(text)
-    for name, code in AIRLINES.items():
-        if name in upper:
-            params["include_airlines"] = code
-            break
-
-    for key, cls in TRAVEL_CLASS.items():
-        if key in upper:
-            params["travel_class"] = cls
-            break
+    if parsed.airline:
+        params["include_airlines"] = parsed.airline
+    if parsed.travel_class:
+        params["travel_class"] = parsed.travel_class
     return params
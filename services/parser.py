@@ -0,0 +1,147 @@
+"""Single-pass extraction of travel details from a user message.
+
+``parse`` normalizes a message once and runs every precompiled pattern
+over it, returning a :class:`ParsedMessage` that both the conversation
+state (``TravelAssistant._parse_message``) and the SerpApi parameters
+(``params.build_flight_params``) are built from. Results are memoized, so
+the two consumers of one message share a single pass. Airports are
+validated against the gazetteer on first access and cached on the result.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import Optional, Tuple
+
+from .gazetteer import normalize
+
+AIRLINES = {
+    "AEROMEXICO": "AM",
+    "DELTA": "DL",
+    "IBERIA": "IB",
+    "UNITED": "UA",
+}
+
+TRAVEL_CLASS = {
+    "ECONOMICA": "1",
+    "ECONOMÍA": "1",
+    "NEGOCIOS": "2",
+    "BUSINESS": "2",
+    "EJECUTIVA": "2",
+    "PRIMERA": "3",
+    "FIRST": "3",
+}
+
+# Names ``flight_preference`` writes for each code; ``parse`` reads them back.
+_CLASS_NAMES = {"1": "clase económica", "2": "clase ejecutiva", "3": "primera clase"}
+_AIRLINE_NAMES = {code: name.title() for name, code in reversed(AIRLINES.items())}
+
+
+def _keywords(table: dict) -> Tuple["re.Pattern[str]", dict]:
+    """Compile the keys of ``table`` into one alternation over normalized text."""
+    lookup = {normalize(key): value for key, value in table.items()}
+    names = sorted(lookup, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, names)) + r")\b"), lookup
+
+
+_AIRLINE_RE, _AIRLINE_CODES = _keywords(AIRLINES)
+_CLASS_RE, _CLASS_CODES = _keywords(TRAVEL_CLASS)
+_CODE_RE = re.compile(r"\b[A-Z]{3}\b")
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_DAY_RANGE_RE = re.compile(r"(\d{1,2})\D+al\D+(\d{1,2})")
+_DAY_RE = re.compile(r"\b(\d{1,2})\b")
+_BUDGET_RE = re.compile(r"(?:\$|presupuesto\s*)(\d+)")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+
+@dataclass(frozen=True)
+class ParsedMessage:
+    """Everything the state and the flight search read from one message."""
+
+    text: str
+    # Tokens for place matching; punctuation becomes its own "|" token so
+    # place names never span it. ``words`` are the normalized ``raw_words``.
+    raw_words: Tuple[str, ...]
+    words: Tuple[str, ...]
+    # Three-letter words typed in capitals, validated by ``codes``.
+    capitals: Tuple[str, ...]
+    iso_dates: Tuple[str, ...]
+    day_range: Optional[Tuple[int, int]]
+    day: Optional[int]
+    one_way: bool
+    seat_pref: Optional[str]
+    share_room: Optional[bool]
+    mentions_passport: bool
+    mentions_visa: bool
+    affirmative: bool
+    budget: Optional[str]
+    airline: Optional[str]
+    travel_class: Optional[str]
+
+    # params imports this module, so its helpers are imported on use.
+    @cached_property
+    def codes(self) -> Tuple[str, ...]:
+        """Airport codes typed in capitals ("MEX"); words such as "VOY" are dropped."""
+        from .params import _is_airport
+
+        return tuple(dict.fromkeys(code for code in self.capitals if _is_airport(code)))
+
+    @cached_property
+    def airports(self) -> Tuple[str, ...]:
+        """Airports named as codes or place names, in message order, resolved offline."""
+        from .params import local_airports
+
+        return local_airports(self)
+
+
+def flight_preference(travel_class: Optional[str], airline: Optional[str]) -> Optional[str]:
+    """Text for a cabin class and airline code, e.g. ``"clase ejecutiva, Iberia"``."""
+    parts = [_CLASS_NAMES.get(travel_class or ""), _AIRLINE_NAMES.get(airline or "")]
+    return ", ".join(p for p in parts if p) or None
+
+
+@lru_cache(maxsize=256)
+def parse(text: str) -> ParsedMessage:
+    lower = text.lower()
+    tokenized = _PUNCTUATION_RE.sub(" | ", text)
+    raw_words = tuple(tokenized.split())
+    words = tuple(normalize(tokenized).split())
+    if len(words) != len(raw_words):
+        words = tuple(normalize(w) for w in raw_words)
+    upper = " ".join(words)
+
+    day_range = _DAY_RANGE_RE.search(text)
+    day = _DAY_RE.search(text)
+    budget = _BUDGET_RE.search(lower)
+    airline = _AIRLINE_RE.search(upper)
+    travel_class = _CLASS_RE.search(upper)
+
+    seat_pref = None
+    if "ventana" in lower:
+        seat_pref = "ventana"
+    elif "pasillo" in lower:
+        seat_pref = "pasillo"
+    share_room = None
+    if "no compartir" in lower:
+        share_room = False
+    elif "compartir" in lower:
+        share_room = True
+
+    return ParsedMessage(
+        text=text,
+        raw_words=raw_words,
+        words=words,
+        capitals=tuple(_CODE_RE.findall(text)),
+        iso_dates=tuple(_ISO_DATE_RE.findall(text)),
+        day_range=(int(day_range.group(1)), int(day_range.group(2))) if day_range else None,
+        day=int(day.group(1)) if day else None,
+        one_way="solo ida" in lower,
+        seat_pref=seat_pref,
+        share_room=share_room,
+        mentions_passport="pasaporte" in lower,
+        mentions_visa="visa" in lower,
+        affirmative="si" in lower,
+        budget=budget.group(1) if budget else None,
+        airline=_AIRLINE_CODES[airline.group(0)] if airline else None,
+        travel_class=_CLASS_CODES[travel_class.group(0)] if travel_class else None,
+    )
@@ -0,0 +1,116 @@
+"""Lazily built clients and the startup timing report.
+
+Importing the SDKs behind Firestore, Sheets and Gemini and building their
+clients takes seconds, which on Cloud Run is added to the first reply after
+scaling from zero. Services register a factory instead; the client is
+built on first use, or ahead of it by :func:`warmup` once the server is
+already accepting requests (see ``gunicorn_config.post_worker_init``).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Reference point for the timings: this module is imported first by app.py.
+STARTED_AT = time.perf_counter()
+
+_timings: dict[str, float] = {}
+_services: dict[str, "Lazy"] = {}
+_lock = threading.Lock()
+
+
+def record(step: str, seconds: float) -> None:
+    """Store how long a startup ``step`` took."""
+    with _lock:
+        _timings[step] = round(seconds, 4)
+
+
+def since_start() -> float:
+    return time.perf_counter() - STARTED_AT
+
+
+def timings() -> dict[str, float]:
+    with _lock:
+        return dict(_timings)
+
+
+class Lazy(Generic[T]):
+    """Proxy that builds its object on first attribute access.
+
+    A failing factory is retried on the next access.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]) -> None:
+        self._name = name
+        self._factory = factory
+        self._value: T | None = None
+        self._ready = False
+        self._build_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def get(self) -> T:
+        if not self._ready:
+            with self._build_lock:
+                if not self._ready:
+                    start = time.perf_counter()
+                    self._value = self._factory()
+                    self._ready = True
+                    record(self._name, time.perf_counter() - start)
+        return self._value
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def __repr__(self) -> str:
+        state = "ready" if self._ready else "pending"
+        return f"<Lazy {self._name} ({state})>"
+
+
+def register(name: str, factory: Callable[[], T]) -> Lazy[T]:
+    """Return a :class:`Lazy` for ``factory`` that :func:`warmup` will build."""
+    lazy = Lazy(name, factory)
+    with _lock:
+        _services[name] = lazy
+    return lazy
+
+
+def _warm() -> None:
+    for name, lazy in list(_services.items()):
+        try:
+            lazy.get()
+        except Exception as e:
+            logger.warning("Warm-up of %s failed; it will be retried on first use: %s", name, e)
+    record("warmup_done", since_start())
+    logger.info("Startup timings (s): %s", timings())
+
+
+def warmup(background: bool = True) -> threading.Thread | None:
+    """Build every registered client, by default in a daemon thread."""
+    if not background:
+        _warm()
+        return None
+    thread = threading.Thread(target=_warm, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+@lru_cache(maxsize=1)
+def service_account_info() -> dict:
+    """Parsed ``service-account`` JSON shared by the Firestore and Sheets clients."""
+    creds_json = os.environ.get("service-account")
+    if not creds_json:
+        raise RuntimeError("service-account environment variable not set")
+    return json.loads(creds_json)
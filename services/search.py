@@ -0,0 +1,287 @@
+"""Flight and hotel options searched as soon as a trip is fully specified.
+
+Once the state has two known airports and a future date range (see
+``TripSearch.ready``), ``TripSearch`` runs
+the flight search (parameters from ``params.build_flight_params``, with
+cabin class and airline taken from ``flight_pref``, which the conversation
+fills from the parsed message) and the hotel search in parallel. The
+``budget`` covers the whole trip: a flight is kept only if it fits with the
+cheapest stay and a hotel only if it fits with the cheapest flight. The
+rest are ranked, trimmed and rendered as a few compact lines for the
+prompt. Results are cached
+per state fingerprint, so later turns about the same trip reuse them.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Optional
+
+from . import metrics
+from .cache import MISSING, MemoryCacheBackend
+from .gazetteer import get_gazetteer
+from .params import _is_airport, build_flight_params
+from .parser import parse
+from .state import TravelState
+
+logger = logging.getLogger(__name__)
+
+_PRICE_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _price(value) -> Optional[float]:
+    """Numeric price from SerpApi values such as ``450`` or ``"$1,200"``."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        m = _PRICE_RE.search(value.replace(",", ""))
+        return float(m.group(0)) if m else None
+    return None
+
+
+def _budget(state: TravelState) -> Optional[float]:
+    return _price(state.budget) if state.budget else None
+
+
+def _flight_price(result: dict) -> Optional[float]:
+    return _price(result.get("price")) if result.get("flights") else None
+
+
+def _hotel_price(result: dict) -> Optional[float]:
+    rate = result.get("rate_per_night") or {}
+    return _price(rate.get("extracted_lowest", rate.get("lowest")))
+
+
+def _nights(state: TravelState) -> int:
+    try:
+        return max(1, (date.fromisoformat(state.end_date) - date.fromisoformat(state.start_date)).days)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _duration(minutes) -> str:
+    if not isinstance(minutes, int):
+        return ""
+    return f"{minutes // 60}h{minutes % 60:02d}"
+
+
+def _clock(value: str) -> str:
+    """``"2025-03-14 08:05"`` -> ``"08:05"``."""
+    return value.rsplit(" ", 1)[-1] if value else "?"
+
+
+@dataclass
+class TripOptions:
+    """Ranked, trimmed options for one state fingerprint."""
+
+    flights: List[dict] = field(default_factory=list)
+    hotels: List[dict] = field(default_factory=list)
+    currency: str = "USD"
+
+    def summary(self) -> str:
+        lines: List[str] = []
+        if self.flights:
+            lines.append(f"Vuelos encontrados ({self.currency}, ida y vuelta):")
+            for i, f in enumerate(self.flights, 1):
+                parts = [
+                    f"{f['airline']} sale {_clock(f['departs'])}",
+                    f"llega {_clock(f['arrives'])}",
+                    "directo" if not f["stops"] else f"{f['stops']} escala(s)",
+                    _duration(f["duration"]),
+                    f"${f['price']:.0f}",
+                ]
+                lines.append(f"{i}. " + ", ".join(p for p in parts if p))
+        if self.hotels:
+            lines.append(f"Hoteles encontrados ({self.currency} por noche):")
+            for i, h in enumerate(self.hotels, 1):
+                rating = f", {h['rating']}★" if h["rating"] else ""
+                lines.append(f"{i}. {h['name']}, ${h['price']:.0f}{rating}")
+        return "\n".join(lines)
+
+    def __bool__(self) -> bool:
+        return bool(self.flights or self.hotels)
+
+
+class TripSearch:
+    """Parallel flight and hotel search for a complete ``TravelState``."""
+
+    def __init__(
+        self,
+        serpapi,
+        max_flights: int = 3,
+        max_hotels: int = 3,
+        timeout: float = 8.0,
+        cache_ttl: float = 900.0,
+        cache_size: int = 512,
+    ) -> None:
+        self.serpapi = serpapi
+        self.max_flights = max_flights
+        self.max_hotels = max_hotels
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache = MemoryCacheBackend(max_size=cache_size)
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="trip-search")
+
+    @staticmethod
+    def ready(state: TravelState) -> bool:
+        """Whether the state names two different airports and a valid, future date range.
+
+        Searches are paid, so anything else (a misread word, a past or
+        reversed range) is never sent.
+        """
+        if not (state.origin and state.destination) or state.origin == state.destination:
+            return False
+        if not (_is_airport(state.origin) and _is_airport(state.destination)):
+            return False
+        try:
+            start = date.fromisoformat(state.start_date or "")
+            end = date.fromisoformat(state.end_date or "")
+        except ValueError:
+            return False
+        return date.today() <= start <= end
+
+    @staticmethod
+    def fingerprint(state: TravelState) -> str:
+        """Key of the fields that change the search results."""
+        fields = [state.origin, state.destination, state.start_date, state.end_date, state.budget, state.flight_pref]
+        return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+    def flight_params(self, state: TravelState) -> dict:
+        """SerpApi parameters for the state; the preferences only add class and airline.
+
+        No API key is passed, so the preference text never triggers city lookups.
+        """
+        params = build_flight_params(parse(state.flight_pref or ""), "")
+        params.update(
+            departure_id=state.origin,
+            arrival_id=state.destination,
+            outbound_date=state.start_date,
+            return_date=state.end_date,
+        )
+        params.pop("api_key", None)
+        return params
+
+    @staticmethod
+    def _city(state: TravelState) -> str:
+        name = get_gazetteer().city_name(state.destination)
+        return name.title() if name else state.destination
+
+    def _rank_flights(self, results: List[dict], budget: Optional[float]) -> List[dict]:
+        options = []
+        for result in results:
+            price = _flight_price(result)
+            if price is None or (budget is not None and price > budget):
+                continue
+            legs = result["flights"]
+            airlines = list(dict.fromkeys(leg.get("airline", "") for leg in legs if leg.get("airline")))
+            options.append(
+                {
+                    "airline": " / ".join(airlines) or "Aerolínea",
+                    "departs": (legs[0].get("departure_airport") or {}).get("time", ""),
+                    "arrives": (legs[-1].get("arrival_airport") or {}).get("time", ""),
+                    "stops": len(legs) - 1,
+                    "duration": result.get("total_duration"),
+                    "price": price,
+                }
+            )
+        options.sort(key=lambda o: (o["price"], o["stops"], o["duration"] or 0))
+        return options[: self.max_flights]
+
+    def _rank_hotels(self, results: List[dict], budget: Optional[float], nights: int) -> List[dict]:
+        options = []
+        for result in results:
+            price = _hotel_price(result)
+            if price is None or (budget is not None and price * nights > budget):
+                continue
+            options.append(
+                {
+                    "name": result.get("name", "Hotel"),
+                    "price": price,
+                    "rating": result.get("overall_rating"),
+                }
+            )
+        options.sort(key=lambda o: (-(o["rating"] or 0), o["price"]))
+        return options[: self.max_hotels]
+
+    def _options(self, state: TravelState, flights: List[dict], hotels: List[dict], currency: str) -> TripOptions:
+        flights, hotels = flights or [], hotels or []
+        budget, nights = _budget(state), _nights(state)
+        flight_budget = hotel_budget = budget
+        if budget is not None:
+            # Each option leaves room for the cheapest one of the other kind.
+            prices = [p for p in map(_flight_price, flights) if p is not None]
+            stays = [p * nights for p in map(_hotel_price, hotels) if p is not None]
+            flight_budget = budget - min(stays, default=0.0)
+            hotel_budget = budget - min(prices, default=0.0)
+        return TripOptions(
+            self._rank_flights(flights, flight_budget),
+            self._rank_hotels(hotels, hotel_budget, nights),
+            currency,
+        )
+
+    def _cached(self, key: str) -> Optional[TripOptions]:
+        options = self.cache.get(key)
+        metrics.cache_lookups.inc(cache="trip_search", result="miss" if options is MISSING else "hit")
+        return None if options is MISSING else options
+
+    def _remember(self, key: str, flights: List[dict], hotels: List[dict], options: TripOptions) -> None:
+        # Empty results may be a failed request; only cache real answers.
+        if flights or hotels:
+            self.cache.set(key, options, self.cache_ttl)
+
+    @metrics.timed("trip_search")
+    def run(self, state: TravelState) -> Optional[TripOptions]:
+        """Options for a complete state, or ``None`` when it is incomplete."""
+        if not self.ready(state):
+            return None
+        key = self.fingerprint(state)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        params = self.flight_params(state)
+        deadline = time.monotonic() + self.timeout
+        flights_f = self._pool.submit(self.serpapi.search_flight_params, params)
+        hotels_f = self._pool.submit(self.serpapi.search_hotels, self._city(state), state.start_date, state.end_date)
+        results = []
+        for name, future in (("flights", flights_f), ("hotels", hotels_f)):
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except Exception as e:
+                logger.warning("Trip search for %s skipped: %s", name, str(e) or type(e).__name__)
+                results.append([])
+        flights, hotels = results
+        options = self._options(state, flights, hotels, params.get("currency", "USD"))
+        self._remember(key, flights, hotels, options)
+        return options
+
+    @metrics.timed("trip_search")
+    async def run_async(self, state: TravelState) -> Optional[TripOptions]:
+        """Awaitable variant of :meth:`run` using the async SerpApi client."""
+        if not self.ready(state):
+            return None
+        key = self.fingerprint(state)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        params = self.flight_params(state)
+
+        async def guarded(name: str, coro) -> List[dict]:
+            try:
+                return await asyncio.wait_for(coro, self.timeout)
+            except Exception as e:
+                logger.warning("Trip search for %s skipped: %s", name, str(e) or type(e).__name__)
+                return []
+
+        flights, hotels = await asyncio.gather(
+            guarded("flights", self.serpapi.search_flight_params_async(params)),
+            guarded("hotels", self.serpapi.search_hotels_async(self._city(state), state.start_date, state.end_date)),
+        )
+        options = self._options(state, flights, hotels, params.get("currency", "USD"))
+        self._remember(key, flights, hotels, options)
+        return options
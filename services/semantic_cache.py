@@ -0,0 +1,139 @@
+"""Reuse Gemini answers to repeated general questions.
+
+Lookups try the normalized question fingerprint first and then the nearest
+cached question by cosine similarity of its embedding. The default
+embedding is a local hashed bag of words and character trigrams, so a hit
+costs a scan of at most ``max_size`` sparse vectors and no network call.
+Questions that differ in a negation ("¿puedo…?" / "¿no puedo…?") score
+high but ask the opposite, so they never match approximately. Only
+stateless questions may be cached; callers decide which ones qualify.
+"""
+
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from .intents import canonical
+
+Vector = Dict[int, float]
+
+DIMENSIONS = 4096
+
+# Words that change little about what a question asks.
+_FILLERS = {
+    "EL", "LA", "LOS", "LAS", "UN", "UNA", "UNOS", "UNAS", "DE", "DEL", "AL", "A", "EN", "Y", "O",
+    "SE", "ME", "MI", "MIS", "LO", "POR", "PARA", "QUE", "ES", "SON", "HAY",
+}
+
+_NEGATIONS = {"NO", "NI", "NUNCA", "JAMAS", "TAMPOCO", "SIN"}
+
+
+def _negations(key: str) -> frozenset:
+    return frozenset(w for w in key.split() if w in _NEGATIONS)
+
+
+def fingerprint(question: str) -> str:
+    return " ".join(w for w in canonical(question).split() if w not in _FILLERS)
+
+
+def local_embedding(text: str) -> Vector:
+    """Hash words and character trigrams of ``text`` into a unit sparse vector."""
+    key = fingerprint(text)
+    features = key.split() + [key[i : i + 3] for i in range(len(key) - 2)]
+    vector: Vector = {}
+    for feature in features:
+        bucket = zlib.crc32(feature.encode()) % DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {k: v / norm for k, v in vector.items()}
+
+
+def cosine(a: Vector, b: Vector) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    vector: Vector
+    expires_at: float
+
+
+class SemanticCache:
+    """LRU of answers keyed by question fingerprint with approximate lookups."""
+
+    def __init__(
+        self,
+        max_size: int = 512,
+        ttl: float = 86400.0,
+        threshold: float = 0.9,
+        embed: Callable[[str], Vector] = local_embedding,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.embed = embed
+        self._items: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, question: str) -> Optional[str]:
+        key = fingerprint(question)
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item.expires_at > now:
+                self._items.move_to_end(key)
+                self.exact_hits += 1
+                return item.answer
+        vector = self.embed(question)
+        negations = _negations(key)
+        with self._lock:
+            best: tuple[float, str] | None = None
+            for cached_key, item in list(self._items.items()):
+                if item.expires_at <= now:
+                    del self._items[cached_key]
+                    continue
+                if _negations(cached_key) != negations:
+                    continue
+                score = cosine(vector, item.vector)
+                if score >= self.threshold and (best is None or score > best[0]):
+                    best = (score, cached_key)
+            if best is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(best[1])
+            self.semantic_hits += 1
+            return self._items[best[1]].answer
+
+    def put(self, question: str, answer: str) -> None:
+        if self.max_size <= 0:
+            return
+        item = CachedAnswer(answer, self.embed(question), time.monotonic() + self.ttl)
+        key = fingerprint(question)
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._items),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._items)
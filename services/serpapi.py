@@ -1,7 +1,10 @@
 import os
 import logging
 from typing import Any, List
-import requests
+import httpx
+
+from . import metrics, transport
+from .cache import MemoryCacheBackend, ResponseCache, SqliteCacheBackend
 
 logger = logging.getLogger(__name__)
 
@@ -14,37 +17,127 @@ class SerpAPIService:
         if not self.api_key:
             logger.warning("SERPAPI_KEY not set; SerpApi disabled")
         self.base_url = "https://serpapi.com"
+        self._async_client: httpx.AsyncClient | None = None
+        self.cache = self._build_cache()
+
+    @staticmethod
+    def _build_cache() -> ResponseCache | None:
+        kind = os.environ.get("SERPAPI_CACHE", "memory")
+        if kind == "off":
+            return None
+        size = int(os.environ.get("SERPAPI_CACHE_SIZE", "512"))
+        if kind == "sqlite":
+            path = os.environ.get("SERPAPI_CACHE_PATH", "/tmp/serpapi_cache.sqlite3")
+            backend = SqliteCacheBackend(path, table="serpapi", max_size=size)
+        else:
+            backend = MemoryCacheBackend(max_size=size)
+        # Flight prices move quickly; hotel lists are stable for longer.
+        ttls = {
+            "google_flights": float(os.environ.get("SERPAPI_CACHE_TTL_FLIGHTS", "900")),
+            "google_hotels": float(os.environ.get("SERPAPI_CACHE_TTL_HOTELS", "3600")),
+        }
+        return ResponseCache(backend, ttls=ttls)
 
+    @metrics.timed("serpapi")
     def _request(self, endpoint: str, params: dict) -> Any:
         if not self.api_key:
             return None
+        if self.cache is None:
+            return self._fetch(endpoint, params)
+        return self.cache.get_or_fetch(endpoint, params, lambda: self._fetch(endpoint, params))
+
+    def _fetch(self, endpoint: str, params: dict) -> Any:
         url = f"{self.base_url}/{endpoint}.json"
         params["api_key"] = self.api_key
         try:
-            resp = requests.get(url, params=params, timeout=10)
+            resp = transport.get(url, "serpapi", params=params)
             resp.raise_for_status()
-            return resp.json()
+            data = resp.json()
+            metrics.external_call("serpapi")
+            return data
         except Exception as e:
+            metrics.external_call("serpapi", ok=False)
             logger.error("SerpApi request failed: %s", e)
         return None
 
-    def search_flights(self, origin: str, destination: str, date: str) -> List[dict]:
-        params = {
+    @metrics.timed("serpapi")
+    async def _request_async(self, endpoint: str, params: dict) -> Any:
+        if not self.api_key:
+            return None
+        if self.cache is None:
+            return await self._fetch_async(endpoint, params)
+        return await self.cache.get_or_fetch_async(endpoint, params, lambda: self._fetch_async(endpoint, params))
+
+    async def _fetch_async(self, endpoint: str, params: dict) -> Any:
+        if self._async_client is None:
+            connect, read = transport.timeout_for("serpapi")
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=transport.POOL_SIZE),
+                transport=httpx.AsyncHTTPTransport(retries=transport.RETRIES),
+            )
+        params["api_key"] = self.api_key
+        try:
+            resp = await self._async_client.get(f"/{endpoint}.json", params=params)
+            resp.raise_for_status()
+            data = resp.json()
+            metrics.external_call("serpapi")
+            return data
+        except Exception as e:
+            metrics.external_call("serpapi", ok=False)
+            logger.error("SerpApi request failed: %s", e)
+        return None
+
+    def _flight_params(self, origin: str, destination: str, date: str) -> dict:
+        return {
             "engine": "google_flights",
             "departure_id": origin,
             "arrival_id": destination,
             "outbound_date": date,
             "bags": "1",
         }
-        data = self._request("search", params)
-        return data.get("flights_results", []) if data else []
 
-    def search_hotels(self, city: str, check_in: str, check_out: str) -> List[dict]:
-        params = {
+    def _hotel_params(self, city: str, check_in: str, check_out: str) -> dict:
+        return {
             "engine": "google_hotels",
             "q": city,
             "check_in_date": check_in,
             "check_out_date": check_out,
         }
-        data = self._request("search", params)
-        return data.get("hotels_results", []) if data else []
+
+    def search_flights(self, origin: str, destination: str, date: str) -> List[dict]:
+        return flight_results(self._request("search", self._flight_params(origin, destination, date)))
+
+    def search_hotels(self, city: str, check_in: str, check_out: str) -> List[dict]:
+        return hotel_results(self._request("search", self._hotel_params(city, check_in, check_out)))
+
+    async def search_flights_async(self, origin: str, destination: str, date: str) -> List[dict]:
+        return flight_results(await self._request_async("search", self._flight_params(origin, destination, date)))
+
+    async def search_hotels_async(self, city: str, check_in: str, check_out: str) -> List[dict]:
+        return hotel_results(await self._request_async("search", self._hotel_params(city, check_in, check_out)))
+
+    def search_flight_params(self, params: dict) -> List[dict]:
+        """Search with the output of ``params.build_flight_params``."""
+        return flight_results(self._request("search", {k: v for k, v in params.items() if k != "api_key"}))
+
+    async def search_flight_params_async(self, params: dict) -> List[dict]:
+        return flight_results(
+            await self._request_async("search", {k: v for k, v in params.items() if k != "api_key"})
+        )
+
+
+def flight_results(data: Any) -> List[dict]:
+    """Itineraries of a Google Flights response, Google's best picks first."""
+    if not data:
+        return []
+    if "best_flights" in data or "other_flights" in data:
+        return data.get("best_flights", []) + data.get("other_flights", [])
+    return data.get("flights_results", [])
+
+
+def hotel_results(data: Any) -> List[dict]:
+    if not data:
+        return []
+    return data.get("properties") or data.get("hotels_results", [])
@@ -1,46 +1,153 @@
 import os
-import json
 import logging
-import gspread
-from google.oauth2.service_account import Credentials
+import threading
+import time
+from typing import Callable, Optional
+
+from . import metrics, registry
 
 logger = logging.getLogger(__name__)
 
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+
+# Header variants used for the Slack ID column in the directory sheet.
+SLACK_ID_HEADERS = ("Slack ID", "slack_id", "Slack_Id", "slack id")
+
+
+def _row_key(row: dict) -> str | None:
+    for header in SLACK_ID_HEADERS:
+        value = row.get(header)
+        if value:
+            return str(value).strip()
+    return None
+
+
+class UserDirectory:
+    """In-memory index of the directory sheet keyed by ``TEAM_ID-slack_id``.
+
+    The first lookup loads the sheet synchronously; afterwards lookups are
+    plain dictionary hits and stale data is refreshed in a background thread.
+    When ``revision`` is given it is consulted before downloading the rows so
+    an unchanged sheet only costs a metadata call.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], list[dict]],
+        revision: Optional[Callable[[], str | None]] = None,
+        ttl: float = 300.0,
+        miss_refresh_interval: float = 60.0,
+    ) -> None:
+        self._loader = loader
+        self._revision = revision
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self._index: dict[str, dict] = {}
+        self._rev: str | None = None
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def get(self, key: str) -> dict | None:
+        if not self.loaded:
+            self.refresh()
+        row = self._index.get(key)
+        age = time.monotonic() - (self._loaded_at or 0.0)
+        if age >= self.ttl or (row is None and age >= self.miss_refresh_interval):
+            self.refresh_async()
+        return row
+
+    def refresh(self) -> None:
+        """Reload the index if the sheet changed since the last load."""
+        with self._lock:
+            try:
+                rev = self._revision() if self._revision else None
+            except Exception as e:
+                logger.warning("Could not read sheet revision: %s", e)
+                rev = None
+            if rev is not None and rev == self._rev and self._loaded_at is not None:
+                self._loaded_at = time.monotonic()
+                return
+            try:
+                records = self._loader()
+            except Exception as e:
+                logger.error("Error accessing Google Sheets: %s", e)
+                if self._loaded_at is None:
+                    # Avoid hammering the API when the sheet is unreachable.
+                    self._loaded_at = time.monotonic()
+                return
+            index = {}
+            for row in records:
+                key = _row_key(row)
+                if key:
+                    index[key] = row
+            self._index = index
+            self._rev = rev
+            self._loaded_at = time.monotonic()
+            logger.info("Loaded %d users from directory sheet", len(index))
+
+    def refresh_async(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run() -> None:
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+def _authorize():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    creds = Credentials.from_service_account_info(registry.service_account_info(), scopes=SCOPES)
+    return gspread.authorize(creds)
+
 
 class SheetService:
     def __init__(self):
-        creds_json = os.environ.get("service-account")
-        if not creds_json:
-            raise RuntimeError("service-account environment variable not set")
-        creds_info = json.loads(creds_json)
-        creds = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
-        self.client = gspread.authorize(creds)
+        registry.service_account_info()
+        self.client = registry.register("sheets", _authorize)
         self.sheet_id = os.environ.get("GOOGLE_SHEET_ID")
+        self._spreadsheet = None
+        self.directory = UserDirectory(
+            self._load_records,
+            revision=self._load_revision,
+            ttl=float(os.environ.get("SHEETS_CACHE_TTL", "300")),
+        )
+        if self.sheet_id:
+            # Download the directory during warm-up rather than on the first lookup.
+            registry.register("sheets_directory", self.directory.refresh)
 
     TEAM_ID = "T05NRU10WAW"
 
+    def _open(self):
+        if self._spreadsheet is None:
+            self._spreadsheet = self.client.open_by_key(self.sheet_id)
+        return self._spreadsheet
+
+    def _load_records(self) -> list[dict]:
+        metrics.external_call("sheets")
+        return self._open().sheet1.get_all_records()
+
+    def _load_revision(self) -> str | None:
+        return self._open().get_lastUpdateTime()
+
+    @metrics.timed("sheets_get_user")
     def get_user(self, slack_id: str) -> dict | None:
         """Return the user record matching the organization Slack ID."""
         if not self.client or not self.sheet_id:
             return None
-        try:
-            sheet = self.client.open_by_key(self.sheet_id).sheet1
-            records = sheet.get_all_records()
-
-            combined = f"{self.TEAM_ID}-{slack_id}"
-
-            for row in records:
-                key = (
-                    row.get("Slack ID")
-                    or row.get("slack_id")
-                    or row.get("Slack_Id")
-                    or row.get("slack id")
-                )
-                if not key:
-                    continue
-                if key == combined:
-                    return row
-        except Exception as e:
-            logger.error("Error accessing Google Sheets: %s", e)
-        return None
+        return self.directory.get(f"{self.TEAM_ID}-{slack_id}")
@@ -0,0 +1,218 @@
+"""Progressive Slack replies for streamed LLM responses.
+
+A placeholder is posted as soon as a turn starts and then edited with
+``chat.update`` as text arrives, at most once per ``interval`` seconds per
+reply. Slack's Tier 3 limit for ``chat.update`` (about 50 calls per minute)
+applies to the whole app in a workspace, so every streamer in the process
+also draws from one shared :class:`RateLimiter`. Intermediate edits are
+skipped when it is empty; the final text waits for its turn, and a
+``ratelimited`` answer pauses all streamers for its ``Retry-After``. When
+the final edit still fails, the complete text is posted as a new message
+in the thread so the user never keeps a partial reply.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "_Escribiendo…_"
+
+# chat.update calls per minute allowed to this process and burst size. With
+# several instances, divide Slack's limit among them.
+UPDATE_RATE = float(os.environ.get("SLACK_UPDATE_RATE", "50"))
+UPDATE_BURST = float(os.environ.get("SLACK_UPDATE_BURST", "5"))
+
+# Attempts to edit in the final text when Slack answers ``ratelimited``
+# before it is posted as a new message.
+FINAL_ATTEMPTS = 3
+
+
+def _retry_after(error: SlackApiError) -> float:
+    headers = getattr(error.response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class RateLimiter:
+    """Token bucket of ``per_minute`` calls with bursts up to ``burst``."""
+
+    def __init__(self, per_minute: float = UPDATE_RATE, burst: float = UPDATE_BURST) -> None:
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until or self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def reserve(self) -> float:
+        """Take a token, possibly in advance, and return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every call for ``seconds``, as asked by ``Retry-After``."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+# Shared by every streamer of the process.
+LIMITER = RateLimiter()
+
+
+class SlackStreamer:
+    def __init__(
+        self,
+        client,
+        channel: str,
+        thread_ts: str | None,
+        interval: float = 1.0,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.interval = interval
+        self.limiter = limiter or LIMITER
+        self.ts: str | None = None
+        self._last_update = 0.0
+        self._last_text = PLACEHOLDER
+
+    @metrics.timed("slack_post")
+    def start(self) -> str | None:
+        """Post the placeholder; on failure the final text is posted normally."""
+        try:
+            resp = self.client.chat_postMessage(
+                channel=self.channel, text=PLACEHOLDER, mrkdwn=True, thread_ts=self.thread_ts
+            )
+            self.ts = resp.get("ts")
+            self._last_update = time.monotonic()
+        except SlackApiError as e:
+            logger.error("Error posting placeholder: %s", e.response["error"])
+        return self.ts
+
+    def _due(self, text: str) -> bool:
+        return bool(self.ts and text) and time.monotonic() - self._last_update >= self.interval
+
+    def update(self, text: str) -> None:
+        if self._due(text) and self.limiter.try_acquire():
+            self._send(text)
+
+    def finish(self, text: str) -> str | None:
+        """Show the complete ``text`` and return the ts of the message holding it."""
+        if not self.ts:
+            return self._post(text)
+        for _ in range(FINAL_ATTEMPTS):
+            if text == self._last_text:
+                return self.ts
+            time.sleep(self.limiter.reserve())
+            if self._send(text) != "ratelimited":
+                break
+        if text == self._last_text:
+            return self.ts
+        logger.warning("Final edit failed; posting the reply as a new message")
+        return self._post(text)
+
+    @metrics.timed("slack_post")
+    def _post(self, text: str) -> str | None:
+        resp = self.client.chat_postMessage(channel=self.channel, text=text, mrkdwn=True, thread_ts=self.thread_ts)
+        return resp.get("ts")
+
+    def _failed(self, e: SlackApiError) -> str:
+        error = e.response["error"]
+        if error == "ratelimited":
+            self.limiter.pause(_retry_after(e))
+            metrics.stage_errors.inc(stage="slack_ratelimited")
+        logger.warning("Error updating streamed message: %s", error)
+        return error
+
+    @metrics.timed("slack_post")
+    def _send(self, text: str) -> str | None:
+        """Edit the message; return the Slack error, if any."""
+        error = None
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=text, mrkdwn=True)
+            self._last_text = text
+        except SlackApiError as e:
+            error = self._failed(e)
+        self._last_update = time.monotonic()
+        return error
+
+
+class AsyncSlackStreamer(SlackStreamer):
+    """Variant of :class:`SlackStreamer` for ``AsyncWebClient``."""
+
+    @metrics.timed("slack_post")
+    async def start(self) -> str | None:
+        try:
+            resp = await self.client.chat_postMessage(
+                channel=self.channel, text=PLACEHOLDER, mrkdwn=True, thread_ts=self.thread_ts
+            )
+            self.ts = resp.get("ts")
+            self._last_update = time.monotonic()
+        except SlackApiError as e:
+            logger.error("Error posting placeholder: %s", e.response["error"])
+        return self.ts
+
+    async def update(self, text: str) -> None:
+        if self._due(text) and self.limiter.try_acquire():
+            await self._send(text)
+
+    async def finish(self, text: str) -> str | None:
+        if not self.ts:
+            return await self._post(text)
+        for _ in range(FINAL_ATTEMPTS):
+            if text == self._last_text:
+                return self.ts
+            await asyncio.sleep(self.limiter.reserve())
+            if await self._send(text) != "ratelimited":
+                break
+        if text == self._last_text:
+            return self.ts
+        logger.warning("Final edit failed; posting the reply as a new message")
+        return await self._post(text)
+
+    @metrics.timed("slack_post")
+    async def _post(self, text: str) -> str | None:
+        resp = await self.client.chat_postMessage(
+            channel=self.channel, text=text, mrkdwn=True, thread_ts=self.thread_ts
+        )
+        return resp.get("ts")
+
+    @metrics.timed("slack_post")
+    async def _send(self, text: str) -> str | None:
+        error = None
+        try:
+            await self.client.chat_update(channel=self.channel, ts=self.ts, text=text, mrkdwn=True)
+            self._last_text = text
+        except SlackApiError as e:
+            error = self._failed(e)
+        self._last_update = time.monotonic()
+        return error
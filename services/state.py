@@ -1,7 +1,43 @@
-from dataclasses import dataclass, field
-from typing import Optional, Dict
+"""Travel request state collected over a conversation.
 
-@dataclass
+The state is stored in the user document as ``{"_v": SCHEMA_VERSION,
+field: value, ...}``. Loading coerces each field to its type, so booleans
+written as ``False`` or as ``"si"``/``"no"`` by older versions round-trip,
+and keeps keys this version does not know so they survive a save. Field
+assignments are tracked; ``changes`` returns only what a turn modified so
+it can be persisted as a minimal update.
+"""
+
+import logging
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+
+_TRUE = {"si", "sí", "true", "1", "yes", "y"}
+_FALSE = {"no", "false", "0", "n"}
+
+
+def _to_bool(value: Any) -> Optional[bool]:
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    return None
+
+
+def _to_str(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return str(value)
+
+
+@dataclass(slots=True)
 class TravelState:
     """Conversation state for a travel request."""
 
@@ -19,12 +55,62 @@ class TravelState:
     passport: Optional[bool] = None
     visa: Optional[bool] = None
     share_room: Optional[bool] = None
+    # Schema version the state was loaded from; ``None`` when never stored.
+    version: Optional[int] = field(default=None, compare=False, repr=False)
+    _extra: Dict[str, Any] = field(default_factory=dict, init=False, compare=False, repr=False)
+    _dirty: set = field(default_factory=set, init=False, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._dirty.clear()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name in _FIELD_NAMES:
+            dirty = getattr(self, "_dirty", None)
+            if dirty is not None and getattr(self, name, None) != value:
+                dirty.add(name)
+        object.__setattr__(self, name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Fields that hold a value, ``False`` included."""
+        return {name: value for name in _FIELD_NAMES if (value := getattr(self, name)) is not None}
+
+    def to_record(self) -> Dict[str, Any]:
+        """Full stored form: known fields, unknown keys kept from the load and the version."""
+        return {**self._extra, **self.to_dict(), "_v": SCHEMA_VERSION}
 
-    def to_dict(self) -> Dict[str, str]:
-        return {k: v for k, v in self.__dict__.items() if v}
+    def changes(self) -> Dict[str, Any]:
+        """Fields assigned a different value since loading or ``mark_clean``."""
+        return {name: getattr(self, name) for name in _FIELD_NAMES if name in self._dirty}
+
+    def mark_clean(self) -> None:
+        self._dirty.clear()
+
+    @property
+    def needs_full_write(self) -> bool:
+        """Whether the stored state is missing or from another schema version."""
+        return self.version != SCHEMA_VERSION
 
     @classmethod
-    def from_dict(cls, data: Dict[str, str]):
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "TravelState":
         if not data:
             return cls()
-        return cls(**data)
+        state = cls(version=data.get("_v", 1))
+        for key, value in data.items():
+            kind = _FIELD_TYPES.get(key)
+            if kind is None:
+                if key != "_v":
+                    state._extra[key] = value
+                continue
+            coerced = _to_bool(value) if kind is bool else _to_str(value)
+            if coerced is None and value not in (None, ""):
+                logger.debug("Ignoring unreadable state value %s=%r", key, value)
+            object.__setattr__(state, key, coerced)
+        return state
+
+
+_FIELD_TYPES = {
+    f.name: bool if f.type == Optional[bool] else str
+    for f in fields(TravelState)
+    if f.name not in {"version", "_extra", "_dirty"}
+}
+_FIELD_NAMES = tuple(_FIELD_TYPES)
@@ -0,0 +1,66 @@
+"""Shared, pooled HTTP transport for outbound API calls."""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Size the pool like the worker pool so every worker can keep a connection.
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE") or os.environ.get("WORKER_THREADS", "8"))
+RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.3"))
+
+# (connect, read) timeouts in seconds per logical endpoint. Each can be
+# overridden with HTTP_TIMEOUT_<NAME>, e.g. HTTP_TIMEOUT_MAPS=2.
+TIMEOUTS = {
+    "serpapi": (3.05, 10.0),
+    "maps": (3.05, 5.0),
+    "llm": (3.05, 20.0),
+}
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+def timeout_for(endpoint: str) -> tuple[float, float]:
+    connect, read = TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+    override = os.environ.get(f"HTTP_TIMEOUT_{endpoint.upper()}")
+    if override:
+        read = float(override)
+    return connect, read
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=BACKOFF,
+        backoff_jitter=BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide keep-alive session."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get(url: str, endpoint: str, **kwargs) -> requests.Response:
+    """GET ``url`` on the shared session with the timeouts for ``endpoint``."""
+    kwargs.setdefault("timeout", timeout_for(endpoint))
+    return get_session().get(url, **kwargs)
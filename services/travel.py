@@ -1,16 +1,103 @@
+import asyncio
 import logging
-import re
-from typing import Any, List
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Union
 
+from . import metrics
 from .state import TravelState
 
-from .firebase import FirebaseService
+from .firebase import FirebaseService, UserDataBatch
+from .history import Conversation, ConversationStore, MemoryHistoryBackend
 from .sheets import SheetService
 from .ai import ConversationalAI
+from .intents import FastPath, is_general_question
+from .params import build_flight_params
+from .parser import ParsedMessage, flight_preference, parse
+from .search import TripOptions, TripSearch
 from .serpapi import SerpAPIService
 
 logger = logging.getLogger(__name__)
 
+# Constant across users and turns so Gemini can cache it as a prefix.
+SYSTEM_PROMPT = (
+    "Eres un asistente de viajes corporativos integrado con Slack y Google Sheets.\n"
+    "Obtén nombre completo, fecha de nacimiento, seniority y departamento automáticamente a partir del Slack ID.\n"
+    "Solo pregunta por origen, destino, fechas de salida y regreso, venue o motivo del viaje y preferencias opcionales.\n"
+    "No expliques políticas ni detalles técnicos y no pidas datos personales antes de elegir vuelo y hotel.\n"
+    "Muestra únicamente vuelos y hoteles dentro del presupuesto; incluye carry-on en todas las búsquedas de vuelos.\n"
+    "Si el contexto trae opciones de vuelos u hoteles, preséntalas tal cual y no inventes otras.\n"
+    "Cuando el usuario confirme vuelo y hotel, confirma nombre completo y fecha de nacimiento (prellenados) "
+    "y pide número de pasaporte y visa si aplica.\n"
+    "Verifica que los datos sean correctos y envía la solicitud a Finanzas.\n"
+    "Permite correcciones en cualquier momento y evita repeticiones innecesarias."
+)
+
+# Upper bound, in estimated tokens, for the per-turn part of the prompt.
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1500"))
+
+# Answer greetings, thanks and slot follow-ups from templates instead of Gemini.
+FAST_PATH = os.environ.get("FAST_PATH", "1") == "1"
+
+# Turns kept verbatim per thread, extra turns logged before the oldest are
+# summarized, and seconds of inactivity after which a thread starts over.
+HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", "10"))
+HISTORY_COMPACT_EVERY = int(os.environ.get("HISTORY_COMPACT_EVERY", "5"))
+HISTORY_TTL = float(os.environ.get("HISTORY_TTL", str(7 * 24 * 3600)))
+
+# Deadline in seconds for the lookups started together at the beginning of a
+# turn, and threads shared by those lookups.
+PREFETCH_TIMEOUT = float(os.environ.get("PREFETCH_TIMEOUT", "10"))
+PREFETCH_THREADS = int(os.environ.get("PREFETCH_THREADS", "32"))
+
+# Search flights and hotels once origin, destination and both dates are
+# known, with a deadline in seconds and a cache lifetime per trip.
+TRIP_SEARCH = os.environ.get("TRIP_SEARCH", "1") == "1"
+TRIP_SEARCH_TIMEOUT = float(os.environ.get("TRIP_SEARCH_TIMEOUT", "8"))
+TRIP_SEARCH_TTL = float(os.environ.get("TRIP_SEARCH_TTL", "900"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    """How one incoming message will be answered.
+
+    Exactly one of ``prompt`` (ask Gemini) and ``reply`` (templated answer)
+    is set. ``cache_key`` marks general questions whose answer can be
+    shared through the AI response cache; their prompt carries no user data.
+    """
+
+    history: List[dict]
+    state: TravelState
+    conversation: Conversation
+    text: str
+    prompt: str | None = None
+    reply: str | None = None
+    cache_key: str | None = None
+    flight_params: dict | None = None
+    user_data: dict | None = None
+
+
+@dataclass
+class Prefetched:
+    """Results of the lookups started at the beginning of a turn.
+
+    Only the Firestore user document is required; a slow or failing Sheets
+    lookup, history read or flight-parameter extraction leaves its part
+    empty instead of failing the turn.
+    """
+
+    user_data: dict
+    batch: UserDataBatch
+    conversation: Conversation
+    flight_params: dict | None
+
 
 class TravelAssistant:
     """Main orchestrator for travel conversations."""
@@ -21,119 +108,358 @@ class TravelAssistant:
         firebase: FirebaseService,
         ai: ConversationalAI,
         serpapi: SerpAPIService,
+        history_backend=None,
     ) -> None:
         self.sheets = sheets
         self.firebase = firebase
         self.ai = ai
         self.serpapi = serpapi
+        self.conversations = ConversationStore(
+            history_backend or MemoryHistoryBackend(),
+            ttl=HISTORY_TTL,
+            keep=HISTORY_TURNS,
+            compact_every=HISTORY_COMPACT_EVERY,
+        )
+        self.prompt_token_budget = PROMPT_TOKEN_BUDGET
+        self.fast_path = FastPath(enabled=FAST_PATH)
+        self.prefetch_timeout = PREFETCH_TIMEOUT
+        self._pool = ThreadPoolExecutor(max_workers=PREFETCH_THREADS, thread_name_prefix="prefetch")
+        self.trip_search = (
+            TripSearch(serpapi, timeout=TRIP_SEARCH_TIMEOUT, cache_ttl=TRIP_SEARCH_TTL) if TRIP_SEARCH else None
+        )
+
+    def _flight_params(self, text: str) -> dict:
+        # Offline only: city lookups over the network would run on every
+        # message, for any word after "de" or "para", inside the turn.
+        return build_flight_params(parse(text), "")
+
+    def _optional(self, name: str, future: Future, deadline: float):
+        """Result of an optional lookup, or ``None`` if it failed or missed the deadline."""
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            future.cancel()
+            logger.warning("Prefetch of %s skipped: %s", name, str(e) or type(e).__name__)
+            metrics.stage_errors.inc(stage=f"prefetch_{name}")
+            return None
+
+    @metrics.timed("prefetch")
+    def _prefetch(self, slack_id: str, text: str, thread_ts: str | None) -> Prefetched:
+        """Load the user, profile, history and flight parameters concurrently.
+
+        The Sheets profile is requested speculatively and only used when the
+        user has no stored document, so a new user costs the slowest lookup
+        rather than Firestore plus Sheets.
+        """
+        deadline = time.monotonic() + self.prefetch_timeout
+        stored_f = self._pool.submit(self.firebase.get_user_data, slack_id)
+        sheet_f = self._pool.submit(self.sheets.get_user, slack_id)
+        history_f = self._pool.submit(self.conversations.load, slack_id, thread_ts)
+        params_f = self._pool.submit(self._flight_params, text)
+
+        stored = stored_f.result(timeout=max(0.0, deadline - time.monotonic())) or {}
+        if stored:
+            sheet_f.cancel()
+            sheet_user = None
+        else:
+            sheet_user = self._optional("sheets", sheet_f, deadline)
+        conversation = self._optional("history", history_f, deadline)
+        flight_params = self._optional("flight_params", params_f, deadline)
+        return self._prefetched(slack_id, thread_ts, stored, sheet_user, conversation, flight_params)
+
+    @metrics.timed("prefetch")
+    async def _prefetch_async(self, slack_id: str, text: str, thread_ts: str | None) -> Prefetched:
+        """Awaitable variant of :meth:`_prefetch`."""
+        deadline = time.monotonic() + self.prefetch_timeout
+
+        async def optional(name: str, task: asyncio.Task):
+            try:
+                return await asyncio.wait_for(task, max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                logger.warning("Prefetch of %s skipped: %s", name, str(e) or type(e).__name__)
+                metrics.stage_errors.inc(stage=f"prefetch_{name}")
+                return None
+
+        stored_t = asyncio.ensure_future(self.firebase.get_user_data_async(slack_id))
+        sheet_t = asyncio.ensure_future(asyncio.to_thread(self.sheets.get_user, slack_id))
+        history_t = asyncio.ensure_future(self.conversations.load_async(slack_id, thread_ts))
+        params_t = asyncio.ensure_future(asyncio.to_thread(self._flight_params, text))
+
+        try:
+            stored = await asyncio.wait_for(stored_t, self.prefetch_timeout) or {}
+        except BaseException:
+            for task in (sheet_t, history_t, params_t):
+                task.cancel()
+            raise
+        if stored:
+            sheet_t.cancel()
+            sheet_user = None
+        else:
+            sheet_user = await optional("sheets", sheet_t)
+        conversation = await optional("history", history_t)
+        flight_params = await optional("flight_params", params_t)
+        return self._prefetched(slack_id, thread_ts, stored, sheet_user, conversation, flight_params)
 
-    def _load_user(self, slack_id: str) -> dict:
-        """Load user data from Firestore or Sheets."""
-        data = self.firebase.get_user_data(slack_id) or {}
-        if not data:
-            sheet_user = self.sheets.get_user(slack_id)
-            if sheet_user:
-                data.update(sheet_user)
-        if "history" not in data:
-            data["history"] = []
+    def _prefetched(
+        self,
+        slack_id: str,
+        thread_ts: str | None,
+        stored: dict,
+        sheet_user: dict | None,
+        conversation: Conversation | None,
+        flight_params: dict | None,
+    ) -> Prefetched:
+        user_data, batch = self._start_batch(slack_id, stored, sheet_user)
+        if conversation is None:
+            # Keep appending to whatever is stored rather than replacing it.
+            conversation = Conversation(self.conversations.key(slack_id, thread_ts), fresh=False, loaded=False)
+        return Prefetched(user_data, batch, conversation, flight_params)
+
+    def _start_batch(self, slack_id: str, stored: dict, sheet_user: dict | None) -> tuple[dict, UserDataBatch]:
+        batch = UserDataBatch(self.firebase, slack_id, stored)
+        data = dict(stored)
+        if sheet_user:
+            data.update(sheet_user)
         if "state" not in data:
             data["state"] = {}
-        self.firebase.save_user_data(slack_id, data)
-        return data
-
-    def _save_history(self, slack_id: str, history: List[dict]):
-        self.firebase.save_user_data(slack_id, {"history": history})
+        batch.update(data)
+        return data, batch
 
     def _load_state(self, user_data: dict) -> TravelState:
         return TravelState.from_dict(user_data.get("state", {}))
 
-    def _save_state(self, slack_id: str, state: TravelState):
-        self.firebase.save_user_data(slack_id, {"state": state.to_dict()})
+    def _save_state(self, batch: UserDataBatch, state: TravelState):
+        """Stage the state; a current-schema state only writes its changed fields."""
+        if state.needs_full_write:
+            batch.set("state", state.to_record())
+        else:
+            for name, value in state.changes().items():
+                batch.set(("state", name), value)
+        state.mark_clean()
 
-    def _parse_message(self, state: TravelState, text: str):
+    def _parse_message(self, state: TravelState, message: Union[str, ParsedMessage]):
         """Extract basic travel information from the user's message."""
-        if not state.origin or not state.destination:
-            codes = re.findall(r"\b[A-Z]{3}\b", text.upper())
-            if codes:
-                if not state.origin and len(codes) >= 1:
-                    state.origin = codes[0]
-                if not state.destination and len(codes) >= 2:
-                    state.destination = codes[1]
-        if not state.start_date or not state.end_date:
-            dates = re.findall(r"\d{4}-\d{2}-\d{2}", text)
-            if dates:
-                if not state.start_date and len(dates) >= 1:
-                    state.start_date = dates[0]
-                if not state.end_date and len(dates) >= 2:
-                    state.end_date = dates[1]
-        if not state.seat_pref:
-            if "ventana" in text.lower():
-                state.seat_pref = "ventana"
-            elif "pasillo" in text.lower():
-                state.seat_pref = "pasillo"
-        if not state.share_room and "compartir" in text.lower():
-            state.share_room = True
-        if "no compartir" in text.lower():
-            state.share_room = False
-        if not state.passport and "pasaporte" in text.lower():
-            state.passport = "si" in text.lower()
-        if not state.visa and "visa" in text.lower():
-            state.visa = "si" in text.lower()
-        if not state.budget:
-            m = re.search(r"(?:\$|presupuesto\s*)(\d+)", text.lower())
-            if m:
-                state.budget = m.group(1)
-
-    def build_prompt(self, user_data: dict, state: TravelState, history: List[dict], message: str) -> str:
-        policy = (
-            "Eres un asistente de viajes corporativos integrado con Slack y Google Sheets.\n"
-            "Obtén de forma automática nombre completo, fecha de nacimiento, seniority y departamento a partir del Slack ID.\n"
-            "Solo solicita origen, destino, fechas de salida y regreso, venue o motivo del viaje y preferencias opcionales.\n"
-            "No expliques políticas ni detalles técnicos y no pidas datos personales hasta después de elegir vuelo y hotel.\n"
-            "Muestra solo opciones de vuelos y hoteles dentro del presupuesto y siempre incluye carry-on en las búsquedas de vuelos.\n"
-            "Una vez elegidos vuelo y hotel, confirma nombre y fecha de nacimiento prellenados y pide número de pasaporte y visa si aplica.\n"
-            "Verifica la información y envía la solicitud a Finanzas sin repetir datos innecesariamente."
-            "Obtén nombre completo, fecha de nacimiento, seniority y departamento automáticamente con el Slack ID.\n"
-            "Solo pregunta por origen, destino, fechas de salida y regreso, motivo o venue y preferencias opcionales.\n"
-            "Nunca menciones políticas ni pidas datos personales antes de elegir opciones.\n"
-            "Muestra únicamente vuelos y hoteles dentro del presupuesto; incluye carry-on en todas las búsquedas de vuelos.\n"
-            "Cuando el usuario confirme vuelo y hotel, solicita: nombre completo y fecha de nacimiento (prellenados), número de pasaporte y visa si aplica.\n"
-            "Confirma que los datos sean correctos y envía la solicitud a Finanzas.\n"
-            "Permite correcciones en cualquier momento y evita repeticiones innecesarias."
-        )
-        context = "\n".join(
-            f"Usuario: {h['user']}" if 'user' in h else f"Bot: {h['bot']}" for h in history[-5:]
-        )
+        parsed = parse(message) if isinstance(message, str) else message
+        airports = parsed.airports
+        if not state.origin and not state.destination and len(airports) >= 2:
+            state.origin, state.destination = airports[:2]
+        # A single place name is ambiguous ("voy a Madrid"); only codes typed
+        # in capitals fill the next free slot on their own.
+        for code in parsed.codes:
+            if not state.origin:
+                state.origin = code
+            elif not state.destination and code != state.origin:
+                state.destination = code
+        dates = parsed.iso_dates
+        if not state.start_date and dates:
+            state.start_date = dates[0]
+        if not state.end_date and len(dates) >= 2:
+            state.end_date = dates[1]
+        if not state.seat_pref and parsed.seat_pref:
+            state.seat_pref = parsed.seat_pref
+        if parsed.share_room is False or (parsed.share_room and not state.share_room):
+            state.share_room = parsed.share_room
+        if not state.passport and parsed.mentions_passport:
+            state.passport = parsed.affirmative
+        if not state.visa and parsed.mentions_visa:
+            state.visa = parsed.affirmative
+        if not state.budget and parsed.budget:
+            state.budget = parsed.budget
+        if parsed.travel_class or parsed.airline:
+            # Kept as text so a later "mejor en primera" keeps the airline.
+            current = parse(state.flight_pref or "")
+            state.flight_pref = flight_preference(
+                parsed.travel_class or current.travel_class, parsed.airline or current.airline
+            )
+
+    def build_prompt(
+        self,
+        user_data: dict,
+        state: TravelState,
+        history: List[dict],
+        message: str,
+        summary: str = "",
+        options: str = "",
+    ) -> str:
+        """Return the per-turn part of the prompt; the policy goes in ``SYSTEM_PROMPT``.
+
+        Earlier turns are added newest first until ``prompt_token_budget`` is
+        reached, so long conversations drop their oldest turns. ``summary``
+        stands in for the turns the thread no longer keeps and ``options``
+        lists the flights and hotels found for the trip.
+        """
         state_lines = "\n".join(f"{k}: {v}" for k, v in state.to_dict().items()) or "ninguno"
-        required_fields = ["origin", "destination", "start_date", "end_date", "venue"]
-        missing = [f for f in required_fields if not getattr(state, f)]
+        missing = FastPath.missing(state)
         missing_text = ", ".join(missing) if missing else "ninguno"
-        prompt = (
-            f"{policy}\n"
-            f"Datos recopilados:\n{state_lines}\n"
-            f"Faltantes: {missing_text}\n"
-            f"{context}\n"
-            f"Usuario: {message}\nBot:"
-        )
-        return prompt.strip()
+        header = f"Datos recopilados:\n{state_lines}\nFaltantes: {missing_text}"
+        if summary:
+            header += f"\nAntes en este hilo el usuario pidió: {summary}"
+        if options:
+            header += f"\nOpciones dentro del presupuesto (vuelo y hotel juntos):\n{options}"
+        turn = f"Usuario: {message}\nBot:"
+
+        budget = self.prompt_token_budget - estimate_tokens(header) - estimate_tokens(turn)
+        context: List[str] = []
+        for h in reversed(history):
+            line = f"Usuario: {h['user']}" if "user" in h else f"Bot: {h['bot']}"
+            budget -= estimate_tokens(line)
+            if budget < 0:
+                break
+            context.append(line)
+        context.reverse()
+        return "\n".join([header, *context, turn])
+
+    @staticmethod
+    def _apply_airports(state: TravelState, flight_params: dict | None) -> None:
+        """Take origin and destination from a message naming both ("de Guadalajara a Madrid")."""
+        if not flight_params or state.origin or state.destination:
+            return
+        dep, arr = flight_params.get("departure_id"), flight_params.get("arrival_id")
+        if dep and arr:
+            state.origin, state.destination = dep, arr
 
-    def handle_message(self, slack_id: str, text: str) -> str:
-        user_data = self._load_user(slack_id)
-        history = user_data.get("history", [])
+    def _prepare_turn(self, fetched: Prefetched, text: str) -> Turn:
+        """Parse ``text`` into the state and decide how to answer it."""
+        user_data, conversation = fetched.user_data, fetched.conversation
+        history = conversation.messages()
         state = self._load_state(user_data)
-        history.append({"user": text})
+        known = state.to_dict()
 
-        self._parse_message(state, text)
+        self._apply_airports(state, fetched.flight_params)
+        self._parse_message(state, parse(text))
 
-        prompt = self.build_prompt(user_data, state, history, text)
-        response = self.ai.process_message(slack_id, prompt)
+        turn = Turn(
+            history,
+            state,
+            conversation,
+            text,
+            user_data=user_data,
+            reply=self.fast_path.reply(state, known, history, text),
+            flight_params=fetched.flight_params,
+        )
+        if turn.reply is None:
+            if (
+                getattr(self.ai, "response_cache", None) is not None
+                and state.to_dict() == known
+                and not history
+                and not conversation.summary
+                and is_general_question(text)
+            ):
+                turn.prompt = f"Usuario: {text}\nBot:"
+                turn.cache_key = text
+            else:
+                turn.prompt = self.build_prompt(user_data, state, history, text, conversation.summary)
+        path = "rules" if turn.reply is not None else "llm"
+        self.fast_path.record(path)
+        logger.info("Turn answered by %s", path)
+        return turn
+
+    def _searches(self, turn: Turn) -> bool:
+        """Whether the turn goes to Gemini with a trip complete enough to search."""
+        return (
+            self.trip_search is not None
+            and turn.prompt is not None
+            and turn.cache_key is None
+            and TripSearch.ready(turn.state)
+        )
 
-        history.append({"bot": response})
-        self._save_history(slack_id, history[-20:])
-        self._save_state(slack_id, state)
+    def _add_options(self, turn: Turn, options: TripOptions | None) -> None:
+        if options:
+            turn.prompt = self.build_prompt(
+                turn.user_data or {},
+                turn.state,
+                turn.history,
+                turn.text,
+                turn.conversation.summary,
+                options.summary(),
+            )
 
+    def _search_trip(self, turn: Turn) -> None:
+        """Put the trip options in the prompt, or warm the cache for a templated reply."""
+        if self._searches(turn):
+            self._add_options(turn, self.trip_search.run(turn.state))
+        elif self.trip_search is not None and turn.reply is not None and TripSearch.ready(turn.state):
+            self._pool.submit(self.trip_search.run, turn.state)
+
+    async def _search_trip_async(self, turn: Turn) -> None:
+        if self._searches(turn):
+            self._add_options(turn, await self.trip_search.run_async(turn.state))
+        elif self.trip_search is not None and turn.reply is not None and TripSearch.ready(turn.state):
+            self._pool.submit(self.trip_search.run, turn.state)
+
+    @staticmethod
+    def _ai_kwargs(turn: Turn) -> dict[str, Any]:
+        kwargs: dict[str, Any] = {"system_instruction": SYSTEM_PROMPT}
+        if turn.cache_key:
+            kwargs["cache_key"] = turn.cache_key
+        return kwargs
+
+    def _generate(self, slack_id: str, turn: Turn, on_partial: Callable[[str], None] | None) -> str:
+        if turn.reply is not None:
+            return turn.reply
+        if on_partial is None:
+            return self.ai.process_message(slack_id, turn.prompt, **self._ai_kwargs(turn))
+        response = ""
+        for chunk in self.ai.stream_message(slack_id, turn.prompt, **self._ai_kwargs(turn)):
+            response += chunk
+            on_partial(response)
         return response
 
+    async def _generate_async(
+        self, slack_id: str, turn: Turn, on_partial: Callable[[str], Awaitable[None]] | None
+    ) -> str:
+        if turn.reply is not None:
+            return turn.reply
+        if on_partial is None:
+            return await self.ai.process_message_async(slack_id, turn.prompt, **self._ai_kwargs(turn))
+        response = ""
+        async for chunk in self.ai.stream_message_async(slack_id, turn.prompt, **self._ai_kwargs(turn)):
+            response += chunk
+            await on_partial(response)
+        return response
+
+    def handle_message(
+        self,
+        slack_id: str,
+        text: str,
+        on_partial: Callable[[str], None] | None = None,
+        thread_ts: str | None = None,
+    ) -> str:
+        """Answer ``text`` in the conversation of ``thread_ts``.
+
+        ``None`` is the user's conversation outside threads. With
+        ``on_partial``, the reply is passed to that callback as it grows.
+        """
+        fetched = self._prefetch(slack_id, text, thread_ts)
+        turn = self._prepare_turn(fetched, text)
+        self._search_trip(turn)
+        response = self._generate(slack_id, turn, on_partial)
+        self._save_state(fetched.batch, turn.state)
+        fetched.batch.commit()
+        self.conversations.append(turn.conversation, text, response)
+        return response
+
+    async def handle_message_async(
+        self,
+        slack_id: str,
+        text: str,
+        on_partial: Callable[[str], Awaitable[None]] | None = None,
+        thread_ts: str | None = None,
+    ) -> str:
+        """Awaitable variant of :meth:`handle_message` for the ASGI entry point."""
+        fetched = await self._prefetch_async(slack_id, text, thread_ts)
+        turn = self._prepare_turn(fetched, text)
+        await self._search_trip_async(turn)
+        response = await self._generate_async(slack_id, turn, on_partial)
+        self._save_state(fetched.batch, turn.state)
+        await fetched.batch.commit_async()
+        await self.conversations.append_async(turn.conversation, text, response)
+        return response
+
+    def find_options(self, state: TravelState) -> TripOptions | None:
+        """Ranked flights and hotels for ``state``; ``None`` until the trip is complete."""
+        return self.trip_search.run(state) if self.trip_search is not None else None
+
     # Example methods for fetching travel data
     def find_flights(self, origin: str, destination: str, date: str) -> List[dict]:
         return self.serpapi.search_flights(origin, destination, date)
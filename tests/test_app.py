@@ -0,0 +1,190 @@
+import sys, os, json, copy
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-test")
+os.environ.setdefault("BOT_USER_ID", "UBOT")
+os.environ.setdefault("HISTORY_BACKEND", "memory")
+os.environ.setdefault("WARMUP", "0")
+
+if "service-account" not in os.environ:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode()
+    os.environ["service-account"] = json.dumps(
+        {
+            "type": "service_account",
+            "project_id": "dummy",
+            "private_key_id": "dummy",
+            "private_key": private_key,
+            "client_email": "dummy@dummy.iam.gserviceaccount.com",
+            "client_id": "dummy",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }
+    )
+
+import pytest
+from slack_sdk.errors import SlackApiError
+
+import app
+from services.firebase import _apply
+from services.dedup import DedupStore, MemoryDedupBackend
+from services.jobqueue import SqliteJobQueue
+
+
+class FakeSlack:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.posts = []
+
+    def chat_postMessage(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise SlackApiError("fatal_error", {"error": "fatal_error"})
+        self.posts.append(kwargs)
+        return {"ts": f"9.{len(self.posts)}"}
+
+
+class CountingAssistant:
+    def __init__(self):
+        self.calls = []
+
+    def handle_message(self, user, text, on_partial=None, thread_ts=None):
+        self.calls.append((user, text, thread_ts))
+        return f"respuesta {len(self.calls)}"
+
+
+@pytest.fixture
+def slack(monkeypatch, tmp_path):
+    fake = FakeSlack()
+    monkeypatch.setattr(app, "client", fake)
+    monkeypatch.setattr(app, "assistant", CountingAssistant())
+    monkeypatch.setattr(app, "processed_events", DedupStore(MemoryDedupBackend(), ttl=3600))
+    monkeypatch.setattr(app, "job_queue", SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), backoff=0))
+    monkeypatch.setattr(app, "STREAM_RESPONSES", False)
+    return fake
+
+
+def _dm(event_id, msg_id, text="Hola", ts="1.0"):
+    return {
+        "event_id": event_id,
+        "event": {"type": "message", "channel": "D1", "user": "U1", "text": text, "ts": ts, "client_msg_id": msg_id},
+    }
+
+
+def test_retry_after_a_failed_post_only_posts_the_stored_reply(slack):
+    data = _dm("Ev1", "m1")
+    app.job_queue.enqueue(app.job_id(data), data, group="U1")
+    slack.failures = 1
+    job = app.job_queue.lease()
+    with pytest.raises(SlackApiError):
+        app.process_event(job.payload)
+    app.job_queue.fail(job, "fatal_error")
+
+    app.process_event(app.job_queue.lease().payload)
+    assert len(app.assistant.calls) == 1
+    assert [p["text"] for p in slack.posts] == ["respuesta 1"]
+
+
+def test_redelivery_of_the_same_job_is_answered_but_duplicates_are_not(slack):
+    data = _dm("Ev1", "m1")
+    # A worker claimed the message and died before answering.
+    assert app.classify_event(data["event"], "Ev1") == "reply"
+    app.process_event(data)
+    assert len(slack.posts) == 1
+    # The same message delivered as another event is still ignored.
+    app.process_event(_dm("Ev2", "m1"))
+    assert len(slack.posts) == 1
+
+
+def test_bot_user_id_is_retried_after_a_failure(monkeypatch):
+    from services import registry
+
+    class AuthClient:
+        calls = 0
+
+        def auth_test(self):
+            AuthClient.calls += 1
+            if AuthClient.calls == 1:
+                raise SlackApiError("ratelimited", {"error": "ratelimited"})
+            return {"user_id": "UBOT2"}
+
+    monkeypatch.setattr(app, "client", AuthClient())
+    monkeypatch.setattr(app, "BOT_USER_ID", None)
+    monkeypatch.setattr(app, "_bot_user", registry.Lazy("slack_auth", app._fetch_bot_user_id))
+    assert app.bot_user_id() is None
+    assert app.bot_user_id() == "UBOT2"
+
+
+class StubSheets:
+    def get_user(self, slack_id):
+        return None
+
+
+class StubFirebase:
+    def __init__(self):
+        self.docs = {}
+
+    def get_user_data(self, slack_id):
+        return copy.deepcopy(self.docs.get(slack_id))
+
+    def save_user_data(self, slack_id, data):
+        _apply(self.docs.setdefault(slack_id, {}), data)
+
+
+class RecordingAI:
+    def __init__(self):
+        self.prompts = []
+
+    def process_message(self, user, text, system_instruction=None):
+        self.prompts.append(text)
+        return "¿Cuál es el motivo del viaje o el venue del evento?"
+
+
+def test_top_level_dms_share_the_users_conversation(slack, monkeypatch):
+    from services.history import MemoryHistoryBackend
+    from services.serpapi import SerpAPIService
+    from services.travel import TravelAssistant
+
+    ai = RecordingAI()
+    monkeypatch.setattr(
+        app, "assistant", TravelAssistant(StubSheets(), StubFirebase(), ai, SerpAPIService(), MemoryHistoryBackend())
+    )
+    app.process_event(_dm("Ev1", "m1", "Quiero viajar de MEX a MAD el 2025-03-14 y volver el 2025-03-18", ts="1.0"))
+    app.process_event(_dm("Ev2", "m2", "Es para la feria IFEMA", ts="2.0"))
+    # The answer to the venue question is read as the venue, with the history.
+    assert len(ai.prompts) == 2
+    assert "venue: Es para la feria IFEMA" in ai.prompts[-1]
+    assert "Quiero viajar de MEX a MAD" in ai.prompts[-1]
+    # Top-level DMs are answered in the DM, so there is no thread to continue.
+    assert [p["thread_ts"] for p in slack.posts] == [None, None]
+
+
+def test_reply_in_the_bots_thread_continues_the_conversation(slack, monkeypatch):
+    from services.history import MemoryHistoryBackend
+    from services.serpapi import SerpAPIService
+    from services.travel import TravelAssistant
+
+    ai = RecordingAI()
+    monkeypatch.setattr(
+        app, "assistant", TravelAssistant(StubSheets(), StubFirebase(), ai, SerpAPIService(), MemoryHistoryBackend())
+    )
+    mention = {
+        "event_id": "Ev1",
+        "event": {"type": "app_mention", "channel": "C1", "user": "U1", "ts": "1.0", "client_msg_id": "m1",
+                  "text": "<@UBOT> Quiero viajar de MEX a MAD el 2025-03-14 y volver el 2025-03-18"},
+    }
+    app.process_event(mention)
+    assert slack.posts[-1]["thread_ts"] == "1.0"
+
+    follow_up = {
+        "event_id": "Ev2",
+        "event": {"type": "app_mention", "channel": "C1", "user": "U1", "ts": "2.0", "thread_ts": "1.0",
+                  "client_msg_id": "m2", "text": "<@UBOT> Es para la feria IFEMA"},
+    }
+    app.process_event(follow_up)
+    assert slack.posts[-1]["thread_ts"] == "1.0"
+    assert len(ai.prompts) == 2 and "Quiero viajar de MEX a MAD" in ai.prompts[-1]
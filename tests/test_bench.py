@@ -0,0 +1,24 @@
+import sys, os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from bench.load import _events, percentile
+from bench.micro import compare
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+def test_events_walk_each_user_through_the_conversation():
+    events = _events(6, users=3)
+    assert [e["event"]["user"] for e in events[:3]] == ["U00000", "U00001", "U00002"]
+    assert events[0]["event"]["text"] == events[1]["event"]["text"] != events[3]["event"]["text"]
+    assert len({e["event_id"] for e in events}) == 6
+
+
+def test_compare_flags_slow_cases():
+    assert compare({"a": 30.0, "b": 10.0}, {"a": 10.0, "b": 10.0}, 2.0) == ["a"]
@@ -0,0 +1,69 @@
+import sys, os, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.cache import MISSING, MemoryCacheBackend, ResponseCache, SqliteCacheBackend
+
+
+def test_key_ignores_api_key_and_order():
+    a = ResponseCache.key("search", {"engine": "google_flights", "q": "x", "api_key": "1"})
+    b = ResponseCache.key("search", {"q": "x", "engine": "google_flights", "api_key": "2"})
+    assert a == b
+
+
+def test_hits_and_misses():
+    cache = ResponseCache(ttls={"google_flights": 60})
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"flights_results": []}
+
+    params = {"engine": "google_flights", "departure_id": "MEX"}
+    cache.get_or_fetch("search", params, fetch)
+    cache.get_or_fetch("search", dict(params), fetch)
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_concurrent_requests_are_coalesced():
+    cache = ResponseCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"ok": True}
+
+    params = {"engine": "google_hotels", "q": "SFO"}
+    threads = [threading.Thread(target=cache.get_or_fetch, args=("search", params, fetch)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+
+
+def test_failures_are_not_cached():
+    cache = ResponseCache()
+    cache.get_or_fetch("search", {"q": "x"}, lambda: None)
+    assert cache.get_or_fetch("search", {"q": "x"}, lambda: {"ok": 1}) == {"ok": 1}
+
+
+def test_lru_eviction():
+    backend = MemoryCacheBackend(max_size=2)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.get("a")
+    backend.set("c", 3, 60)
+    assert backend.get("b") is MISSING
+    assert backend.get("a") == 1
+
+
+def test_sqlite_backend_round_trip(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "cache.sqlite3"))
+    backend.set("k", {"a": [1, 2]}, 60)
+    backend.set("expired", 1, -1)
+    assert backend.get("k") == {"a": [1, 2]}
+    assert backend.get("expired") is MISSING
+    assert backend.get("missing") is MISSING
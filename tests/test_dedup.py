@@ -0,0 +1,111 @@
+import sys, os, time, copy, datetime
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from google.api_core import exceptions
+
+from services.dedup import DedupStore, FirestoreDedupBackend, MemoryDedupBackend
+
+
+def test_claim_rejects_duplicates_until_expiry():
+    store = DedupStore(MemoryDedupBackend(), ttl=0.05)
+    assert store.claim("Ev1")
+    assert not store.claim("Ev1")
+    assert "Ev1" in store
+    time.sleep(0.06)
+    assert store.claim("Ev1")
+
+
+def test_memory_backend_is_bounded():
+    backend = MemoryDedupBackend(max_size=3)
+    store = DedupStore(backend, ttl=60)
+    for i in range(10):
+        store.add(f"ts{i}")
+    assert len(backend) <= 3
+    assert "ts9" in store
+
+
+def test_release_allows_retry():
+    store = DedupStore(ttl=60)
+    assert store.claim("Ev1")
+    store.release("Ev1")
+    assert store.claim("Ev1")
+    assert store.claim(None)
+
+
+def test_owner_can_claim_again_and_leases_lapse():
+    store = DedupStore(ttl=60)
+    assert store.claim("msg1", owner="Ev1", ttl=0.05)
+    assert store.claim("msg1", owner="Ev1", ttl=0.05)
+    assert not store.claim("msg1", owner="Ev2")
+    time.sleep(0.06)
+    assert store.claim("msg1", owner="Ev2", ttl=0.05)
+    store.keep("msg1", owner="Ev2")
+    time.sleep(0.06)
+    assert not store.claim("msg1", owner="Ev3")
+
+
+def test_memory_backend_expires_entries_with_shorter_ttls():
+    backend = MemoryDedupBackend()
+    backend.add("long", 60)
+    backend.add("short", 0.05)
+    time.sleep(0.06)
+    assert not backend.contains("short")
+    assert len(backend) == 1
+
+
+class FakeSnapshot:
+    def __init__(self, data, update_time):
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeClaimDoc:
+    """One Firestore document; ``on_get`` runs once right after a read."""
+
+    def __init__(self, data):
+        self.data = data
+        self.update_time = 1
+        self.on_get = None
+
+    def collection(self, name):
+        return self
+
+    def document(self, key):
+        return self
+
+    @staticmethod
+    def write_option(last_update_time):
+        return last_update_time
+
+    def create(self, data):
+        if self.data is not None:
+            raise exceptions.AlreadyExists("exists")
+        self.data, self.update_time = dict(data), self.update_time + 1
+
+    def get(self):
+        snapshot = FakeSnapshot(self.data, self.update_time)
+        hook, self.on_get = self.on_get, None
+        if hook:
+            hook()
+        return snapshot
+
+    def update(self, data, option=None):
+        if option != self.update_time:
+            raise exceptions.FailedPrecondition("stale update_time")
+        self.data, self.update_time = {**self.data, **data}, self.update_time + 1
+
+
+def test_firestore_backend_gives_an_expired_claim_to_one_worker():
+    past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    doc = FakeClaimDoc({"expires_at": past, "owner": "Ev0"})
+    backend = FirestoreDedupBackend(doc)
+    results = {}
+    # Worker B takes the claim between worker A's read and its write.
+    doc.on_get = lambda: results.setdefault("B", backend.add("msg1", 60, "Ev2"))
+    results["A"] = backend.add("msg1", 60, "Ev1")
+    assert results == {"B": True, "A": False}
+    assert doc.data["owner"] == "Ev2"
@@ -0,0 +1,37 @@
+import sys, os, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.executor import KeyedExecutor
+
+
+def test_same_key_runs_serially():
+    executor = KeyedExecutor(max_workers=4, max_pending=10)
+    active = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(1)
+        time.sleep(0.01)
+        with lock:
+            active.pop()
+
+    for _ in range(5):
+        assert executor.submit("U1", task)
+    executor.shutdown()
+    assert not overlaps
+    assert executor.stats()["pending"] == 0
+
+
+def test_rejects_when_saturated():
+    executor = KeyedExecutor(max_workers=1, max_pending=2)
+    gate = threading.Event()
+    assert executor.submit("U1", gate.wait)
+    assert executor.submit("U2", gate.wait)
+    assert not executor.submit("U3", gate.wait)
+    gate.set()
+    executor.shutdown()
+    assert executor.stats()["rejected"] == 1
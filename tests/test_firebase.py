@@ -0,0 +1,131 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from google.api_core import exceptions
+
+from services.firebase import FirebaseService, SessionCache
+
+
+class FakeSnapshot:
+    def __init__(self, data, update_time):
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDocument:
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+
+    def get(self):
+        self.store.reads += 1
+        data, version = self.store.docs.get(self.key, (None, None))
+        return FakeSnapshot(data, version)
+
+    def _write(self, data):
+        self.store.version += 1
+        current = self.store.docs.get(self.key, ({}, None))[0]
+        current = dict(current or {})
+        current.update({k.strip("`"): v for k, v in data.items()})
+        self.store.docs[self.key] = (current, self.store.version)
+        return type("WriteResult", (), {"update_time": self.store.version})()
+
+    def set(self, data, merge=False):
+        return self._write(data)
+
+    def create(self, data):
+        if self.key in self.store.docs:
+            raise exceptions.AlreadyExists("exists")
+        return self._write(data)
+
+    def update(self, data, option=None):
+        if option is not None and self.store.docs[self.key][1] != option:
+            raise exceptions.FailedPrecondition("stale")
+        return self._write(data)
+
+
+class FakeClient:
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.version = 0
+
+    def collection(self, name):
+        return self
+
+    def document(self, key):
+        return FakeDocument(self, key)
+
+    def write_option(self, last_update_time):
+        return last_update_time
+
+
+def make_service():
+    service = FirebaseService.__new__(FirebaseService)
+    service.client = FakeClient()
+    service.cache = SessionCache(max_size=10, ttl=60)
+    return service
+
+
+def test_session_cache_serves_later_turns_without_reads():
+    service = make_service()
+    assert service.get_user_data("U1") is None
+    service.save_user_data("U1", {"history": [{"user": "hola"}]})
+    data = service.get_user_data("U1")
+    assert data == {"history": [{"user": "hola"}]}
+    assert service.client.reads == 1
+
+
+def test_session_cache_invalidates_on_version_mismatch():
+    service = make_service()
+    service.client.docs["U1"] = ({"state": {}}, 1)
+    service.client.version = 1
+    service.get_user_data("U1")
+    # Another instance writes the document.
+    service.client.docs["U1"] = ({"state": {"origin": "MEX"}}, 2)
+    service.client.version = 2
+    service.save_user_data("U1", {"history": []})
+    assert service.client.docs["U1"] == ({"state": {"origin": "MEX"}, "history": []}, 3)
+    assert service.cache.get("U1").version == 3
+    assert service.get_user_data("U1") == {"state": {"origin": "MEX"}, "history": []}
+
+
+def test_conflicting_full_state_write_only_reapplies_changed_fields():
+    service = make_service()
+    service.client.docs["U1"] = ({"state": {"origin": "MEX"}}, 1)
+    service.client.version = 1
+    service.get_user_data("U1")
+    # Another instance stores the venue meanwhile.
+    service.client.docs["U1"] = ({"state": {"origin": "MEX", "venue": "IFEMA"}}, 2)
+    service.client.version = 2
+    service.save_user_data("U1", {"state": {"_v": 2, "origin": "MEX", "destination": "MAD"}})
+    stored = service.client.docs["U1"][0]
+    assert stored["state"] == {"origin": "MEX", "venue": "IFEMA"}
+    assert stored["state._v"] == 2 and stored["state.destination"] == "MAD"
+    assert "state.origin" not in stored
+    assert service.get_user_data("U1")["state"] == {"origin": "MEX", "venue": "IFEMA", "_v": 2, "destination": "MAD"}
+    assert service.client.reads == 2
+
+
+def test_session_cache_evicts_least_recently_used():
+    cache = SessionCache(max_size=2, ttl=60)
+    cache.put("a", {})
+    cache.put("b", {})
+    cache.get("a")
+    cache.put("c", {})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+
+def test_nested_field_updates_keep_sibling_fields():
+    service = make_service()
+    service.client.docs["U1"] = ({"state": {"origin": "MEX"}}, 1)
+    service.client.version = 1
+    service.get_user_data("U1")
+    service.save_user_data("U1", {("state", "destination"): "NYC"})
+    assert "state.destination" in service.client.docs["U1"][0]
+    assert service.get_user_data("U1") == {"state": {"origin": "MEX", "destination": "NYC"}}
@@ -0,0 +1,20 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.gazetteer import get_gazetteer
+
+
+def test_exact_names_and_aliases():
+    g = get_gazetteer()
+    assert g.lookup("Guadalajara") == "GDL"
+    assert g.lookup("Bogotá") == "BOG"
+    assert g.lookup("nueva york") == "NYC"
+    assert "CUN" in g
+    assert len(g.codes) > 5000
+
+
+def test_typo_tolerant_lookup():
+    g = get_gazetteer()
+    assert g.fuzzy_lookup("Guadalajra") == "GDL"
+    assert g.fuzzy_lookup("San Fransisco") == "SFO"
+    assert g.fuzzy_lookup("Presupuesto") is None
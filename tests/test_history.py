@@ -0,0 +1,174 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import datetime
+
+from google.api_core import exceptions
+from google.cloud import firestore
+
+from services.history import (
+    ANY_VERSION,
+    Conversation,
+    ConversationStore,
+    FirestoreHistoryBackend,
+    HistoryConflict,
+    MemoryHistoryBackend,
+    summarize,
+)
+
+
+class CountingBackend(MemoryHistoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes = []
+
+    def get(self, key):
+        self.reads += 1
+        return super().get(key)
+
+    def write(self, key, turn, removed, summary, expires_at, reset, version=ANY_VERSION):
+        self.writes.append((turn, removed, summary, reset))
+        return super().write(key, turn, removed, summary, expires_at, reset, version)
+
+
+def test_turns_are_appended_one_at_a_time():
+    backend = CountingBackend()
+    store = ConversationStore(backend, keep=3, compact_every=2)
+    for i in range(5):
+        conversation = store.load("U1", "1.0")
+        store.append(conversation, f"pregunta {i}", f"respuesta {i}")
+    assert backend.reads == 1
+    assert [w[0]["n"] for w in backend.writes] == [0, 1, 2, 3, 4]
+    assert all(not removed and summary is None for _, removed, summary, _ in backend.writes)
+    assert backend.writes[0][3] is True and backend.writes[1][3] is False
+
+
+def test_turns_appended_by_another_instance_are_read_before_numbering():
+    backend = CountingBackend()
+    first, second = ConversationStore(backend), ConversationStore(backend)
+    first.append(first.load("U1", "1.0"), "pregunta 0", "respuesta 0")
+    second.append(second.load("U1", "1.0"), "pregunta 1", "respuesta 1")
+    # ``first`` still caches one turn; its append is renumbered after the other instance's.
+    conversation = first.load("U1", "1.0")
+    first.append(conversation, "pregunta 2", "respuesta 2")
+    assert [t["n"] for t in conversation.turns] == [0, 1, 2]
+    stored = ConversationStore(backend).load("U1", "1.0")
+    assert [t["u"] for t in stored.turns] == ["pregunta 0", "pregunta 1", "pregunta 2"]
+    assert len({t["n"] for t in stored.turns}) == 3
+
+
+def test_unloaded_conversation_is_not_cached_and_sorts_last():
+    backend = CountingBackend()
+    store = ConversationStore(backend)
+    for i in range(2):
+        store.append(store.load("U1"), f"pregunta {i}", f"respuesta {i}")
+    # The history read timed out for this turn.
+    store.append(Conversation(store.key("U1", None), fresh=False, loaded=False), "pregunta 2", "respuesta 2")
+    conversation = store.load("U1")
+    assert backend.reads == 2
+    assert [t["u"] for t in conversation.turns] == ["pregunta 0", "pregunta 1", "pregunta 2"]
+
+
+def test_old_turns_are_folded_into_the_summary():
+    backend = CountingBackend()
+    store = ConversationStore(backend, keep=3, compact_every=2)
+    conversation = store.load("U1", "1.0")
+    for i in range(6):
+        store.append(conversation, f"pregunta {i}", f"respuesta {i}")
+    assert [t["n"] for t in conversation.turns] == [3, 4, 5]
+    assert conversation.summary == "pregunta 0 | pregunta 1 | pregunta 2"
+    _, removed, summary, _ = backend.writes[-1]
+    assert [t["n"] for t in removed] == [0, 1, 2]
+    fresh = ConversationStore(backend).load("U1", "1.0")
+    assert [t["n"] for t in fresh.turns] == [3, 4, 5]
+    assert fresh.summary == summary
+
+
+def test_threads_are_separate_and_idle_ones_expire():
+    backend = MemoryHistoryBackend()
+    store = ConversationStore(backend, ttl=60)
+    store.append(store.load("U1", "1.0"), "hola", "hola")
+    assert store.load("U1", "2.0").turns == []
+    doc = backend._docs["U1:1.0"]
+    doc["expires_at"] = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    assert ConversationStore(backend).load("U1", "1.0").turns == []
+
+
+def test_summary_stays_bounded():
+    summary = summarize("", [{"u": "x" * 500} for _ in range(20)])
+    assert len(summary) <= 800
+
+
+class FakeBatch:
+    def __init__(self, conflict=False):
+        self.ops = []
+        self.conflict = conflict
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(("set", data, merge))
+
+    def create(self, ref, data):
+        self.ops.append(("create", data))
+
+    def update(self, ref, data, option=None):
+        self.ops.append(("update", data, option))
+
+    def commit(self):
+        if self.conflict:
+            raise exceptions.FailedPrecondition("stale update_time")
+        return [type("WriteResult", (), {"update_time": len(self.ops)})() for _ in self.ops]
+
+
+class FakeClient:
+    def __init__(self, conflict=False):
+        self.batches = []
+        self.conflict = conflict
+
+    @staticmethod
+    def write_option(last_update_time):
+        return ("last_update_time", last_update_time)
+
+    def collection(self, name):
+        return self
+
+    def document(self, key):
+        return key
+
+    def batch(self):
+        self.batches.append(FakeBatch(self.conflict))
+        return self.batches[-1]
+
+
+def test_firestore_backend_appends_and_removes_in_one_batch():
+    client = FakeClient()
+    backend = FirestoreHistoryBackend(type("Firebase", (), {"client": client})())
+    expires = datetime.datetime.now(datetime.timezone.utc)
+    turn = {"n": 6, "u": "hola", "b": "hola"}
+    backend.write("U1:1.0", turn, [{"n": 0, "u": "a", "b": "b"}], "a", expires, False)
+    (kind, data, merge), (_, removal, _) = client.batches[0].ops
+    assert merge is True
+    assert isinstance(data["turns"], firestore.ArrayUnion)
+    assert data["summary"] == "a"
+    assert isinstance(removal["turns"], firestore.ArrayRemove)
+
+
+def test_firestore_backend_conditions_appends_on_the_read_version():
+    client = FakeClient()
+    backend = FirestoreHistoryBackend(type("Firebase", (), {"client": client})())
+    expires = datetime.datetime.now(datetime.timezone.utc)
+    turn = {"n": 0, "u": "hola", "b": "hola"}
+    assert backend.write("U1:1.0", turn, [], None, expires, True, None) == 1
+    assert client.batches[-1].ops[0][0] == "create"
+    backend.write("U1:1.0", turn, [], None, expires, False, "t1")
+    kind, data, option = client.batches[-1].ops[0]
+    assert kind == "update" and option == ("last_update_time", "t1")
+    client.conflict = True
+    try:
+        backend.write("U1:1.0", turn, [], None, expires, False, "t1")
+    except HistoryConflict:
+        pass
+    else:
+        raise AssertionError("a stale version must raise HistoryConflict")
@@ -0,0 +1,47 @@
+import sys, os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.intents import FIELD_QUESTIONS, FastPath
+from services.state import TravelState
+
+
+def test_greeting_asks_for_first_missing_field():
+    reply = FastPath().reply(TravelState(), {}, [], "¡Hola!")
+    assert reply.startswith("¡Hola!")
+    assert reply.endswith(FIELD_QUESTIONS["origin"].lower())
+
+
+def test_confirmation_with_complete_state_goes_to_llm():
+    state = TravelState(origin="MEX", destination="NYC", start_date="2025-03-14", end_date="2025-03-18", venue="Expo")
+    assert FastPath().reply(state, state.to_dict(), [], "Sí, perfecto") is None
+
+
+def test_free_text_answer_fills_asked_field():
+    state = TravelState(origin="MEX", destination="NYC", start_date="2025-03-14", end_date="2025-03-18")
+    history = [{"bot": "Anotado: regreso 2025-03-18. " + FIELD_QUESTIONS["venue"]}]
+    assert FastPath().reply(state, state.to_dict(), history, "Conferencia anual de ventas") is None
+    assert state.venue == "Conferencia anual de ventas"
+
+
+def test_questions_and_disabled_fast_path_go_to_llm():
+    assert FastPath().reply(TravelState(origin="MEX"), {}, [], "¿MEX tiene lounge?") is None
+    assert FastPath(enabled=False).reply(TravelState(), {}, [], "Hola") is None
+
+
+def test_confirmation_to_llm_question_goes_to_llm():
+    state = TravelState(origin="MEX", destination="MAD", start_date="2025-03-14", end_date="2025-03-18")
+    history = [{"user": "¿Qué vuelos hay?", "bot": "Encontré uno de Iberia. ¿Quieres que reserve el vuelo de Iberia?"}]
+    assert FastPath().reply(state, state.to_dict(), history, "Sí") is None
+
+
+def test_confirmation_to_field_question_repeats_it():
+    state = TravelState(origin="MEX")
+    history = [{"bot": "Anotado: origen MEX. " + FIELD_QUESTIONS["destination"]}]
+    assert FastPath().reply(state, state.to_dict(), history, "ok") == FIELD_QUESTIONS["destination"]
+
+
+def test_greeting_mid_conversation_goes_to_llm():
+    state = TravelState(origin="MEX")
+    history = [{"user": "Salgo de MEX", "bot": "Anotado: origen MEX. " + FIELD_QUESTIONS["destination"]}]
+    assert FastPath().reply(state, state.to_dict(), history, "Hola") is None
@@ -0,0 +1,84 @@
+import sys, os, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.jobqueue import SqliteJobQueue
+from worker import consume
+
+
+def test_enqueue_is_idempotent_and_groups_run_one_at_a_time(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"))
+    assert queue.enqueue("Ev1", {"n": 1}, group="U1")
+    assert not queue.enqueue("Ev1", {"n": 1}, group="U1")
+    queue.enqueue("Ev2", {"n": 2}, group="U1")
+    queue.enqueue("Ev3", {"n": 3}, group="U2")
+    first = queue.lease()
+    second = queue.lease()
+    assert (first.id, second.id) == ("Ev1", "Ev3")
+    assert queue.lease() is None
+    queue.complete(first)
+    assert queue.lease().id == "Ev2"
+    assert queue.stats() == {"queued": 0, "running": 2, "done": 1, "dead": 0}
+
+
+def test_failed_jobs_back_off_then_die(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, backoff=0.05)
+    queue.enqueue("Ev1", {}, group="U1")
+    job = queue.lease()
+    queue.fail(job, "boom")
+    assert queue.lease() is None
+    time.sleep(0.06)
+    job = queue.lease()
+    assert job.attempts == 2
+    queue.fail(job, "boom")
+    assert queue.stats()["dead"] == 1
+
+
+def test_expired_leases_are_redelivered(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), visibility_timeout=0)
+    queue.enqueue("Ev1", {}, group="U1")
+    assert queue.lease().attempts == 1
+    time.sleep(0.01)
+    assert queue.lease().attempts == 2
+
+
+def test_consumer_completes_and_retries(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), backoff=60)
+    queue.enqueue("ok", {"fail": False}, group="U1")
+    queue.enqueue("bad", {"fail": True}, group="U2")
+    stop = threading.Event()
+
+    def handler(payload):
+        if payload["fail"]:
+            raise RuntimeError("Slack down")
+
+    worker = threading.Thread(target=consume, args=(queue, handler, stop, 0.01))
+    worker.start()
+    deadline = time.time() + 5
+    while queue.stats()["done"] < 1 or queue.stats()["running"] > 0:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    stop.set()
+    worker.join()
+    assert queue.stats() == {"queued": 1, "running": 0, "done": 1, "dead": 0}
+
+
+def test_expired_leases_count_toward_max_attempts(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), visibility_timeout=0, max_attempts=2)
+    queue.enqueue("Ev1", {}, group="U1")
+    queue.lease()
+    time.sleep(0.01)
+    assert queue.lease().attempts == 2
+    time.sleep(0.01)
+    assert queue.lease() is None
+    assert queue.stats()["dead"] == 1
+
+
+def test_saved_reply_is_delivered_with_the_retry(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / "jobs.sqlite3"), backoff=0)
+    queue.enqueue("Ev1", {"event": {}}, group="U1")
+    job = queue.lease()
+    assert "_reply" not in job.payload
+    queue.save_reply(job.id, "Listo")
+    queue.fail(job, "Slack down")
+    assert queue.lease().payload["_reply"] == "Listo"
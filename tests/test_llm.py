@@ -0,0 +1,93 @@
+import sys, os, asyncio, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.llm import CircuitBreaker, ResilientLLM, StreamTruncated
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+class FakeBackend:
+    def __init__(self, name, replies):
+        self.name = name
+        self.replies = list(replies)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        reply = self.replies.pop(0) if self.replies else Unavailable()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def generate(self, text, system_instruction, timeout):
+        return self._next()
+
+    async def generate_async(self, text, system_instruction, timeout):
+        return self._next()
+
+    def stream(self, text, system_instruction, timeout):
+        yield "Hola, "
+        yield self._next()
+
+
+def test_retries_transient_errors_then_falls_back():
+    flash = FakeBackend("flash", [Unavailable(), Unavailable()])
+    lite = FakeBackend("lite", ["respuesta"])
+    llm = ResilientLLM([flash, lite], retries=1, backoff=0)
+    assert llm.generate("hola") == "respuesta"
+    assert (flash.calls, lite.calls) == (2, 1)
+
+
+def test_non_transient_errors_are_not_retried():
+    flash = FakeBackend("flash", [ValueError("bad request")])
+    llm = ResilientLLM([flash], retries=2, backoff=0)
+    assert llm.generate("hola") is None
+    assert flash.calls == 1
+
+
+def test_circuit_breaker_half_open_recovery():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_skips_backend():
+    flash = FakeBackend("flash", [])
+    lite = FakeBackend("lite", ["uno", "dos"])
+    llm = ResilientLLM([flash, lite], retries=0, breaker_threshold=1, breaker_reset=60)
+    assert llm.generate("hola") == "uno"
+    assert llm.generate("hola") == "dos"
+    assert flash.calls == 1
+    assert llm.stats() == {"flash": "open", "lite": "closed"}
+
+
+def test_async_generate_and_deadline():
+    lite = FakeBackend("lite", ["respuesta"])
+    assert asyncio.run(ResilientLLM([lite]).generate_async("hola")) == "respuesta"
+    assert ResilientLLM([FakeBackend("flash", ["x"])], deadline=0).generate("hola") is None
+
+
+def test_stream_keeps_partial_reply_on_failure():
+    flash = FakeBackend("flash", [Unavailable()])
+    lite = FakeBackend("lite", ["mundo"])
+    llm = ResilientLLM([flash, lite], backoff=0)
+    chunks = []
+    try:
+        for chunk in llm.stream("hola"):
+            chunks.append(chunk)
+    except StreamTruncated:
+        pass
+    else:
+        raise AssertionError("a cut-off stream must raise StreamTruncated")
+    assert chunks == ["Hola, "]
+    assert lite.calls == 0
@@ -0,0 +1,42 @@
+import sys, os, asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services import metrics
+
+
+def test_timed_records_functions_generators_and_coroutines():
+    @metrics.timed("test_sync")
+    def sync():
+        return 1
+
+    @metrics.timed("test_gen")
+    def gen():
+        yield "a"
+        yield "b"
+
+    @metrics.timed("test_async")
+    async def fails():
+        raise ValueError("boom")
+
+    assert sync() == 1
+    assert list(gen()) == ["a", "b"]
+    try:
+        asyncio.run(fails())
+    except ValueError:
+        pass
+    assert metrics.stage_seconds.count(stage="test_sync") == 1
+    assert metrics.stage_seconds.count(stage="test_gen") == 1
+    assert metrics.stage_errors.value(stage="test_async") == 1
+
+
+def test_render_prometheus_text():
+    metrics.stage_seconds.observe(0.2, stage="test_render")
+    metrics.external_call("test_service", ok=False)
+    metrics.register_gauge("test_pool", "Test gauge.", lambda: {"pending": 3})
+    text = metrics.render()
+    assert 'travelbot_stage_seconds_bucket{stage="test_render",le="0.1"} 0' in text
+    assert 'travelbot_stage_seconds_bucket{stage="test_render",le="0.25"} 1' in text
+    assert 'travelbot_stage_seconds_count{stage="test_render"} 1' in text
+    assert 'travelbot_external_errors_total{service="test_service"} 1' in text
+    assert 'travelbot_test_pool{stat="pending"} 3' in text
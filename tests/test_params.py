@@ -44,3 +44,94 @@ def test_default_dates_future_weekdays():
     assert out.weekday() < 5
     assert params["bags"] == "1"
 
+
+def test_known_cities_resolve_without_network(monkeypatch):
+    import services.params as params_module
+
+    def fail(*args, **kwargs):
+        raise AssertionError("unexpected network lookup")
+
+    monkeypatch.setattr(params_module, "_lookup_city", fail)
+    text = "Quiero viajar de Ciudad de México a San Francisco la próxima semana"
+    params = build_flight_params(text, api_key="demo")
+    assert params["departure_id"] == "MEX"
+    assert params["arrival_id"] == "SFO"
+
+
+def test_unknown_places_are_looked_up_once_in_a_batch(monkeypatch):
+    import services.params as params_module
+
+    calls = []
+
+    def lookup(name, api_key):
+        calls.append(name)
+        return {"AEROPOLIS": "TYO"}.get(name)
+
+    monkeypatch.setattr(params_module, "_lookup_city", lookup)
+    text = "Vuelo de CDMX a Aeropolis, repito: a Aeropolis"
+    params = build_flight_params(text, api_key="demo")
+    assert params["departure_id"] == "MEX"
+    assert params["arrival_id"] == "TYO"
+    assert calls == ["AEROPOLIS"]
+
+
+class _FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_lookup_city_caches_hits_and_misses(monkeypatch, tmp_path):
+    import services.params as params_module
+
+    monkeypatch.setenv("CITY_CACHE_PATH", str(tmp_path / "cities.sqlite3"))
+    monkeypatch.setattr(params_module, "_city_cache", None)
+    calls = []
+
+    def get(url, endpoint, params):
+        calls.append(params["q"])
+        if "Narita" in params["q"]:
+            return _FakeResponse({"local_results": [{"title": "Narita International Airport (NRT)"}]})
+        return _FakeResponse({"local_results": []})
+
+    monkeypatch.setattr(params_module.transport, "get", get)
+    for _ in range(3):
+        assert params_module._lookup_city("Narita", "demo") == "NRT"
+        assert params_module._lookup_city("Quiero", "demo") is None
+    assert len(calls) == 2
+
+    # A fresh process reuses the file-backed entries.
+    monkeypatch.setattr(params_module, "_city_cache", None)
+    assert params_module._lookup_city("narita", "demo") == "NRT"
+    assert len(calls) == 2
+
+
+def test_city_cache_seed(monkeypatch, tmp_path):
+    import json
+    import services.params as params_module
+
+    seed = tmp_path / "seed.json"
+    seed.write_text(json.dumps({"Monterrey": "MTY", "Semana": None}))
+    monkeypatch.setenv("CITY_CACHE_PATH", "")
+    monkeypatch.setenv("CITY_CACHE_SEED", str(seed))
+    monkeypatch.setattr(params_module, "_city_cache", None)
+    monkeypatch.setattr(params_module.transport, "get", None)
+    assert params_module._lookup_city("Monterrey", "demo") == "MTY"
+    assert params_module._lookup_city("semana", "demo") is None
+
+
+def test_gazetteer_resolves_typos_offline(monkeypatch):
+    import services.params as params_module
+
+    def fail(*args, **kwargs):
+        raise AssertionError("unexpected network lookup")
+
+    monkeypatch.setattr(params_module, "_lookup_city", fail)
+    params = build_flight_params("Vuelo de Guadalajra a San Fransisco el 5 de mayo", api_key="demo")
+    assert params["departure_id"] == "GDL"
+    assert params["arrival_id"] == "SFO"
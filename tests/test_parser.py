@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.params import build_flight_params
+from services.parser import parse
+from services.state import TravelState
+from services.travel import TravelAssistant
+
+
+def test_parse_extracts_every_field_once():
+    parsed = parse("De MEX a NYC el 2025-03-14 y 2025-03-18, ventana, presupuesto $900, Delta en business")
+    assert parsed.codes[:2] == ("MEX", "NYC")
+    assert parsed.iso_dates == ("2025-03-14", "2025-03-18")
+    assert parsed.seat_pref == "ventana"
+    assert parsed.budget == "900"
+    assert parsed.airline == "DL"
+    assert parsed.travel_class == "2"
+    assert parse(parsed.text) is parsed
+
+
+def test_keywords_match_accented_and_whole_words_only():
+    assert parse("Clase económica por favor").travel_class == "1"
+    assert parse("Vuelo en clase economía").travel_class == "1"
+    assert parse("Voy a Reunited Center").airline is None
+    assert parse("no compartir habitación").share_room is False
+    assert parse("puedo compartir habitación").share_room is True
+
+
+def test_state_and_params_read_the_same_parse():
+    parsed = parse("Vuelo de MEX a SFO del 2025-05-05 al 2025-05-09 con United")
+    state = TravelState()
+    TravelAssistant(None, None, None, None)._parse_message(state, parsed)
+    params = build_flight_params(parsed, api_key="demo")
+    assert (state.origin, state.destination) == (params["departure_id"], params["arrival_id"])
+    assert (state.start_date, state.end_date) == (params["outbound_date"], params["return_date"])
+    assert params["include_airlines"] == "UA"
+
+
+def test_codes_and_airports_are_validated():
+    assert parse("Que tal, voy a Lima").codes == ()
+    assert parse("VOY a MEX").codes == ("MEX",)
+    assert parse("Vuelo de Guadalajara a Madrid").airports == ("GDL", "MAD")
+    assert parse("un par de días en Monterrey").airports == ("MTY",)
+
+
+def test_single_place_names_do_not_fill_the_state():
+    state = TravelState()
+    TravelAssistant(None, None, None, None)._parse_message(state, parse("Voy a Madrid"))
+    assert (state.origin, state.destination) == (None, None)
+    TravelAssistant(None, None, None, None)._parse_message(state, parse("De Guadalajara a Madrid"))
+    assert (state.origin, state.destination) == ("GDL", "MAD")
@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pytest
+
+from services import registry
+
+
+def test_lazy_builds_once_on_first_use():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return "client"
+
+    lazy = registry.Lazy("test_once", factory)
+    assert not lazy.ready and not calls
+    assert lazy.upper() == "CLIENT"
+    assert lazy.get() is lazy.get()
+    assert len(calls) == 1
+    assert "test_once" in registry.timings()
+
+
+def test_failed_build_is_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("offline")
+        return "ok"
+
+    lazy = registry.Lazy("test_retry", factory)
+    with pytest.raises(ConnectionError):
+        lazy.get()
+    assert lazy.get() == "ok"
+
+
+def test_warmup_builds_registered_services_and_survives_errors():
+    ok = registry.register("test_warm_ok", lambda: "ready")
+
+    def broken():
+        raise RuntimeError("boom")
+
+    registry.register("test_warm_broken", broken)
+    registry.warmup(background=False)
+    assert ok.ready
+    assert "warmup_done" in registry.timings()
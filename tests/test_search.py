@@ -0,0 +1,151 @@
+import sys, os, asyncio, time
+from datetime import date, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.cache import MISSING
+from services.search import TripSearch
+from services.state import TravelState
+
+START = (date.today() + timedelta(days=30)).isoformat()
+END = (date.today() + timedelta(days=34)).isoformat()
+
+
+def _flight(price, airline="Aeromexico", stops=0, duration=600):
+    legs = [
+        {
+            "airline": airline,
+            "departure_airport": {"id": "MEX", "time": "2025-03-14 08:05"},
+            "arrival_airport": {"id": "MAD", "time": "2025-03-15 01:10"},
+        }
+    ] * (stops + 1)
+    return {"price": price, "flights": legs, "total_duration": duration}
+
+
+def _hotel(name, price, rating):
+    return {"name": name, "rate_per_night": {"extracted_lowest": price}, "overall_rating": rating}
+
+
+class FakeSerpApi:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def search_flight_params(self, params):
+        self.calls.append(("flights", params))
+        time.sleep(self.delay)
+        return [_flight(900), _flight(450, "Iberia", stops=1), _flight(450, "Aeromexico"), _flight(1500)]
+
+    def search_hotels(self, city, check_in, check_out):
+        self.calls.append(("hotels", city))
+        time.sleep(self.delay)
+        return [_hotel("Caro", 400, 4.9), _hotel("Bueno", 150, 4.6), _hotel("Sencillo", 90, 4.1)]
+
+    async def search_flight_params_async(self, params):
+        return self.search_flight_params(params)
+
+    async def search_hotels_async(self, city, check_in, check_out):
+        return self.search_hotels(city, check_in, check_out)
+
+
+def _state(**kwargs):
+    base = dict(origin="MEX", destination="MAD", start_date=START, end_date=END)
+    return TravelState(**{**base, **kwargs})
+
+
+def test_incomplete_or_invalid_state_is_not_searched():
+    serp = FakeSerpApi()
+    search = TripSearch(serp)
+    assert search.run(TravelState(origin="MEX", destination="MAD")) is None
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    for state in [
+        _state(origin="QUE", destination="TAL"),
+        _state(destination="MEX"),
+        _state(start_date=yesterday),
+        _state(start_date=END, end_date=START),
+        _state(end_date="pronto"),
+    ]:
+        assert not TripSearch.ready(state), state
+        assert search.run(state) is None
+    assert serp.calls == []
+
+
+def test_options_are_filtered_by_budget_and_ranked():
+    options = TripSearch(FakeSerpApi()).run(_state(budget="2000", flight_pref="business con Delta"))
+    assert [f["price"] for f in options.flights] == [450, 450, 900]
+    assert options.flights[0]["stops"] == 0
+    # Four nights next to the cheapest flight: only hotels up to 387.5 per night fit.
+    assert [h["name"] for h in options.hotels] == ["Bueno", "Sencillo"]
+    summary = options.summary()
+    assert "Aeromexico sale 08:05, llega 01:10, directo, 10h00, $450" in summary
+    assert "Bueno, $150, 4.6★" in summary
+
+
+def test_budget_covers_flight_and_hotel_together():
+    options = TripSearch(FakeSerpApi()).run(_state(budget="1000"))
+    # 1000 minus the cheapest stay (4 x 90) leaves 640 for the flight, and
+    # 1000 minus the cheapest flight (450) leaves 137.5 per night.
+    assert [f["price"] for f in options.flights] == [450, 450]
+    assert [h["name"] for h in options.hotels] == ["Sencillo"]
+    for flight in options.flights:
+        assert flight["price"] + min(h["price"] for h in options.hotels) * 4 <= 1000
+
+
+def test_flight_params_come_from_the_state_and_preferences():
+    serp = FakeSerpApi()
+    TripSearch(serp).run(_state(flight_pref="business con Delta"))
+    params = dict(serp.calls)["flights"]
+    assert params["departure_id"] == "MEX" and params["arrival_id"] == "MAD"
+    assert params["return_date"] == END
+    assert params["travel_class"] == "2" and params["include_airlines"] == "DL"
+    assert "api_key" not in params
+    assert dict(serp.calls)["hotels"] == "Madrid"
+
+
+def test_class_and_airline_from_the_conversation_reach_the_search():
+    from services.travel import TravelAssistant
+
+    assistant = TravelAssistant(None, None, None, None)
+    state = _state()
+    assistant._parse_message(state, "en business con Iberia")
+    assert state.flight_pref == "clase ejecutiva, Iberia"
+    serp = FakeSerpApi()
+    search = TripSearch(serp)
+    search.run(state)
+    params = dict(serp.calls)["flights"]
+    assert params["travel_class"] == "2" and params["include_airlines"] == "IB"
+
+    # A later change of class keeps the airline and is a new search.
+    assistant._parse_message(state, "mejor en primera")
+    assert state.flight_pref == "primera clase, Iberia"
+    serp.calls.clear()
+    search.run(state)
+    params = dict(serp.calls)["flights"]
+    assert params["travel_class"] == "3" and params["include_airlines"] == "IB"
+
+
+def test_results_are_cached_per_fingerprint():
+    serp = FakeSerpApi()
+    search = TripSearch(serp)
+    search.run(_state())
+    search.run(_state(reason="congreso"))
+    assert len(serp.calls) == 2
+    search.run(_state(budget="800"))
+    assert len(serp.calls) == 4
+
+
+def test_searches_run_in_parallel_within_the_deadline():
+    search = TripSearch(FakeSerpApi(delay=0.2))
+    start = time.perf_counter()
+    assert search.run(_state())
+    assert time.perf_counter() - start < 0.35
+
+    search = TripSearch(FakeSerpApi(delay=0.5), timeout=0.1)
+    options = search.run(_state())
+    assert not options
+    # A search that timed out is retried on the next turn.
+    assert search.cache.get(search.fingerprint(_state())) is MISSING
+
+
+def test_run_async():
+    options = asyncio.run(TripSearch(FakeSerpApi()).run_async(_state(budget="2000")))
+    assert len(options.flights) == 3 and len(options.hotels) == 2
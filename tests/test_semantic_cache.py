@@ -0,0 +1,85 @@
+import sys, os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.ai import ConversationalAI
+from services.intents import is_general_question
+from services.llm import ResilientLLM
+from services.semantic_cache import SemanticCache, fingerprint
+
+
+def test_exact_and_approximate_hits():
+    cache = SemanticCache()
+    cache.put("¿Puedo llevar maleta?", "Sí, carry-on incluido.")
+    assert fingerprint("puedo llevar una MALETA") == fingerprint("¿Puedo llevar maleta?")
+    assert cache.get("puedo llevar una maleta") == "Sí, carry-on incluido."
+    assert cache.get("¿Puedo llevar maletas?") == "Sí, carry-on incluido."
+    assert cache.get("¿Puedo llevar mascota?") is None
+    assert cache.get("¿Cuánto es el viático diario?") is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_ttl_and_size_eviction():
+    cache = SemanticCache(max_size=1, ttl=0)
+    cache.put("¿Puedo llevar maleta?", "Sí")
+    assert cache.get("¿Puedo llevar maleta?") is None
+    cache = SemanticCache(max_size=1)
+    cache.put("¿Puedo llevar maleta?", "Sí")
+    cache.put("¿Cuánto es el viático?", "Depende")
+    assert len(cache) == 1
+
+
+def test_general_question_filter():
+    assert is_general_question("¿Puedo llevar maleta?")
+    assert not is_general_question("¿y el hotel?")
+    assert not is_general_question("¿Puedo llevar maleta a Madrid?")
+    assert not is_general_question("¿Cuánto cuesta el vuelo del 2025-03-14?")
+    for question in ["¿cuál me recomiendas?", "¿cuál es más barato?", "¿a qué hora sale?",
+                     "¿puedo cambiar la fecha?", "¿Qué tal el clima?"]:
+        assert not is_general_question(question), question
+    assert is_general_question("¿Cuánto es el viático diario?")
+
+
+def test_negated_questions_never_match():
+    cache = SemanticCache()
+    cache.put("¿Puedo llevar maleta?", "Sí")
+    assert cache.get("¿No puedo llevar maleta?") is None
+
+
+class CountingBackend:
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, text, system_instruction, timeout):
+        self.calls += 1
+        return "Sí, carry-on incluido."
+
+
+def test_ai_reuses_cached_answers():
+    ai = ConversationalAI()
+    backend = CountingBackend()
+    ai.llm = ResilientLLM([backend])
+    ai.response_cache = SemanticCache()
+    for question in ["¿Puedo llevar maleta?", "puedo llevar maleta"]:
+        assert ai.process_message("U1", question, cache_key=question) == "Sí, carry-on incluido."
+    assert backend.calls == 1
+
+
+class BrokenStreamBackend:
+    name = "broken"
+
+    def stream(self, text, system_instruction, timeout):
+        yield "Sí, "
+        raise ConnectionError("connection reset")
+
+
+def test_truncated_stream_is_not_cached():
+    ai = ConversationalAI()
+    ai.llm = ResilientLLM([BrokenStreamBackend()], backoff=0)
+    ai.response_cache = SemanticCache()
+    question = "¿Puedo llevar maleta?"
+    assert list(ai.stream_message("U1", question, cache_key=question)) == ["Sí, "]
+    assert len(ai.response_cache) == 0
@@ -0,0 +1,38 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.sheets import UserDirectory
+
+
+def test_directory_indexes_header_variants():
+    rows = [
+        {"Slack ID": "T1-U1", "Nombre": "Ana"},
+        {"slack_id": "T1-U2", "Nombre": "Luis"},
+        {"slack id": "T1-U3", "Nombre": "Eva"},
+        {"Nombre": "Sin ID"},
+    ]
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return rows
+
+    directory = UserDirectory(loader)
+    assert directory.get("T1-U1")["Nombre"] == "Ana"
+    assert directory.get("T1-U2")["Nombre"] == "Luis"
+    assert directory.get("T1-U3")["Nombre"] == "Eva"
+    assert len(calls) == 1
+
+
+def test_directory_skips_reload_when_revision_unchanged():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return [{"Slack ID": "T1-U1"}]
+
+    directory = UserDirectory(loader, revision=lambda: "rev-1", ttl=0)
+    directory.refresh()
+    directory.refresh()
+    assert len(calls) == 1
+    assert directory.get("T1-U1") is not None
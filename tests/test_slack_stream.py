@@ -0,0 +1,106 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import time
+
+from slack_sdk.errors import SlackApiError
+
+from services.slack_stream import FINAL_ATTEMPTS, PLACEHOLDER, RateLimiter, SlackStreamer
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def chat_postMessage(self, **kwargs):
+        self.calls.append(("post", kwargs["text"]))
+        return {"ts": "1.0"}
+
+    def chat_update(self, **kwargs):
+        self.calls.append(("update", kwargs["text"]))
+        return {"ok": True}
+
+
+def test_updates_are_throttled_and_final_text_is_sent():
+    client = FakeClient()
+    streamer = SlackStreamer(client, "D1", None, interval=60)
+    assert streamer.start() == "1.0"
+    for text in ["a", "ab", "abc"]:
+        streamer.update(text)
+    assert streamer.finish("abcd") == "1.0"
+    assert client.calls == [("post", PLACEHOLDER), ("update", "abcd")]
+
+
+def test_updates_flow_when_interval_elapsed():
+    client = FakeClient()
+    streamer = SlackStreamer(client, "D1", None, interval=0)
+    streamer.start()
+    streamer.update("a")
+    streamer.update("ab")
+    streamer.finish("ab")
+    assert client.calls == [("post", PLACEHOLDER), ("update", "a"), ("update", "ab")]
+
+
+def test_streamers_share_the_rate_limit():
+    client = FakeClient()
+    limiter = RateLimiter(per_minute=60, burst=1)
+    first = SlackStreamer(client, "D1", None, interval=0, limiter=limiter)
+    second = SlackStreamer(client, "D2", None, interval=0, limiter=limiter)
+    first.start()
+    second.start()
+    first.update("a")
+    second.update("b")
+    assert client.calls.count(("update", "a")) == 1
+    assert ("update", "b") not in client.calls
+
+
+class RateLimitedClient(FakeClient):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def chat_update(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            response = type("Response", (), {"headers": {"Retry-After": "0.2"}, "__getitem__": lambda s, k: "ratelimited"})()
+            raise SlackApiError("ratelimited", response)
+        return super().chat_update(**kwargs)
+
+
+def test_final_text_waits_for_retry_after():
+    client = RateLimitedClient(failures=1)
+    limiter = RateLimiter(per_minute=6000, burst=5)
+    streamer = SlackStreamer(client, "D1", None, interval=0, limiter=limiter)
+    streamer.start()
+    start = time.monotonic()
+    streamer.finish("listo")
+    assert time.monotonic() - start >= 0.2
+    assert client.calls[-1] == ("update", "listo")
+    # Other streamers hold their intermediate edits during the pause.
+    limiter.pause(10)
+    assert not limiter.try_acquire()
+
+
+class BrokenUpdateClient(FakeClient):
+    def chat_postMessage(self, **kwargs):
+        super().chat_postMessage(**kwargs)
+        return {"ts": f"{len(self.calls)}.0"}
+
+    def chat_update(self, **kwargs):
+        raise SlackApiError("msg_too_long", {"error": "msg_too_long"})
+
+
+def test_final_text_is_posted_when_the_edit_fails():
+    client = BrokenUpdateClient()
+    streamer = SlackStreamer(client, "D1", "9.0", interval=0, limiter=RateLimiter(per_minute=6000))
+    assert streamer.start() == "1.0"
+    assert streamer.finish("respuesta completa") == "2.0"
+    assert client.calls == [("post", PLACEHOLDER), ("post", "respuesta completa")]
+
+
+def test_final_text_is_posted_after_the_rate_limit_attempts():
+    client = RateLimitedClient(failures=FINAL_ATTEMPTS)
+    streamer = SlackStreamer(client, "D1", None, interval=0, limiter=RateLimiter(per_minute=6000))
+    streamer.start()
+    streamer.finish("listo")
+    assert client.calls == [("post", PLACEHOLDER), ("post", "listo")]
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.state import SCHEMA_VERSION, TravelState
+
+
+def test_booleans_round_trip():
+    state = TravelState(share_room=False, passport=True)
+    restored = TravelState.from_dict(state.to_record())
+    assert restored.share_room is False
+    assert restored.passport is True
+    assert restored.version == SCHEMA_VERSION
+
+
+def test_older_records_are_coerced_and_unknown_keys_kept():
+    state = TravelState.from_dict({"origin": "MEX", "visa": "no", "budget": 900, "loyalty_tier": "gold"})
+    assert state.visa is False
+    assert state.budget == "900"
+    assert state.needs_full_write
+    assert state.to_record() == {
+        "loyalty_tier": "gold", "origin": "MEX", "budget": "900", "visa": False, "_v": SCHEMA_VERSION,
+    }
+
+
+def test_changes_track_assignments_since_load():
+    state = TravelState.from_dict({"origin": "MEX", "_v": SCHEMA_VERSION})
+    assert state.changes() == {}
+    state.origin = "MEX"
+    state.destination = "NYC"
+    state.share_room = False
+    assert state.changes() == {"destination": "NYC", "share_room": False}
+    state.mark_clean()
+    assert state.changes() == {}
+    assert not hasattr(state, "__dict__")
@@ -0,0 +1,18 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services import transport
+
+
+def test_session_is_shared_and_pooled():
+    session = transport.get_session()
+    assert transport.get_session() is session
+    adapter = session.get_adapter("https://serpapi.com/search.json")
+    assert adapter._pool_maxsize == transport.POOL_SIZE
+    assert 429 in adapter.max_retries.status_forcelist
+
+
+def test_timeout_override(monkeypatch):
+    assert transport.timeout_for("maps") == (3.05, 5.0)
+    monkeypatch.setenv("HTTP_TIMEOUT_MAPS", "2")
+    assert transport.timeout_for("maps") == (3.05, 2.0)
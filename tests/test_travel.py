@@ -1,4 +1,4 @@
-import sys, os, json
+import sys, os, json, time
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -61,3 +61,217 @@ def test_parse_message_extended():
     assert state.start_date == "2024-09-10"
     assert state.seat_pref == "ventana"
     assert state.budget == "500"
+
+
+class RecordingFirebaseService:
+    def __init__(self, data=None):
+        self.data = data
+        self.writes = []
+
+    def get_user_data(self, slack_id: str):
+        return self.data
+
+    def save_user_data(self, slack_id: str, data: dict):
+        self.writes.append(data)
+
+
+def test_handle_message_writes_once_per_turn():
+    fb = RecordingFirebaseService()
+    ta = TravelAssistant(DummySheetService(), fb, ConversationalAI(), SerpAPIService())
+    ta.handle_message("U123", "Quiero viajar de MEX a NYC")
+    assert len(fb.writes) == 1
+    assert set(fb.writes[0]) == {"state"}
+    assert fb.writes[0]["state"]["origin"] == "MEX"
+
+
+def test_current_state_writes_only_changed_fields():
+    fb = RecordingFirebaseService({"state": {"_v": 2, "origin": "MEX", "share_room": False}})
+    ta = TravelAssistant(DummySheetService(), fb, ConversationalAI(), SerpAPIService())
+    ta.handle_message("U123", "Voy a NYC")
+    assert fb.writes == [{("state", "destination"): "NYC"}]
+
+
+def test_user_data_batch_skips_unchanged_fields():
+    from services.firebase import UserDataBatch
+
+    fb = RecordingFirebaseService()
+    batch = UserDataBatch(fb, "U123", {"history": [], "state": {"origin": "MEX"}})
+    batch.update({"history": [], "state": {"origin": "MEX"}})
+    assert batch.commit() is False
+    batch.set("state", {"origin": "SFO"})
+    assert batch.commit() is True
+    assert fb.writes == [{"state": {"origin": "SFO"}}]
+
+
+class AsyncRecordingFirebaseService(RecordingFirebaseService):
+    async def get_user_data_async(self, slack_id: str):
+        return self.get_user_data(slack_id)
+
+    async def save_user_data_async(self, slack_id: str, data: dict):
+        self.save_user_data(slack_id, data)
+
+
+def test_handle_message_async():
+    import asyncio
+
+    fb = AsyncRecordingFirebaseService()
+    ta = TravelAssistant(DummySheetService(), fb, ConversationalAI(), SerpAPIService())
+    resp = asyncio.run(ta.handle_message_async("U123", "Quiero viajar de MEX a NYC"))
+    assert isinstance(resp, str)
+    assert len(fb.writes) == 1
+    assert fb.writes[0]["state"]["destination"] == "NYC"
+
+
+class StreamingAI:
+    def stream_message(self, user: str, text: str, system_instruction=None):
+        yield "Hola, "
+        yield "¿a dónde viajas?"
+
+
+def test_handle_message_streams_partials():
+    fb = RecordingFirebaseService()
+    ta = TravelAssistant(DummySheetService(), fb, StreamingAI(), SerpAPIService())
+    partials = []
+    resp = ta.handle_message("U123", "¿Qué hoteles me recomiendas?", on_partial=partials.append)
+    assert partials == ["Hola, ", "Hola, ¿a dónde viajas?"]
+    assert resp == "Hola, ¿a dónde viajas?"
+    assert ta.conversations.load("U123").messages()[-1] == {"bot": resp}
+
+
+class FailingAI:
+    def process_message(self, user: str, text: str, system_instruction=None):
+        raise AssertionError("Gemini should not be called")
+
+
+def test_fast_path_skips_gemini():
+    fb = RecordingFirebaseService({"history": [], "state": {"origin": "MEX"}})
+    ta = TravelAssistant(DummySheetService(), fb, FailingAI(), SerpAPIService())
+    resp = ta.handle_message("U123", "Voy a NYC")
+    assert resp == "Anotado: destino NYC. ¿Qué día sales? (por ejemplo 2025-03-14)"
+    assert fb.writes[0]["state"]["destination"] == "NYC"
+    assert ta.fast_path.counts["rules"] == 1
+
+
+class RecordingAI:
+    def __init__(self):
+        self.prompts = []
+
+    def process_message(self, user: str, text: str, system_instruction=None):
+        self.prompts.append(text)
+        return f"respuesta {len(self.prompts)}"
+
+
+def test_history_is_scoped_to_the_thread():
+    ai = RecordingAI()
+    ta = TravelAssistant(DummySheetService(), RecordingFirebaseService(), ai, SerpAPIService())
+    ta.handle_message("U123", "¿Qué hoteles hay en Lima?", thread_ts="1.0")
+    ta.handle_message("U123", "¿Y restaurantes cerca?", thread_ts="2.0")
+    ta.handle_message("U123", "¿Cuál es el más barato?", thread_ts="1.0")
+    assert "Lima" not in ai.prompts[1]
+    assert "Usuario: ¿Qué hoteles hay en Lima?\nBot: respuesta 1" in ai.prompts[2]
+    assert "restaurantes" not in ai.prompts[2]
+
+
+def test_build_prompt_trims_history_to_budget():
+    ta = TravelAssistant(DummySheetService(), DummyFirebaseService(), ConversationalAI(), SerpAPIService())
+    history = [{"user": f"mensaje antiguo {i}"} for i in range(50)] + [{"bot": "respuesta reciente"}]
+    ta.prompt_token_budget = 100
+    prompt = ta.build_prompt({}, TravelState(origin="MEX"), history, "Hola")
+    assert "origin: MEX" in prompt
+    assert "Bot: respuesta reciente" in prompt
+    assert "mensaje antiguo 0" not in prompt
+    assert prompt.endswith("Usuario: Hola\nBot:")
+    assert prompt.count("Usuario: Hola") == 1
+
+
+class SlowFirebaseService(RecordingFirebaseService):
+    def get_user_data(self, slack_id: str):
+        time.sleep(0.2)
+        return self.data
+
+
+class SlowSheetService:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def get_user(self, slack_id: str):
+        time.sleep(self.delay)
+        return {"Nombre": "Ana"}
+
+
+def test_prefetch_overlaps_lookups_and_skips_late_optional_ones():
+    ta = TravelAssistant(SlowSheetService(0.2), SlowFirebaseService(), RecordingAI(), SerpAPIService())
+    start = time.perf_counter()
+    fetched = ta._prefetch("U123", "Hola", None)
+    assert time.perf_counter() - start < 0.35
+    assert fetched.user_data["Nombre"] == "Ana"
+
+    ta = TravelAssistant(SlowSheetService(1.0), SlowFirebaseService(), RecordingAI(), SerpAPIService())
+    ta.prefetch_timeout = 0.3
+    fetched = ta._prefetch("U123", "Hola", None)
+    assert "Nombre" not in fetched.user_data
+
+
+def test_city_names_fill_origin_and_destination():
+    fb = RecordingFirebaseService()
+    ta = TravelAssistant(DummySheetService(), fb, RecordingAI(), SerpAPIService())
+    ta.handle_message("U123", "Quiero viajar de Guadalajara a Madrid")
+    assert fb.writes[0]["state"]["origin"] == "GDL"
+    assert fb.writes[0]["state"]["destination"] == "MAD"
+
+
+class OptionsSerpApi:
+    def search_flight_params(self, params):
+        return [{"price": 450, "flights": [{"airline": "Iberia"}]}]
+
+    def search_hotels(self, city, check_in, check_out):
+        return [{"name": "Hotel Centro", "rate_per_night": {"extracted_lowest": 120}}]
+
+
+def test_trip_options_are_added_to_the_prompt():
+    from datetime import date, timedelta
+
+    start, end = date.today() + timedelta(days=30), date.today() + timedelta(days=34)
+    state = {"origin": "MEX", "destination": "MAD", "start_date": start.isoformat(), "end_date": end.isoformat(),
+             "venue": "IFEMA", "reason": "congreso", "budget": "1000"}
+    ai = RecordingAI()
+    ta = TravelAssistant(DummySheetService(), RecordingFirebaseService({"state": state}), ai, OptionsSerpApi())
+    ta.handle_message("U123", "¿Cuál me recomiendas?")
+    assert "Opciones dentro del presupuesto (vuelo y hotel juntos):" in ai.prompts[-1]
+    assert "Iberia" in ai.prompts[-1] and "Hotel Centro, $120" in ai.prompts[-1]
+
+
+def test_common_words_are_not_taken_for_airports():
+    for text in ["Voy a Madrid", "Que tal, voy a Lima", "Quiero ir a Cancun con mi equipo"]:
+        fb = RecordingFirebaseService()
+        ai = RecordingAI()
+        ta = TravelAssistant(DummySheetService(), fb, ai, SerpAPIService())
+        resp = ta.handle_message("U123", text)
+        assert not resp.startswith("Anotado"), text
+        assert len(ai.prompts) == 1
+        state = fb.writes[0]["state"] if fb.writes else {}
+        assert "origin" not in state and "destination" not in state, text
+
+
+def test_follow_up_questions_are_not_shared_through_the_cache():
+    from services.semantic_cache import SemanticCache
+
+    ai = RecordingAI()
+    ai.response_cache = SemanticCache()
+    ta = TravelAssistant(DummySheetService(), RecordingFirebaseService(), ai, SerpAPIService())
+    turn = ta._prepare_turn(ta._prefetch("U123", "¿Puedo llevar maleta?", "1.0"), "¿Puedo llevar maleta?")
+    assert turn.cache_key == "¿Puedo llevar maleta?"
+    ta.handle_message("U123", "Necesito viajar la próxima semana por trabajo", thread_ts="1.0")
+    turn = ta._prepare_turn(ta._prefetch("U123", "¿Puedo llevar maleta?", "1.0"), "¿Puedo llevar maleta?")
+    assert turn.cache_key is None
+
+
+def test_prefetch_never_looks_up_cities_over_the_network(monkeypatch):
+    import services.params as params
+
+    looked_up = []
+    monkeypatch.setattr(params, "_lookup_cities", lambda names, api_key: looked_up.extend(names) or {})
+    monkeypatch.setenv("SERPAPI_KEY", "secret")
+    ta = TravelAssistant(DummySheetService(), RecordingFirebaseService(), RecordingAI(), SerpAPIService())
+    assert ta._prefetch("U123", "hola, para el evento de Pepsico", None).flight_params is not None
+    assert looked_up == []
@@ -0,0 +1,101 @@
+"""Consumer pool for the durable Slack job queue.
+
+Run next to the web tier with ``JOB_QUEUE=sqlite`` on both::
+
+    python worker.py --processes 2 --threads 4
+
+Each process imports the app once and runs ``--threads`` consumer loops
+that lease a job, answer it with ``app.process_event`` and mark it done, or
+hand it back for a retry with backoff. SIGTERM/SIGINT finish the jobs in
+progress before exiting; jobs interrupted harder are redelivered once
+their lease expires. A reply generated before a failure is stored on the
+job, so the retry only posts it.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+PURGE_AFTER = float(os.environ.get("JOB_RETENTION", "86400"))
+
+
+def consume(queue, handler: Callable[[dict], None], stop: threading.Event, poll_interval: float) -> None:
+    """Lease and run jobs with ``handler`` until ``stop`` is set."""
+    while not stop.is_set():
+        job = queue.lease()
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        try:
+            handler(job.payload)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            queue.fail(job, f"{type(e).__name__}: {e}")
+        else:
+            queue.complete(job)
+
+
+def run_process(threads: int, poll_interval: float) -> None:
+    os.environ.setdefault("JOB_QUEUE", "sqlite")
+    import app
+
+    if app.job_queue is None:
+        raise SystemExit("JOB_QUEUE must be set to 'sqlite' for the consumer")
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    workers = [
+        threading.Thread(
+            target=consume, args=(app.job_queue, app.process_event, stop, poll_interval), name=f"job-consumer-{i}"
+        )
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    last_purge = 0.0
+    while not stop.wait(1.0):
+        if time.monotonic() - last_purge > 3600:
+            app.job_queue.purge(PURGE_AFTER)
+            last_purge = time.monotonic()
+    for worker in workers:
+        worker.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Consume queued Slack events.")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("WORKER_PROCESSES", "1")))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WORKER_THREADS", "8")))
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_process(args.threads, args.poll_interval)
+        return
+    procs = [
+        multiprocessing.Process(target=run_process, args=(args.threads, args.poll_interval), name=f"consumer-{i}")
+        for i in range(args.processes)
+    ]
+    for proc in procs:
+        proc.start()
+
+    def forward(signum, _frame):
+        for proc in procs:
+            if proc.is_alive():
+                os.kill(proc.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for proc in procs:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()